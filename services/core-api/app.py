@@ -1,23 +1,89 @@
-from core_api.api import api_router
+import os
+
+from core_api.api import (
+    api_router,
+    enforcer,
+    health_router,
+    jobs,
+    metrics_router,
+    reconciler,
+    sampler,
+    shared_stats,
+)
+from core_api.config import Config
+from core_api.files import FileLock
+from core_api.wireguard.shared import Leadership
 from fastapi import FastAPI
+from core_api.storages.connector import Table
 from core_api.storages.tokens import Tokens
 from core_api.auth import new_token
 from loguru import logger
 
 
+def init_storage():
+    logger.info(f"Opening database {Table.storage.db_path}")
+    if not Table.create_tables():
+        logger.info("Database schema is up to date")
+
+
 def init_tokens():
     logger.info("Checking for tokens")
-    if not Tokens.get_count():
-        logger.info("No tokens found, creating a new one")
-        logger.info(f"New token: {new_token()}")
-    else:
-        logger.info("Tokens found")
+    # Workers start together, only the first one creates a token
+    with FileLock(os.path.join(Config.Wireguard.LOCK_DIR, "tokens.lock")):
+        if not Tokens.get_count():
+            logger.info("No tokens found, creating a new one")
+            logger.info(f"New token: {new_token()}")
+        else:
+            logger.info("Tokens found")
+
+
+def start_background_tasks():
+    reconciler.start()
+    sampler.start()
+    enforcer.start()
+
+
+# Only one worker process runs the background tasks
+leadership = Leadership(start_background_tasks, shared_stats)
+
+
+def start_leadership():
+    leadership.start()
+
+
+def stop_leadership():
+    leadership.stop()
+
+
+def stop_reconciler():
+    reconciler.stop()
+
+
+def stop_sampler():
+    sampler.stop()
+
+
+def stop_enforcer():
+    enforcer.stop()
+
+
+def stop_jobs():
+    jobs.stop()
 
 
 app = FastAPI(
-    on_startup=[init_tokens],
+    on_startup=[init_storage, init_tokens, start_leadership],
+    on_shutdown=[
+        stop_leadership,
+        stop_reconciler,
+        stop_sampler,
+        stop_enforcer,
+        stop_jobs,
+    ],
 )
 app.include_router(api_router)
+app.include_router(health_router)
+app.include_router(metrics_router)
 
 
 if __name__ == "__main__":
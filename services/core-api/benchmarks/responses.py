@@ -0,0 +1,65 @@
+"""Serialization of large peer listings, FastAPI's default path vs ModelResponse.
+
+Run with: python services/core-api/benchmarks/responses.py [peers] [rounds]
+"""
+
+import os
+import sys
+from ipaddress import IPv4Address, IPv4Network, IPv6Network
+from time import perf_counter
+
+# core_api is imported from the service directory, wherever this is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from core_api.responses import ModelResponse  # noqa: E402
+from core_api.storages import Peer  # noqa: E402
+
+
+def peers(count: int) -> list[Peer]:
+    return [
+        Peer(
+            id=i,
+            interface_id=1,
+            name=f"peer-{i}",
+            public_key=f"{i:043d}=",
+            private_key=f"{i:042d}p=",
+            preshared_key=f"{i:042d}s=",
+            address=IPv4Address("10.0.0.0") + i,
+            allowed_ips=[IPv4Network(IPv4Address("10.0.0.0") + i)],
+            remote_allowed_ips=[IPv4Network("0.0.0.0/0"), IPv6Network("::/0")],
+            remote_dns="1.1.1.1",
+            remote_persistent_keepalive=25,
+            group_name="default",
+        )
+        for i in range(count)
+    ]
+
+
+def main(count: int = 5000, rounds: int = 20) -> None:
+    listing = peers(count)
+    app = FastAPI()
+
+    @app.get("/default", response_model=list[Peer])
+    async def default() -> list[Peer]:
+        return listing
+
+    @app.get("/model", response_model=list[Peer])
+    async def model() -> ModelResponse:
+        return ModelResponse(listing, list[Peer])
+
+    client = TestClient(app)
+    assert client.get("/default").json() == client.get("/model").json()
+
+    for path in ("/default", "/model"):
+        started = perf_counter()
+        for _ in range(rounds):
+            client.get(path)
+        took = (perf_counter() - started) / rounds
+        print(f"{path:<10} {count} peers {took * 1000:8.2f} ms per request")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
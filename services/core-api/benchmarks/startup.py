@@ -0,0 +1,81 @@
+"""Cold start: importing the app, and setting up the database schema.
+
+The schema is set up on an empty database with a commit per table, as it
+was done on import, and with `Table.create_tables`, first on an empty
+database and then on one whose schema version is current.
+
+Run with: python services/core-api/benchmarks/startup.py [rounds]
+"""
+
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+# core_api is imported from the service directory, wherever this is run from
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+from loguru import logger  # noqa: E402
+
+from core_api.storages import Peers  # noqa: E402, F401, registers the tables
+from core_api.storages.connector import Storage, Table  # noqa: E402
+
+IMPORT = (
+    "import os, time; started = time.perf_counter(); import app;"
+    " print(time.perf_counter() - started, os.path.exists('wg.db'))"
+)
+
+
+def import_app() -> tuple[float, bool]:
+    with TemporaryDirectory() as directory:
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT],
+            cwd=directory,
+            env={**os.environ, "PYTHONPATH": SERVICE_DIR},
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.split()
+    return float(output[-2]), output[-1] == "True"
+
+
+def per_table_commits() -> None:
+    for table in Table._tables.values():
+        table._create_table()
+        table.storage.commit()
+
+
+def timed(setup, fresh: bool, rounds: int) -> float:
+    total = 0.0
+    for _ in range(rounds):
+        with TemporaryDirectory() as directory:
+            storage = object.__new__(Storage)
+            storage.__init__(os.path.join(directory, "wg.db"))
+            Table.storage = storage
+            if not fresh:
+                Table.create_tables()
+            started = perf_counter()
+            setup()
+            total += perf_counter() - started
+            storage.conn.close()
+    return total / rounds * 1000
+
+
+def main(rounds: int = 20) -> None:
+    logger.remove()
+    imports = [import_app() for _ in range(5)]
+    print(
+        f"import app: {min(seconds for seconds, _ in imports) * 1000:.0f} ms,"
+        f" database opened: {any(opened for _, opened in imports)}"
+    )
+    print(f"commit per table:        {timed(per_table_commits, True, rounds):.2f} ms")
+    print(f"one transaction:         {timed(Table.create_tables, True, rounds):.2f} ms")
+    print(
+        f"schema version current:  {timed(Table.create_tables, False, rounds):.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -1,8 +1,51 @@
-from typing import Annotated
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse, PlainTextResponse
-from .wireguard.wireguard import Wireguard, Interface, Peer
+import asyncio
+import zlib
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from time import time
+from typing import Annotated, Any, AsyncIterator, Callable, Iterator, Literal, TypeVar
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from loguru import logger
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from .cluster import LOCAL_NODE, NodeStatus
+from .config import Config
+from .wireguard.wireguard import (
+    ApplyResult,
+    FleetStats,
+    Wireguard,
+    Interface,
+    Peer,
+    RotationManifest,
+)
+from .wireguard.reconciler import Reconciler
+from .wireguard.events import EventBus, Subscription
+from .wireguard.sampler import StatsSampler
+from .wireguard.shared import SharedStats
+from .wireguard.snapshot import StatsDelta
+from .wireguard.accounting import AccountingReport
+from .wireguard.enforcer import PeerEnforcer
+from .wireguard.jobs import Job, JobQueue
+from .wireguard.transfer import (
+    EXPORT_EXCLUDE,
+    ChunkReport,
+    ImportResult,
+    PeerImporter,
+    iter_line_chunks,
+)
+from .storages import GroupQuotas
+from .storages.connector import Table
 from .pihole.connector import PiHole
+from .idempotency import IdempotencyCache, IdempotencyKey
+from .limits import ApplyGate, RateLimiter
+from .responses import NDJSON, ModelResponse, NDJSONResponse, accepts, wants_ndjson
 from pydantic import BaseModel, Field
 from .auth import new_token, renew_token, remove_token, check_token
 from ipaddress import IPv4Address, IPv4Network, IPv4Interface, IPv6Network
@@ -15,6 +58,9 @@ class CreatePeer(BaseModel):
     dns: str | None = None
     persistent_keepalive: int | None = None
     allowed_ips: list[IPv4Network | IPv6Network] | None = None
+    group: str | None = None
+    expires_at: int | None = Field(None, description="Unix time")
+    quota: int | None = Field(None, ge=0, description="Monthly rx + tx bytes")
 
 
 class CreateInterface(BaseModel):
@@ -31,6 +77,8 @@ class CreateInterface(BaseModel):
 
     default_persistent_keepalive: int = 25
 
+    node: str = LOCAL_NODE
+
 
 class UpdateInterface(BaseModel):
     name: str | None = None
@@ -45,18 +93,137 @@ class UpdateInterface(BaseModel):
     default_persistent_keepalive: int | None = None
 
 
+class BulkApply(BaseModel):
+    interface_ids: list[int] | None = None
+
+
+class OnlinePeer(BaseModel):
+    public_key: str
+    latest_handshake: int
+
+
 class PatchPeer(BaseModel):
-    name: str | None
-    dns: str | None
+    name: str | None = None
+    dns: str | None = None
     persistent_keepalive: int | None = None
     allowed_ips: list[IPv4Network | IPv6Network] | None = None
+    group: str | None = None
+    enabled: bool | None = None
+    expires_at: int | None = Field(None, description="Unix time")
+    quota: int | None = Field(None, ge=0, description="Monthly rx + tx bytes")
+
+
+class RotateKeys(BaseModel):
+    peer_ids: list[int] | None = None
+    group: str | None = None
+    keypairs: bool = Field(False, description="Replace peer keypairs as well")
+
+
+class BatchCreatePeer(BaseModel):
+    op: Literal["create_peer"]
+    interface_id: int
+    peer: CreatePeer
+
+
+class BatchUpdatePeer(BaseModel):
+    op: Literal["update_peer"]
+    peer_id: int
+    peer: PatchPeer
+
+
+class BatchDeletePeer(BaseModel):
+    op: Literal["delete_peer"]
+    peer_id: int
+
+
+class BatchUpdateInterface(BaseModel):
+    op: Literal["update_interface"]
+    interface_id: int
+    interface: UpdateInterface
+
+
+class BatchDeleteInterface(BaseModel):
+    op: Literal["delete_interface"]
+    interface_id: int
+
+
+class BatchAddDNSRewrite(BaseModel):
+    op: Literal["add_dns_rewrite"]
+    domain: str
+    ip: IPv4Address
+
+
+class BatchRemoveDNSRewrite(BaseModel):
+    op: Literal["remove_dns_rewrite"]
+    domain: str
+
+
+BatchOperation = Annotated[
+    BatchCreatePeer
+    | BatchUpdatePeer
+    | BatchDeletePeer
+    | BatchUpdateInterface
+    | BatchDeleteInterface
+    | BatchAddDNSRewrite
+    | BatchRemoveDNSRewrite,
+    Field(discriminator="op"),
+]
+
+
+class Batch(BaseModel):
+    operations: list[BatchOperation]
+
+
+class BatchResult(BaseModel):
+    # Created or updated peer or interface of each operation
+    results: list[Peer | Interface | None]
+    applied: list[ApplyResult]
+
+
+class SetQuota(BaseModel):
+    quota: int = Field(ge=0, description="Monthly rx + tx bytes")
+
+
+class Accepted(BaseModel):
+    jobs: list[Job]
+    result: Peer | Interface | None = None
 
 
 wg = Wireguard()
 ph = PiHole()
+reconciler = Reconciler(wg)
+bus = EventBus()
+sampler = StatsSampler(wg, bus)
+enforcer = PeerEnforcer(wg, sampler.accounting)
+shared_stats = SharedStats(sampler, reconciler)
+jobs = JobQueue(wg)
+idempotency = IdempotencyCache()
+reads = RateLimiter(Config.Limits.READ_RATE, Config.Limits.READ_BURST)
+mutations = RateLimiter(Config.Limits.MUTATION_RATE, Config.Limits.MUTATION_BURST)
+applies = ApplyGate()
+
+SSE_KEEPALIVE = 15
+# Listings that stream one model per line with `Accept: application/x-ndjson`
+NDJSON_RESPONSES = {200: {"content": {NDJSON: {}}}}
+# Mutations that queue their applies as jobs with `Prefer: respond-async`
+ASYNC_RESPONSES = {202: {"model": Accepted}}
+
+T = TypeVar("T")
+
+
+async def rateLimit(
+    request: Request, token: Annotated[str | None, Depends(check_token)]
+) -> None:
+    """Budget of the token, separate for reads and for mutations."""
+    client = token or (request.client.host if request.client else "")
+    limiter = reads if request.method in ("GET", "HEAD") else mutations
+    limiter.check(client)
+
 
 api_router = APIRouter(
-    tags=["Wireguard"], prefix="/api", dependencies=[Depends(check_token)]
+    tags=["Wireguard"],
+    prefix="/api",
+    dependencies=[Depends(check_token), Depends(rateLimit)],
 )
 
 interfaces_router = APIRouter(
@@ -80,24 +247,158 @@ async def peerDep(peer_id: int) -> Peer:
     return peer
 
 
+def prefersAsync(request: Request) -> bool:
+    return any(
+        preference.partition("=")[0].strip().lower() == "respond-async"
+        for preference in request.headers.get("prefer", "").replace(";", ",").split(",")
+    )
+
+
+def queueApplies(mutation: Callable[..., T], *args: Any) -> tuple[T, list[Job]]:
+    with wg.deferred_applies(apply=False) as deferred:
+        result = mutation(*args)
+    return result, [
+        jobs.submit(interface, interface.id in deferred.sync)
+        for interface in deferred.interfaces.values()
+    ]
+
+
+async def mutate(
+    request: Request, mutation: Callable[..., T], *args: Any
+) -> tuple[T, list[Job] | None]:
+    """Run a mutation in the threadpool, with its applies."""
+    if not prefersAsync(request):
+        return await run_in_threadpool(mutation, *args), None
+    return await run_in_threadpool(queueApplies, mutation, *args)
+
+
+@contextmanager
+def heldSlot(request: Request) -> Iterator[None]:
+    """Hold one of the apply slots while the request applies interfaces."""
+    if prefersAsync(request):
+        yield
+        return
+    applies.enter()
+    try:
+        yield
+    finally:
+        applies.exit()
+
+
+async def applySlot(request: Request) -> AsyncIterator[None]:
+    with heldSlot(request):
+        yield
+
+
+def accepted(
+    queued: list[Job], result: Peer | Interface | None = None
+) -> ModelResponse:
+    headers = {"Preference-Applied": "respond-async"}
+    if queued:
+        headers["Location"] = f"{api_router.prefix}/jobs/{queued[0].id}"
+    return ModelResponse(
+        Accepted(jobs=queued, result=result), status_code=202, headers=headers
+    )
+
+
 @interfaces_router.get("/", response_model=list[Interface])
-async def read_interfaces():
-    return [interface for interface in wg.interfaces]
+async def read_interfaces() -> ModelResponse:
+    return ModelResponse(wg.interfaces, list[Interface])
+
 
+@interfaces_router.get("/online", response_model=dict[int, int])
+async def read_online_counts(
+    within: Annotated[int, Query(ge=0)] = Config.Stats.ONLINE_WINDOW
+) -> dict[int, int]:
+    """Number of peers per interface with a handshake in the last `within` seconds."""
+    return sampler.presence.counts(int(time()) - within)
+
+
+@interfaces_router.get("/{interface_id}/peers/online", response_model=list[OnlinePeer])
+async def read_online_peers(
+    interface: Annotated[Interface, Depends(interfaceDep)],
+    within: Annotated[int, Query(ge=0)] = Config.Stats.ONLINE_WINDOW,
+) -> ModelResponse:
+    """Peers with a handshake in the last `within` seconds, most recent first."""
+    return ModelResponse(
+        [
+            OnlinePeer(public_key=public_key, latest_handshake=latest_handshake)
+            for public_key, latest_handshake in sampler.presence.online(
+                interface.id, int(time()) - within
+            )
+        ],
+        list[OnlinePeer],
+    )
 
+
+# Replays of idempotent creates do not wait for an apply slot
 @interfaces_router.put("/", response_model=Interface)
-async def create_interface(model: CreateInterface) -> Interface:
-    return wg.create_interface(
-        name=model.name,
-        local_ip=model.local_ip,
-        public_hostname=model.public_hostname,
-        port=model.port,
-        default_dns=model.default_dns,
-        default_allowed_ips=model.default_allowed_ips,
-        default_persistent_keepalive=model.default_persistent_keepalive,
+async def create_interface(
+    request: Request,
+    model: CreateInterface,
+    token: Annotated[str, Depends(check_token)],
+    idempotency_key: IdempotencyKey = None,
+) -> Response:
+    if model.node not in wg.cluster.nodes:
+        raise HTTPException(status_code=404, detail=f"Node {model.node} not found")
+    return await idempotency.run(
+        request, idempotency_key, partial(createdInterface, request, model), token
     )
 
 
+async def createdInterface(request: Request, model: CreateInterface) -> ModelResponse:
+    with heldSlot(request):
+        created = await run_in_threadpool(
+            partial(
+                wg.create_interface,
+                name=model.name,
+                local_ip=model.local_ip,
+                public_hostname=model.public_hostname,
+                port=model.port,
+                default_dns=model.default_dns,
+                default_allowed_ips=model.default_allowed_ips,
+                default_persistent_keepalive=model.default_persistent_keepalive,
+                node=model.node,
+            )
+        )
+    return ModelResponse(created)
+
+
+def bulkInterfaces(model: BulkApply | None) -> list[Interface] | None:
+    if not model or model.interface_ids is None:
+        return None
+    interfaces = []
+    for interface_id in model.interface_ids:
+        interface = wg.get_interface(interface_id)
+        if not interface:
+            raise HTTPException(
+                status_code=404, detail=f"Interface {interface_id} not found"
+            )
+        interfaces.append(interface)
+    return interfaces
+
+
+@interfaces_router.post(
+    "/sync", response_model=list[ApplyResult], dependencies=[Depends(applySlot)]
+)
+async def sync_interfaces(model: BulkApply | None = None) -> list[ApplyResult]:
+    return await run_in_threadpool(wg.sync_all, bulkInterfaces(model))
+
+
+@interfaces_router.post(
+    "/up", response_model=list[ApplyResult], dependencies=[Depends(applySlot)]
+)
+async def up_interfaces(model: BulkApply | None = None) -> list[ApplyResult]:
+    return await run_in_threadpool(wg.up_all, bulkInterfaces(model))
+
+
+@interfaces_router.post(
+    "/down", response_model=list[ApplyResult], dependencies=[Depends(applySlot)]
+)
+async def down_interfaces(model: BulkApply | None = None) -> list[ApplyResult]:
+    return await run_in_threadpool(wg.down_all, bulkInterfaces(model))
+
+
 @interfaces_router.get("/{interface_id}", response_model=Interface)
 async def read_interface(
     interface: Interface = Depends(interfaceDep),
@@ -105,19 +406,36 @@ async def read_interface(
     return interface
 
 
-@interfaces_router.delete("/{interface_id}")
+@interfaces_router.delete(
+    "/{interface_id}", responses=ASYNC_RESPONSES, dependencies=[Depends(applySlot)]
+)
 async def delete_interface(
-    interface: Annotated[Interface, Depends(interfaceDep)]
-) -> JSONResponse:
-    wg.delete_interface(interface)
+    request: Request, interface: Annotated[Interface, Depends(interfaceDep)]
+) -> Response:
+    _, queued = await mutate(request, wg.delete_interface, interface)
+    if queued is not None:
+        return accepted(queued)
     return JSONResponse({"message": "Interface deleted"})
 
 
-@interfaces_router.patch("/{interface_id}")
+@interfaces_router.patch(
+    "/{interface_id}",
+    response_model=Interface,
+    responses=ASYNC_RESPONSES,
+    dependencies=[Depends(applySlot)],
+)
 async def update_interface(
-    interface: Annotated[Interface, Depends(interfaceDep)], model: UpdateInterface
-) -> Interface:
-    updated = Interface(
+    request: Request,
+    interface: Annotated[Interface, Depends(interfaceDep)],
+    model: UpdateInterface,
+) -> Interface | ModelResponse:
+    updated = updatedInterface(interface, model)
+    _, queued = await mutate(request, wg.update_interface, updated)
+    return updated if queued is None else accepted(queued, updated)
+
+
+def updatedInterface(interface: Interface, model: UpdateInterface) -> Interface:
+    return Interface(
         id=interface.id,
         name=model.name if model.name else interface.name,
         local_ip=interface.local_ip,
@@ -145,56 +463,158 @@ async def update_interface(
             else interface.default_persistent_keepalive
         ),
         enabled=interface.enabled,
+        node=interface.node,
     )
 
-    wg.update_interface(updated)
-    return updated
-
 
-@interfaces_router.post("/{interface_id}/up")
+@interfaces_router.post(
+    "/{interface_id}/up", responses=ASYNC_RESPONSES, dependencies=[Depends(applySlot)]
+)
 async def up_interface(
-    interface: Annotated[Interface, Depends(interfaceDep)]
-) -> JSONResponse:
-    wg.up_interface(interface)
+    request: Request, interface: Annotated[Interface, Depends(interfaceDep)]
+) -> Response:
+    _, queued = await mutate(request, wg.up_interface, interface)
+    if queued is not None:
+        return accepted(queued, interface)
     return JSONResponse({"message": "Interface is up"})
 
 
-@interfaces_router.post("/{interface_id}/down")
+@interfaces_router.post(
+    "/{interface_id}/down", responses=ASYNC_RESPONSES, dependencies=[Depends(applySlot)]
+)
 async def down_interface(
-    interface: Annotated[Interface, Depends(interfaceDep)]
-) -> JSONResponse:
-    wg.down_interface(interface)
+    request: Request, interface: Annotated[Interface, Depends(interfaceDep)]
+) -> Response:
+    _, queued = await mutate(request, wg.down_interface, interface)
+    if queued is not None:
+        return accepted(queued, interface)
     return JSONResponse({"message": "Interface is down"})
 
 
-@interfaces_router.get("/{interface_id}/peers", response_model=list[Peer])
+@interfaces_router.get(
+    "/{interface_id}/peers", response_model=list[Peer], responses=NDJSON_RESPONSES
+)
 async def read_peers(
+    request: Request,
     interface: Annotated[Interface, Depends(interfaceDep)],
     fill_defaults: bool = True,
     fill_stats: bool = True,
-) -> list[Peer]:
+) -> ModelResponse | NDJSONResponse:
+    if wants_ndjson(request):
+        return NDJSONResponse(
+            wg.iter_peer_pages([interface], fill_defaults, fill_stats),
+            Peer,
+            gzip=accepts(request, "accept-encoding", "gzip"),
+        )
     result = wg.get_peers(interface)
     result = wg.fill_peers_defaults(result) if fill_defaults else result
     result = wg.fill_peers_stats(result) if fill_stats else result
-    return result
+    return ModelResponse(result, list[Peer])
+
+
+@interfaces_router.get("/{interface_id}/peers:export", responses=NDJSON_RESPONSES)
+async def export_peers(
+    request: Request, interface: Annotated[Interface, Depends(interfaceDep)]
+) -> NDJSONResponse:
+    """Peers of the interface with their keys, one import record per line."""
+    return NDJSONResponse(
+        wg.iter_peer_pages([interface], fill_defaults=False, fill_stats=False),
+        Peer,
+        gzip=accepts(request, "accept-encoding", "gzip"),
+        exclude=EXPORT_EXCLUDE,
+    )
+
+
+@interfaces_router.post("/{interface_id}/peers:import", responses=NDJSON_RESPONSES)
+async def import_peers(
+    request: Request, interface: Annotated[Interface, Depends(interfaceDep)]
+) -> NDJSONResponse:
+    """Import gzipped NDJSON peer records, with a report per committed chunk."""
+    # Held until the response is sent, the import runs while it streams
+    applies.enter()
+    return NDJSONResponse(
+        importReports(request, PeerImporter(wg, interface)),
+        ChunkReport | ImportResult,
+        reads_request=True,
+        background=BackgroundTask(applies.exit),
+    )
 
 
-@interfaces_router.put("/{interface_id}/peers", response_model=Peer)
+async def importReports(
+    request: Request, importer: PeerImporter
+) -> AsyncIterator[list[ChunkReport | ImportResult]]:
+    try:
+        async for lines in iter_line_chunks(
+            request.stream(), gzip=request.headers.get("content-encoding") == "gzip"
+        ):
+            yield [await run_in_threadpool(importer.import_chunk, lines)]
+    except (ValueError, zlib.error) as error:
+        yield [importer.stop(str(error))]
+    except ClientDisconnect:
+        logger.warning(f"Client left the import into {importer.interface.name}")
+    result = await run_in_threadpool(importer.finish)
+    yield [result]
+
+
+@interfaces_router.put(
+    "/{interface_id}/peers",
+    response_model=Peer,
+    responses=ASYNC_RESPONSES,
+)
 async def create_peer(
-    interface: Annotated[Interface, Depends(interfaceDep)], peer: CreatePeer
-):
-    if wg.get_peer_by_address(interface, peer.address):
+    request: Request,
+    interface: Annotated[Interface, Depends(interfaceDep)],
+    peer: CreatePeer,
+    token: Annotated[str, Depends(check_token)],
+    idempotency_key: IdempotencyKey = None,
+) -> Response:
+    return await idempotency.run(
+        request,
+        idempotency_key,
+        partial(createdPeer, request, interface, peer),
+        token,
+    )
+
+
+async def createdPeer(
+    request: Request, interface: Interface, model: CreatePeer
+) -> ModelResponse:
+    with heldSlot(request):
+        created, queued = await mutate(request, createPeer, interface, model)
+    return ModelResponse(created) if queued is None else accepted(queued, created)
+
+
+@interfaces_router.post(
+    "/{interface_id}/rotate",
+    response_model=RotationManifest,
+    dependencies=[Depends(applySlot)],
+)
+async def rotate_keys(
+    interface: Annotated[Interface, Depends(interfaceDep)],
+    model: RotateKeys | None = None,
+) -> ModelResponse:
+    model = model or RotateKeys()
+    manifest = await run_in_threadpool(
+        wg.rotate_keys, interface, model.peer_ids, model.group, model.keypairs
+    )
+    return ModelResponse(manifest)
+
+
+def createPeer(interface: Interface, model: CreatePeer) -> Peer:
+    if wg.get_peer_by_address(interface, model.address):
         raise HTTPException(
             status_code=409, detail="Peer with this address already exists"
         )
-
     return wg.create_peer(
         interface=interface,
-        name=peer.name,
-        address=peer.address,
-        remote_dns=peer.dns,
-        remote_persistent_keepalive=peer.persistent_keepalive,
-        remote_allowed_ips=peer.allowed_ips,
+        name=model.name,
+        address=model.address,
+        remote_dns=model.dns,
+        remote_persistent_keepalive=model.persistent_keepalive,
+        remote_allowed_ips=model.allowed_ips,
+        group_name=model.group,
+        expires_at=model.expires_at,
+        quota=model.quota,
     )
 
 
@@ -218,9 +638,49 @@ async def read_peer(
     return peer
 
 
-@peers_router.delete("/{peer_id}")
-async def delete_peer(peer: Annotated[Peer, Depends(peerDep)]) -> JSONResponse:
-    wg.delete_peer(peer)
+@peers_router.patch(
+    "/{peer_id}",
+    response_model=Peer,
+    responses=ASYNC_RESPONSES,
+    dependencies=[Depends(applySlot)],
+)
+async def update_peer(
+    request: Request, peer: Annotated[Peer, Depends(peerDep)], model: PatchPeer
+) -> Peer | ModelResponse:
+    patchPeer(peer, model)
+    _, queued = await mutate(request, wg.update_peer, peer)
+    return peer if queued is None else accepted(queued, peer)
+
+
+def patchPeer(peer: Peer, model: PatchPeer) -> None:
+    fields = model.model_fields_set
+    if "name" in fields and model.name:
+        peer.name = model.name
+    if "dns" in fields:
+        peer.remote_dns = model.dns
+    if "persistent_keepalive" in fields:
+        peer.remote_persistent_keepalive = model.persistent_keepalive
+    if "allowed_ips" in fields:
+        peer.remote_allowed_ips = model.allowed_ips
+    if "group" in fields:
+        peer.group_name = model.group
+    if "enabled" in fields and model.enabled is not None:
+        peer.enabled = model.enabled
+    if "expires_at" in fields:
+        peer.expires_at = model.expires_at
+    if "quota" in fields:
+        peer.quota = model.quota
+
+
+@peers_router.delete(
+    "/{peer_id}", responses=ASYNC_RESPONSES, dependencies=[Depends(applySlot)]
+)
+async def delete_peer(
+    request: Request, peer: Annotated[Peer, Depends(peerDep)]
+) -> Response:
+    _, queued = await mutate(request, wg.delete_peer, peer)
+    if queued is not None:
+        return accepted(queued)
     return JSONResponse({"message": "Peer deleted"})
 
 
@@ -298,3 +758,220 @@ async def remove_dns_rewrite(domain: str) -> JSONResponse:
 
 
 api_router.include_router(dns_router)
+
+batch_router = APIRouter(tags=["Batch"], prefix="/batch")
+
+
+def runOperation(
+    operation: BatchOperation, rewrites: dict[str, IPv4Address]
+) -> Peer | Interface | None:
+    match operation:
+        case BatchCreatePeer():
+            interface = wg.get_interface(operation.interface_id)
+            if not interface:
+                raise HTTPException(status_code=404, detail="Interface not found")
+            return createPeer(interface, operation.peer)
+        case BatchUpdatePeer():
+            if not (peer := wg.get_peer(operation.peer_id)):
+                raise HTTPException(status_code=404, detail="Peer not found")
+            patchPeer(peer, operation.peer)
+            wg.update_peer(peer)
+            return peer
+        case BatchDeletePeer():
+            if not (peer := wg.get_peer(operation.peer_id)):
+                raise HTTPException(status_code=404, detail="Peer not found")
+            wg.delete_peer(peer)
+        case BatchUpdateInterface():
+            interface = wg.get_interface(operation.interface_id)
+            if not interface:
+                raise HTTPException(status_code=404, detail="Interface not found")
+            updated = updatedInterface(interface, operation.interface)
+            wg.update_interface(updated)
+            return updated
+        case BatchDeleteInterface():
+            interface = wg.get_interface(operation.interface_id)
+            if not interface:
+                raise HTTPException(status_code=404, detail="Interface not found")
+            wg.delete_interface(interface)
+        case BatchAddDNSRewrite():
+            if operation.domain in rewrites:
+                raise HTTPException(status_code=409, detail="Domain already exists")
+            rewrites[operation.domain] = operation.ip
+        case BatchRemoveDNSRewrite():
+            if rewrites.pop(operation.domain, None) is None:
+                raise HTTPException(status_code=404, detail="Domain does not exist")
+    return None
+
+
+def runBatch(batch: Batch) -> BatchResult:
+    results: list[Peer | Interface | None] = []
+    dns = any(operation.op.endswith("_dns_rewrite") for operation in batch.operations)
+    with wg.deferred_applies() as deferred:
+        # Pi-hole stays locked until the peers are committed, the rewrites are
+        # checked against its current list and written after the commit
+        with ph.editing() if dns else nullcontext({}) as rewrites:
+            with Table.storage.transaction():
+                for index, operation in enumerate(batch.operations):
+                    try:
+                        results.append(runOperation(operation, rewrites))
+                    except HTTPException as error:
+                        raise HTTPException(
+                            status_code=error.status_code,
+                            detail={
+                                "index": index,
+                                "op": operation.op,
+                                "detail": error.detail,
+                            },
+                        )
+    return BatchResult(results=results, applied=deferred.results)
+
+
+@batch_router.post("/", response_model=BatchResult, dependencies=[Depends(applySlot)])
+async def run_batch(batch: Batch) -> ModelResponse:
+    """Run the operations in order as one transaction, with one apply."""
+    result = await run_in_threadpool(runBatch, batch)
+    return ModelResponse(result)
+
+
+api_router.include_router(batch_router)
+
+jobs_router = APIRouter(tags=["Jobs"], prefix="/jobs")
+
+
+@jobs_router.get("/{job_id}", response_model=Job)
+async def read_job(job_id: str) -> Job:
+    """Status of an apply queued by a mutation with `Prefer: respond-async`."""
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+api_router.include_router(jobs_router)
+
+nodes_router = APIRouter(tags=["Nodes"], prefix="/nodes")
+
+
+@nodes_router.get("/", response_model=list[NodeStatus])
+async def read_nodes() -> list[NodeStatus]:
+    return await run_in_threadpool(wg.cluster.status)
+
+
+api_router.include_router(nodes_router)
+
+stats_router = APIRouter(tags=["Stats"], prefix="/stats")
+
+
+@stats_router.get(
+    "/", response_model=FleetStats | StatsDelta, responses=NDJSON_RESPONSES
+)
+async def read_stats(
+    request: Request, since: Annotated[int | None, Query(ge=0)] = None
+) -> ModelResponse | NDJSONResponse:
+    """Stats of all peers with per interface totals, read from WireGuard.
+
+    With `since`, only the peers changed after that cursor are returned, pass
+    the returned cursor as `since` on the next poll.
+    """
+    if since is not None:
+        return ModelResponse(sampler.snapshot.changes(since))
+    if wants_ndjson(request):
+        return NDJSONResponse(
+            wg.iter_peer_pages(wg.interfaces, fill_defaults=False),
+            Peer,
+            gzip=accepts(request, "accept-encoding", "gzip"),
+        )
+    return ModelResponse(await run_in_threadpool(wg.fill_all_stats))
+
+
+api_router.include_router(stats_router)
+
+accounting_router = APIRouter(tags=["Accounting"], prefix="/accounting")
+
+
+@accounting_router.get("/", response_model=AccountingReport | None)
+async def read_accounting() -> AccountingReport | None:
+    """Transfer of the current month per interface and group, with quota checks."""
+    return sampler.accounting.report
+
+
+@accounting_router.put("/quotas/{group}")
+async def set_group_quota(group: str, model: SetQuota) -> JSONResponse:
+    GroupQuotas.set(group, model.quota)
+    return JSONResponse({"message": "Quota set"})
+
+
+@accounting_router.delete("/quotas/{group}")
+async def delete_group_quota(group: str) -> JSONResponse:
+    GroupQuotas.delete(group)
+    return JSONResponse({"message": "Quota removed"})
+
+
+api_router.include_router(accounting_router)
+
+events_router = APIRouter(tags=["Events"], prefix="/events")
+
+
+async def eventStream(subscription: Subscription) -> AsyncIterator[str]:
+    try:
+        while True:
+            try:
+                event = await subscription.get(timeout=SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                yield "event: dropped\ndata: {}\n\n"
+                return
+            yield f"event: {event.type}\ndata: {event.model_dump_json()}\n\n"
+    finally:
+        subscription.close()
+
+
+@events_router.get("/")
+async def read_events(
+    interface_id: Annotated[list[int] | None, Query()] = None
+) -> StreamingResponse:
+    """Server-Sent Events of peer handshakes, traffic and online state."""
+    for _id in interface_id or []:
+        await interfaceDep(_id)
+    return StreamingResponse(
+        eventStream(bus.subscribe(set(interface_id) if interface_id else None)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+api_router.include_router(events_router)
+
+
+health_router = APIRouter(tags=["Health"], prefix="/health")
+
+
+@health_router.get("/live")
+async def read_liveness() -> JSONResponse:
+    return JSONResponse({"status": "ok"})
+
+
+@health_router.get("/ready")
+async def read_readiness() -> JSONResponse:
+    if not reconciler.ready.is_set():
+        return JSONResponse({"ready": False}, status_code=503)
+    return JSONResponse(
+        {
+            "ready": True,
+            "reconcile": (
+                reconciler.report.model_dump(mode="json") if reconciler.report else None
+            ),
+        }
+    )
+
+
+metrics_router = APIRouter(tags=["Health"])
+
+
+@metrics_router.get("/metrics")
+async def read_metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        reconciler.metrics.render(), media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,3 @@
+from .client import AgentClient
+from .cluster import LOCAL_NODE, Cluster, NodeDump, NodeStatus
+from .protocol import AgentError
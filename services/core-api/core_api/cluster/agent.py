@@ -0,0 +1,185 @@
+"""WireGuard agent, start it on every node with `python -m core_api.cluster.agent`."""
+
+import argparse
+import hmac
+import os
+import re
+import socket
+import ssl
+import sys
+from hashlib import sha256
+from ipaddress import ip_address
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from typing import Any, Callable
+
+from loguru import logger
+
+from ..config import Config
+from ..files import atomic_write
+from ..wireguard.diff import PeerConfig
+from ..wireguard.wg_connector import WG
+from .protocol import read_message, server_context, write_message
+
+CONFIG_DIR = "/etc/wireguard"
+# Interface names that wg-quick accepts
+INTERFACE_NAME = re.compile(r"[a-zA-Z0-9_=+.-]{1,15}")
+
+
+def check_name(name: Any) -> str:
+    if not isinstance(name, str) or not INTERFACE_NAME.fullmatch(name):
+        raise ValueError(f"Invalid interface name {name!r}")
+    return name
+
+
+class AgentHandler(StreamRequestHandler):
+    """Serves requests of one connection until the client closes it."""
+
+    server: "Agent"
+
+    def handle(self) -> None:
+        while True:
+            try:
+                request = read_message(self.rfile)
+            except ValueError as e:
+                # The rest of the line can't be skipped, so the connection ends
+                logger.warning(f"Rejected request from {self.client_address}: {e}")
+                write_message(self.wfile, {"error": str(e)})
+                return
+            if request is None:
+                return
+            try:
+                result = self.server.dispatch(request)
+                reply: dict[str, Any] = {"result": result}
+            except PermissionError as e:
+                logger.warning(f"Rejected request from {self.client_address}: {e}")
+                reply = {"error": str(e)}
+            except Exception as e:
+                logger.exception(f"Agent request {request.get('method')} failed")
+                reply = {"error": str(e) or type(e).__name__}
+            write_message(self.wfile, reply)
+
+
+class Agent(ThreadingTCPServer):
+    """RPC server exposing dump, peer updates, config writes and up/down."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        token: str = Config.Cluster.TOKEN,
+        wg=WG,
+        config_dir: str = CONFIG_DIR,
+        tls: ssl.SSLContext | None = None,
+    ) -> None:
+        if not token:
+            raise ValueError("The agent needs a token")
+        super().__init__(address, AgentHandler)
+        self.token = token
+        self.tls = tls
+        self.wg = wg
+        self.config_dir = config_dir
+        self.methods: dict[str, Callable[..., Any]] = {
+            "interfaces": self.interfaces,
+            "dump": self.dump,
+            "dump_interface": self.dump_interface,
+            "set_peers": self.set_peers,
+            "write_config": self.write_config,
+            "apply_config": self.apply_config,
+            "up": self.up,
+            "down": self.down,
+        }
+
+    def get_request(self) -> tuple[socket.socket, Any]:
+        sock, address = super().get_request()
+        if self.tls is not None:
+            # The handshake runs on the first read, in the connection's thread
+            sock = self.tls.wrap_socket(
+                sock, server_side=True, do_handshake_on_connect=False
+            )
+        return sock, address
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        logger.opt(exception=True).warning(f"Connection from {client_address} failed")
+
+    def dispatch(self, request: dict[str, Any]) -> Any:
+        if not hmac.compare_digest(str(request.get("token", "")), self.token):
+            raise PermissionError("Invalid token")
+        method = self.methods.get(request.get("method", ""))
+        if method is None:
+            raise ValueError(f"Unknown method {request.get('method')}")
+        return method(**request.get("params", {}))
+
+    def interfaces(self) -> list[str]:
+        return self.wg.interfaces()
+
+    def dump(self) -> list[dict]:
+        return [info.dump() for info in self.wg.get_interfaces_info()]
+
+    def dump_interface(self, name: str) -> dict:
+        return self.wg.get_interface_info(check_name(name)).dump()
+
+    def set_peers(self, name: str, peers: list[list[str]], remove: list[str]) -> None:
+        self.wg.set_peers(
+            check_name(name), [PeerConfig(*peer) for peer in peers], remove
+        )
+
+    def write_config(self, name: str, config: str) -> bool:
+        """Write the interface config if it differs, return whether it did."""
+        path = os.path.join(self.config_dir, f"{check_name(name)}.conf")
+        digest = sha256(config.encode()).digest()
+        try:
+            with open(path, "rb") as f:
+                if sha256(f.read()).digest() == digest:
+                    return False
+        except FileNotFoundError:
+            pass
+        atomic_write(path, config)
+        return True
+
+    def apply_config(
+        self, name: str, config: str, enabled: bool, restart: bool = False
+    ) -> bool:
+        """Write the interface config and bring the interface to its state."""
+        changed = self.write_config(check_name(name), config)
+        is_running = name in self.wg.interfaces()
+        if not changed and not restart and is_running == enabled:
+            return False
+        if is_running:
+            self.wg.down(name)
+        if enabled:
+            self.wg.up(name)
+        return changed
+
+    def up(self, name: str) -> None:
+        self.wg.up(check_name(name))
+
+    def down(self, name: str) -> None:
+        self.wg.down(check_name(name))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="wghub WireGuard agent")
+    parser.add_argument("--host", default=Config.Cluster.AGENT_HOST)
+    parser.add_argument("--port", type=int, default=Config.Cluster.AGENT_PORT)
+    parser.add_argument("--config-dir", default=CONFIG_DIR)
+    parser.add_argument("--cert", default=Config.Cluster.AGENT_CERT)
+    parser.add_argument("--key", default=Config.Cluster.AGENT_KEY)
+    args = parser.parse_args()
+
+    if not Config.Cluster.TOKEN:
+        parser.error("WG_AGENT_TOKEN is not set, refusing to start")
+    tls = server_context(args.cert, args.key)
+    if tls is None and not ip_address(socket.gethostbyname(args.host)).is_loopback:
+        logger.warning(
+            f"Listening on {args.host} without TLS, tokens and keys are sent in"
+            " plaintext, only run the agent on a trusted network"
+        )
+    with Agent((args.host, args.port), config_dir=args.config_dir, tls=tls) as agent:
+        logger.info(f"Agent listening on {args.host}:{args.port}")
+        agent.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import socket
+import ssl
+from threading import Lock
+from typing import Any, Iterable
+
+from ..config import Config
+from ..wireguard.diff import PeerConfig
+from ..wireguard.wg_connector import InterfaceInfo
+from .protocol import AgentError, client_context, read_message, write_message
+
+
+class AgentClient:
+    """Connector to the agent of a node, mirrors the methods of `WG`."""
+
+    def __init__(
+        self,
+        node: str,
+        host: str,
+        port: int,
+        token: str = Config.Cluster.TOKEN,
+        timeout: float = Config.Cluster.TIMEOUT,
+        tls: ssl.SSLContext | None = None,
+    ) -> None:
+        self.node = node
+        self.host = host
+        self.port = port
+        self.token = token
+        self.timeout = timeout
+        self.tls = tls
+        self._lock = Lock()
+        self._sock: socket.socket | None = None
+        self._file = None
+
+    def __repr__(self) -> str:
+        return f"<AgentClient {self.node} {self.host}:{self.port}>"
+
+    def _connect(self):
+        if self._file is None:
+            self._sock = socket.create_connection(
+                (self.host, self.port), timeout=self.timeout
+            )
+            if self.tls is not None:
+                self._sock = self.tls.wrap_socket(self._sock, server_hostname=self.host)
+            self._file = self._sock.makefile("rwb")
+        return self._file
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        if self._sock is not None:
+            self._sock.close()
+        self._file = self._sock = None
+
+    def call(self, method: str, **params: Any) -> Any:
+        with self._lock:
+            try:
+                f = self._connect()
+                write_message(
+                    f, {"method": method, "params": params, "token": self.token}
+                )
+                reply = read_message(f)
+            except (OSError, ValueError) as e:
+                self._close()
+                raise AgentError(f"Node {self.node}: {e or type(e).__name__}") from e
+            if reply is None:
+                self._close()
+                raise AgentError(f"Node {self.node}: connection closed")
+        if "error" in reply:
+            raise AgentError(f"Node {self.node}: {reply['error']}")
+        return reply.get("result")
+
+    def interfaces(self) -> list[str]:
+        return self.call("interfaces")
+
+    def get_interface_info(self, interface_name: str) -> InterfaceInfo:
+        return InterfaceInfo.load(self.call("dump_interface", name=interface_name))
+
+    def get_interfaces_info(self) -> list[InterfaceInfo]:
+        return [InterfaceInfo.load(data) for data in self.call("dump")]
+
+    def set_peers(
+        self,
+        interface_name: str,
+        peers: Iterable[PeerConfig] = (),
+        remove: Iterable[str] = (),
+    ) -> None:
+        self.call(
+            "set_peers",
+            name=interface_name,
+            peers=[list(peer) for peer in peers],
+            remove=list(remove),
+        )
+
+    def write_config(self, interface_name: str, config: str) -> bool:
+        return self.call("write_config", name=interface_name, config=config)
+
+    def apply_config(
+        self, interface_name: str, config: str, enabled: bool, restart: bool = False
+    ) -> bool:
+        return self.call(
+            "apply_config",
+            name=interface_name,
+            config=config,
+            enabled=enabled,
+            restart=restart,
+        )
+
+    def up(self, interface_name: str) -> None:
+        self.call("up", name=interface_name)
+
+    def down(self, interface_name: str) -> None:
+        self.call("down", name=interface_name)
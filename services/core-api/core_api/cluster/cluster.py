@@ -0,0 +1,139 @@
+import ssl
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from time import perf_counter
+
+from loguru import logger
+from pydantic import BaseModel
+
+from ..config import Config
+from ..wireguard.wg_connector import InterfaceInfo
+from .client import AgentClient
+from .protocol import client_context
+
+LOCAL_NODE = "local"
+
+
+class NodeStatus(BaseModel):
+    node: str
+    address: str
+    ok: bool
+    error: str | None = None
+    interfaces: list[str] = []
+    duration: float
+
+
+class NodeDump:
+    """Running interfaces of a node, or the error that prevented reading them."""
+
+    __slots__ = ("node", "interfaces", "error", "duration")
+
+    def __init__(
+        self,
+        node: str,
+        interfaces: list[InterfaceInfo] | None,
+        error: str | None,
+        duration: float,
+    ) -> None:
+        self.node = node
+        self.interfaces = interfaces
+        self.error = error
+        self.duration = duration
+
+
+def parse_nodes(nodes: str) -> dict[str, tuple[str, int]]:
+    """Parse `name=host:port` pairs separated by commas."""
+    parsed: dict[str, tuple[str, int]] = {}
+    for item in filter(None, (item.strip() for item in nodes.split(","))):
+        name, _, address = item.partition("=")
+        host, _, port = address.rpartition(":")
+        if not name or not host or not port.isdigit():
+            raise ValueError(f"Invalid node {item!r}, expected name=host:port")
+        if name == LOCAL_NODE:
+            raise ValueError(f"Node name {LOCAL_NODE!r} is reserved")
+        parsed[name] = (host.strip("[]"), int(port))
+    return parsed
+
+
+class Cluster:
+    """Agents of the remote nodes, `local` interfaces are handled by core-api."""
+
+    def __init__(
+        self,
+        nodes: dict[str, tuple[str, int]],
+        token: str = Config.Cluster.TOKEN,
+        timeout: float = Config.Cluster.TIMEOUT,
+        tls: ssl.SSLContext | None = None,
+    ) -> None:
+        self.timeout = timeout
+        self.clients = {
+            name: AgentClient(name, host, port, token=token, timeout=timeout, tls=tls)
+            for name, (host, port) in nodes.items()
+        }
+        # Not used as a context manager: waiting for a stuck node on exit
+        # would stall everyone else
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(2 * len(self.clients), 1), thread_name_prefix="wg-node"
+        )
+
+    @classmethod
+    def from_config(cls) -> "Cluster":
+        return cls(
+            parse_nodes(Config.Cluster.NODES),
+            tls=client_context(Config.Cluster.AGENT_CA),
+        )
+
+    @property
+    def nodes(self) -> list[str]:
+        return [LOCAL_NODE, *self.clients]
+
+    def client(self, node: str) -> AgentClient:
+        if (client := self.clients.get(node)) is None:
+            raise ValueError(f"Unknown node {node}")
+        return client
+
+    def dump_all(self) -> dict[str, NodeDump]:
+        """Read the running interfaces of all remote nodes concurrently."""
+
+        def dump(client: AgentClient) -> NodeDump:
+            started = perf_counter()
+            return NodeDump(
+                client.node,
+                client.get_interfaces_info(),
+                None,
+                perf_counter() - started,
+            )
+
+        started = perf_counter()
+        futures: dict[str, Future[NodeDump]] = {
+            node: self._pool.submit(dump, client)
+            for node, client in self.clients.items()
+        }
+        done, _ = wait(futures.values(), timeout=self.timeout)
+
+        dumps: dict[str, NodeDump] = {}
+        for node, future in futures.items():
+            if future not in done:
+                error = f"timed out after {self.timeout}s"
+            elif (exception := future.exception()) is not None:
+                error = str(exception) or type(exception).__name__
+            else:
+                dumps[node] = future.result()
+                continue
+            logger.warning(f"Failed to read interfaces of node {node}: {error}")
+            dumps[node] = NodeDump(node, None, error, perf_counter() - started)
+        return dumps
+
+    def status(self) -> list[NodeStatus]:
+        return [
+            NodeStatus(
+                node=node,
+                address="{}:{}".format(
+                    self.clients[node].host, self.clients[node].port
+                ),
+                ok=dump.error is None,
+                error=dump.error,
+                interfaces=[info.name for info in dump.interfaces or []],
+                duration=dump.duration,
+            )
+            for node, dump in self.dump_all().items()
+        ]
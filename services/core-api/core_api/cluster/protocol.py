@@ -0,0 +1,44 @@
+"""JSON lines RPC between core-api and the WireGuard agents."""
+
+import json
+import ssl
+from typing import IO, Any
+
+
+# Longest request or reply line, dumps of large interfaces take a few MB
+MAX_MESSAGE = 64 * 1024 * 1024
+
+
+class AgentError(Exception):
+    """The agent could not be reached or failed to run the request."""
+
+
+def write_message(f: IO[bytes], message: dict[str, Any]) -> None:
+    f.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+    f.flush()
+
+
+def read_message(f: IO[bytes]) -> dict[str, Any] | None:
+    """Next message of the stream, None once the peer closed it."""
+    line = f.readline(MAX_MESSAGE + 1)
+    if not line:
+        return None
+    if len(line) > MAX_MESSAGE:
+        raise ValueError(f"Message longer than {MAX_MESSAGE} bytes")
+    return json.loads(line)
+
+
+def server_context(cert: str, key: str) -> ssl.SSLContext | None:
+    """TLS context of an agent, None without a certificate."""
+    if not cert:
+        return None
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key or None)
+    return context
+
+
+def client_context(ca: str) -> ssl.SSLContext | None:
+    """TLS context that verifies agents against `ca`, None without a CA."""
+    if not ca:
+        return None
+    return ssl.create_default_context(cafile=ca)
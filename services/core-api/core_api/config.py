@@ -0,0 +1,59 @@
+from os import getenv
+
+
+class Config:
+    class Storage:
+        DB_PATH: str = getenv("WG_DB_PATH") or "wg.db"
+
+    class Wireguard:
+        BACKEND: str = getenv("WG_BACKEND") or "subprocess"  # or "netlink"
+        APPLY_WORKERS: int = int(getenv("WG_APPLY_WORKERS") or 4)
+        RECONCILE_INTERVAL: float = float(getenv("WG_RECONCILE_INTERVAL") or 30)
+        # Background applies of `Prefer: respond-async` requests
+        JOB_WORKERS: int = int(getenv("WG_JOB_WORKERS") or 2)
+        JOB_HISTORY: int = int(getenv("WG_JOB_HISTORY") or 1000)
+        # Apply and leader locks shared by the worker processes
+        LOCK_DIR: str = getenv("WG_LOCK_DIR") or "/run/lock/wghub"
+
+    class Stats:
+        INTERVAL: float = float(getenv("WG_STATS_INTERVAL") or 5)
+        # rx + tx bytes a peer has to move before a traffic event is sent
+        TRAFFIC_THRESHOLD: int = int(getenv("WG_STATS_TRAFFIC_THRESHOLD") or 1 << 20)
+        # seconds since the last handshake for a peer to count as online
+        ONLINE_WINDOW: int = int(getenv("WG_ONLINE_WINDOW") or 180)
+        SUBSCRIBER_QUEUE: int = int(getenv("WG_EVENTS_QUEUE") or 1000)
+        # Stats of the leader worker, read by the other workers
+        SHARED_PATH: str = getenv("WG_SHARED_STATS") or "/dev/shm/wghub-stats.json"
+
+    class Idempotency:
+        # seconds a response is replayed to retries with its Idempotency-Key
+        TTL: float = float(getenv("WG_IDEMPOTENCY_TTL") or 86400)
+        KEYS: int = int(getenv("WG_IDEMPOTENCY_KEYS") or 10000)
+        # seconds after which a key whose request never finished is released
+        PENDING_TTL: float = float(getenv("WG_IDEMPOTENCY_PENDING_TTL") or 300)
+
+    class Limits:
+        # Worker processes, as read by uvicorn. Every worker keeps its own
+        # buckets and apply count and enforces its share of the limits below
+        WORKERS: int = int(getenv("WEB_CONCURRENCY") or 1)
+        # requests per second and burst of one token, 0 disables the limit
+        READ_RATE: float = float(getenv("WG_READ_RATE") or 20)
+        READ_BURST: int = int(getenv("WG_READ_BURST") or 100)
+        MUTATION_RATE: float = float(getenv("WG_MUTATION_RATE") or 2)
+        MUTATION_BURST: int = int(getenv("WG_MUTATION_BURST") or 20)
+        # requests applying interfaces at once, 0 disables the cap
+        APPLIES: int = int(getenv("WG_MAX_APPLIES") or 8)
+        RETRY_AFTER: int = int(getenv("WG_APPLIES_RETRY_AFTER") or 1)
+
+    class Cluster:
+        # name=host:port pairs separated by commas, e.g. "edge1=10.0.0.2:51900"
+        NODES: str = getenv("WG_NODES") or ""
+        TOKEN: str = getenv("WG_AGENT_TOKEN") or ""
+        TIMEOUT: float = float(getenv("WG_NODE_TIMEOUT") or 10)
+        AGENT_HOST: str = getenv("WG_AGENT_HOST") or "127.0.0.1"
+        AGENT_PORT: int = int(getenv("WG_AGENT_PORT") or 51900)
+        # TLS of the agent connections: certificate and key of the agent, and
+        # the CA that core-api verifies them with
+        AGENT_CERT: str = getenv("WG_AGENT_CERT") or ""
+        AGENT_KEY: str = getenv("WG_AGENT_KEY") or ""
+        AGENT_CA: str = getenv("WG_AGENT_CA") or ""
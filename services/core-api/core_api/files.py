@@ -0,0 +1,105 @@
+import fcntl
+import os
+from tempfile import NamedTemporaryFile
+from types import TracebackType
+from typing import IO, Self
+
+
+class AtomicFile:
+    """Binary file that replaces `path` only once it is completely written."""
+
+    def __init__(self, path: str, buffering: int = -1) -> None:
+        self.path = path
+        self.buffering = buffering
+        self.discarded = False
+        self._file: IO[bytes]
+
+    def __enter__(self) -> Self:
+        self._file = NamedTemporaryFile(
+            "wb",
+            dir=os.path.dirname(self.path) or ".",
+            prefix=".",
+            suffix=".tmp",
+            buffering=self.buffering,
+            delete=False,
+        )
+        return self
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+
+    def discard(self) -> None:
+        self.discarded = True
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        try:
+            if exc_type is None and not self.discarded:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._file.close()
+            if exc_type is not None or self.discarded:
+                return
+            try:
+                os.chmod(self._file.name, os.stat(self.path).st_mode & 0o777)
+            except FileNotFoundError:
+                pass
+            os.replace(self._file.name, self.path)
+        finally:
+            if os.path.exists(self._file.name):
+                os.unlink(self._file.name)
+
+
+def atomic_write(path: str, content: str) -> None:
+    """Write `content` to `path` so readers see either the old or the new file."""
+    with AtomicFile(path) as f:
+        f.write(content.encode())
+
+
+class FileLock:
+    """Exclusive `flock` on `path`, shared between threads and processes."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._fd: int | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(
+                fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            )
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            os.close(fd)
+
+    def __enter__(self) -> Self:
+        self.acquire()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.release()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+from dataclasses import dataclass
+from hashlib import sha256
+from time import time
+from typing import Annotated, Awaitable, Callable
+
+from fastapi import Header, HTTPException, Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+from .config import Config
+from .storages import IdempotencyKeys
+
+IdempotencyKey = Annotated[
+    str | None,
+    Header(
+        max_length=255,
+        description="Retries with the same key get the response of the first request",
+    ),
+]
+
+# Seconds between checks of a retry for the response of the first request
+POLL_INTERVAL = 0.05
+
+
+@dataclass
+class StoredResponse:
+    status_code: int
+    body: bytes
+    headers: list[tuple[bytes, bytes]]
+
+
+class IdempotencyCache:
+    """Responses of requests with an `Idempotency-Key`, kept for `ttl` seconds."""
+
+    def __init__(
+        self,
+        size: int = Config.Idempotency.KEYS,
+        ttl: float = Config.Idempotency.TTL,
+        pending_ttl: float = Config.Idempotency.PENDING_TTL,
+    ) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+
+    @staticmethod
+    async def _fingerprint(request: Request) -> bytes:
+        digest = sha256(f"{request.method} {request.url.path}\n".encode())
+        digest.update(await request.body())
+        return digest.digest()
+
+    async def run(
+        self,
+        request: Request,
+        key: str | None,
+        handler: Callable[[], Awaitable[Response]],
+        scope: str = "",
+    ) -> Response:
+        if key is None:
+            return await handler()
+        key = f"{scope}:{key}"
+        fingerprint = await self._fingerprint(request)
+
+        # The database calls take the write lock, so they run in the threadpool
+        while True:
+            now = time()
+            entry = await run_in_threadpool(IdempotencyKeys.get, key)
+            if entry is not None and entry["expires_at"] > now:
+                if entry["fingerprint"] != fingerprint:
+                    raise HTTPException(
+                        status_code=422,
+                        detail="Idempotency-Key was used with another request",
+                    )
+                if entry["status_code"] is not None:
+                    return self._replay(self._stored(entry))
+                await asyncio.sleep(POLL_INTERVAL)
+            elif await run_in_threadpool(
+                IdempotencyKeys.claim,
+                key,
+                fingerprint,
+                now + self.pending_ttl,
+                now,
+                self.size,
+            ):
+                break
+
+        try:
+            response = await handler()
+        except BaseException:
+            await run_in_threadpool(IdempotencyKeys.release, key)
+            raise
+        await run_in_threadpool(
+            IdempotencyKeys.store,
+            key,
+            response.status_code,
+            response.body,
+            json.dumps(
+                [
+                    (k.decode("latin-1"), v.decode("latin-1"))
+                    for k, v in response.raw_headers
+                ]
+            ),
+            time() + self.ttl,
+        )
+        return response
+
+    @staticmethod
+    def _stored(entry: dict) -> StoredResponse:
+        return StoredResponse(
+            status_code=entry["status_code"],
+            body=entry["body"],
+            headers=[
+                (name.encode("latin-1"), value.encode("latin-1"))
+                for name, value in json.loads(entry["headers"])
+            ],
+        )
+
+    @staticmethod
+    def _replay(stored: StoredResponse) -> Response:
+        response = Response(stored.body, stored.status_code)
+        response.raw_headers = [*stored.headers, (b"idempotent-replayed", b"true")]
+        return response
@@ -0,0 +1,86 @@
+from collections import OrderedDict
+from math import ceil
+from time import monotonic
+
+from fastapi import HTTPException
+
+from .config import Config
+
+
+class TokenBucket:
+    """Allows `burst` requests at once, refilled at `rate` per second."""
+
+    def __init__(self, rate: float, burst: int, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a request, return 0 or the seconds until one is allowed."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets per client, split over the `workers` processes."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        size: int = 10000,
+        workers: int = Config.Limits.WORKERS,
+    ) -> None:
+        self.rate = rate / workers
+        self.burst = ceil(burst / workers)
+        self.size = size
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    def check(self, client: str) -> None:
+        """Raise 429 with Retry-After if the client is over its budget."""
+        if self.rate <= 0:
+            return
+        now = monotonic()
+        if bucket := self._buckets.get(client):
+            self._buckets.move_to_end(client)
+        else:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+            if len(self._buckets) > self.size:
+                self._buckets.popitem(last=False)
+        if wait := bucket.take(now):
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(ceil(wait))},
+            )
+
+
+class ApplyGate:
+    """Refuses requests over `limit` that apply interfaces while the client waits."""
+
+    def __init__(
+        self,
+        limit: int = Config.Limits.APPLIES,
+        retry_after: int = Config.Limits.RETRY_AFTER,
+        workers: int = Config.Limits.WORKERS,
+    ) -> None:
+        self.limit = ceil(limit / workers)
+        self.retry_after = retry_after
+        self.in_flight = 0
+
+    def enter(self) -> None:
+        if self.limit and self.in_flight >= self.limit:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many applies in progress",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        self.in_flight += 1
+
+    def exit(self) -> None:
+        self.in_flight -= 1
@@ -1,5 +1,13 @@
+import os
+from contextlib import contextmanager
 from dataclasses import dataclass
 from ipaddress import IPv4Address
+from threading import Lock
+from types import MappingProxyType
+from typing import Iterable, Iterator, Mapping
+
+from ..config import Config
+from ..files import FileLock, atomic_write
 
 
 CONFIG_PATH = "/etc/pihole/custom.list"
@@ -20,43 +28,98 @@ class DNSRewrite:
 
 
 class PiHole:
+    """Pi-hole custom DNS list, read from snapshots and written copy-on-write."""
+
     def __init__(self, config_path: str = CONFIG_PATH) -> None:
-        self.rewrites: dict[str, IPv4Address] = {}  # domain: ip
         self.config_path = config_path
+        self._rewrites: Mapping[str, IPv4Address] = MappingProxyType({})  # domain: ip
+        self._file_stamp: tuple[int, int, int] | None = None
+        self._write_lock = Lock()
+
+    @property
+    def rewrites(self) -> Mapping[str, IPv4Address]:
+        return self._rewrites
+
+    def _stat(self) -> tuple[int, int, int] | None:
+        try:
+            stat = os.stat(self.config_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
 
     def _load_rewrites(self) -> None:
-        with open(self.config_path, "r") as f:
-            self.rewrites = {
-                rewrite.domain: rewrite.ip
-                for rewrite in (
-                    DNSRewrite.from_line(line) for line in f.readlines() if line.strip()
-                )
-            }
-
-    def _save_rewrites(self) -> None:
-        with open(self.config_path, "w") as f:
-            f.write("\n".join(f"{ip} {host}" for host, ip in self.rewrites.items()))
+        """Reload the snapshot if the file was changed outside of this instance."""
+        if self._stat() == self._file_stamp:
+            return
+        if not self._write_lock.acquire(blocking=False):
+            return
+        try:
+            self._reload_rewrites()
+        finally:
+            self._write_lock.release()
+
+    def _reload_rewrites(self) -> None:
+        stamp = self._stat()
+        if stamp == self._file_stamp:
+            return
+        rewrites: dict[str, IPv4Address] = {}
+        if stamp is not None:
+            with open(self.config_path, "r") as f:
+                rewrites = {
+                    rewrite.domain: rewrite.ip
+                    for rewrite in (
+                        DNSRewrite.from_line(line) for line in f if line.strip()
+                    )
+                }
+        self._rewrites = MappingProxyType(rewrites)
+        self._file_stamp = stamp
+
+    def _save_rewrites(self, rewrites: dict[str, IPv4Address]) -> None:
+        atomic_write(
+            self.config_path,
+            "\n".join(f"{ip} {host}" for host, ip in rewrites.items()),
+        )
+        self._rewrites = MappingProxyType(rewrites)
+        self._file_stamp = self._stat()
+
+    @contextmanager
+    def editing(self) -> Iterator[dict[str, IPv4Address]]:
+        """Copy of the rewrites, written if the block changed it and didn't raise."""
+        with self._write_lock, FileLock(
+            os.path.join(Config.Wireguard.LOCK_DIR, "pihole.lock")
+        ):
+            self._reload_rewrites()
+            rewrites = dict(self._rewrites)
+            yield rewrites
+            if rewrites != self._rewrites:
+                self._save_rewrites(rewrites)
+
+    def update_rewrites(
+        self, changes: Iterable[tuple[str, IPv4Address | None]]
+    ) -> None:
+        """Add (domain, ip) and remove (domain, None) rewrites, all or nothing."""
+        with self.editing() as rewrites:
+            for domain, ip in changes:
+                if ip is None:
+                    if domain not in rewrites:
+                        raise ValueError(f"Domain {domain} does not exist")
+                    del rewrites[domain]
+                else:
+                    if domain in rewrites:
+                        raise ValueError(f"Domain {domain} already exists")
+                    rewrites[domain] = ip
 
     def add_rewrite(self, domain: str, ip: IPv4Address) -> None:
-        if domain in self.rewrites:
-            raise ValueError("Domain already exists")
-        self.rewrites[domain] = ip
-        self._save_rewrites()
+        self.update_rewrites([(domain, ip)])
 
     def remove_rewrite(self, domain: str) -> None:
-        if domain not in self.rewrites:
-            raise ValueError("Domain does not exist")
-        del self.rewrites[domain]
-        self._save_rewrites()
+        self.update_rewrites([(domain, None)])
 
     def find_rewrite(self, domain: str) -> DNSRewrite | None:
         self._load_rewrites()
-        return (
-            DNSRewrite(domain, self.rewrites[domain])
-            if domain in self.rewrites
-            else None
-        )
+        rewrites = self._rewrites
+        return DNSRewrite(domain, rewrites[domain]) if domain in rewrites else None
 
     def get_rewrites(self) -> list[DNSRewrite]:
         self._load_rewrites()
-        return [DNSRewrite(domain, ip) for domain, ip in self.rewrites.items()]
+        return [DNSRewrite(domain, ip) for domain, ip in self._rewrites.items()]
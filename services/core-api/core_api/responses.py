@@ -0,0 +1,135 @@
+import zlib
+from functools import lru_cache
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, Mapping
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter
+from starlette.background import BackgroundTask
+from starlette.types import Receive, Scope, Send
+
+NDJSON = "application/x-ndjson"
+
+
+def accepts(request: Request, header: str, value: str) -> bool:
+    """Whether `value` is listed in an Accept style header with a non-zero q."""
+    for item in request.headers.get(header, "").split(","):
+        name, _, params = item.partition(";")
+        if name.strip().lower() != value:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, number = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            return True
+    return False
+
+
+def wants_ndjson(request: Request) -> bool:
+    return accepts(request, "accept", NDJSON)
+
+
+@lru_cache(maxsize=None)
+def adapter(type: Any) -> TypeAdapter:
+    """Cached adapter of a response type, building one compiles its serializer."""
+    return TypeAdapter(type)
+
+
+class ModelResponse(Response):
+    """JSON response of validated models, serialized by pydantic-core."""
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: Any,
+        type: Any = None,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+    ) -> None:
+        self.type = content.__class__ if type is None else type
+        super().__init__(content, status_code, headers)
+
+    def render(self, content: Any) -> bytes:
+        return adapter(self.type).dump_json(content)
+
+
+class NDJSONResponse(StreamingResponse):
+    """Newline delimited JSON streamed from pages of validated models."""
+
+    media_type = NDJSON
+
+    def __init__(
+        self,
+        pages: Iterable[Iterable[Any]] | AsyncIterable[Iterable[Any]],
+        type: Any,
+        gzip: bool = False,
+        exclude: set[str] | None = None,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        reads_request: bool = False,
+        background: BackgroundTask | None = None,
+    ) -> None:
+        self._adapter = adapter(type)
+        self._exclude = exclude
+        self._compressor = zlib.compressobj(wbits=31) if gzip else None
+        self.reads_request = reads_request
+        super().__init__(
+            (
+                self._aencode(pages)
+                if isinstance(pages, AsyncIterable)
+                else self._encode(pages)
+            ),
+            status_code,
+            headers,
+            background=background,
+        )
+        self.headers["vary"] = "Accept, Accept-Encoding"
+        if gzip:
+            self.headers["content-encoding"] = "gzip"
+
+    def _chunk(self, page: Iterable[Any]) -> bytes:
+        chunk = b"".join(
+            self._adapter.dump_json(item, exclude=self._exclude) + b"\n"
+            for item in page
+        )
+        if self._compressor and chunk:
+            return self._compressor.compress(chunk) + self._compressor.flush(
+                zlib.Z_SYNC_FLUSH
+            )
+        return chunk
+
+    def _end(self) -> bytes:
+        return self._compressor.flush() if self._compressor else b""
+
+    def _encode(self, pages: Iterable[Iterable[Any]]) -> Iterator[bytes]:
+        for page in pages:
+            if chunk := self._chunk(page):
+                yield chunk
+        if end := self._end():
+            yield end
+
+    async def _aencode(
+        self, pages: AsyncIterable[Iterable[Any]]
+    ) -> AsyncIterator[bytes]:
+        async for page in pages:
+            if chunk := self._chunk(page):
+                yield chunk
+        if end := self._end():
+            yield end
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.reads_request:
+            await super().__call__(scope, receive, send)
+            return
+        # Listening for the disconnect would take the messages of the body
+        try:
+            await self.stream_response(send)
+        finally:
+            if self.background is not None:
+                await self.background()
@@ -1,3 +1,8 @@
 from .interfaces import Interface, Interfaces
 from .peers import Peer, Peers
+from .peer_changes import PeerChanges
 from .tokens import Tokens
+from .applied_configs import AppliedConfigs
+from .accounting import GroupQuotas, TrafficUsage
+from .jobs import Jobs
+from .idempotency import IdempotencyKeys
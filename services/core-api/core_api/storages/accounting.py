@@ -0,0 +1,70 @@
+from typing import Iterable, Iterator
+
+from .connector import Table, Column
+from .peer_changes import PeerChanges
+
+
+class GroupQuotas(
+    Table,
+    name="group_quotas",
+    columns=[
+        Column("group_name", "TEXT", primary_key=True),
+        Column("quota", "INTEGER", not_null=True),
+    ],
+):
+    @classmethod
+    def get_all(cls) -> dict[str, int]:
+        cls.storage.execute(f"SELECT group_name, quota FROM {cls.name}")
+        return {row[0]: row[1] for row in cls.storage.fetchall()}
+
+    @classmethod
+    def set(cls, group_name: str, quota: int) -> None:
+        with cls.storage.transaction() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {cls.name} (group_name, quota) VALUES (?, ?)",
+                (group_name, quota),
+            )
+            PeerChanges.add([None])
+
+    @classmethod
+    def delete(cls, group_name: str) -> None:
+        with cls.storage.transaction() as conn:
+            conn.execute(f"DELETE FROM {cls.name} WHERE group_name = ?", (group_name,))
+            PeerChanges.add([None])
+
+
+class TrafficUsage(
+    Table,
+    name="traffic_usage",
+    columns=[
+        Column("public_key", "TEXT", primary_key=True),
+        Column("interface_id", "INTEGER", not_null=True),
+        Column("period", "TEXT", not_null=True),
+        Column("rx", "INTEGER", not_null=True),
+        Column("tx", "INTEGER", not_null=True),
+    ],
+):
+    """Checkpoint of the per peer usage of the current accounting period."""
+
+    @classmethod
+    def iter_period(cls, period: str) -> Iterator[tuple[int, str, int, int]]:
+        """Yield (interface_id, public_key, rx, tx) of the period."""
+        return cls.storage.iterate(
+            f"SELECT interface_id, public_key, rx, tx FROM {cls.name}"
+            f" WHERE period = ?",
+            (period,),
+        )
+
+    @classmethod
+    def save(cls, period: str, rows: Iterable[tuple[int, str, int, int]]) -> None:
+        """Replace the checkpoint with (interface_id, public_key, rx, tx) rows."""
+        with cls.storage.transaction() as conn:
+            conn.execute(f"DELETE FROM {cls.name}")
+            conn.executemany(
+                f"INSERT INTO {cls.name} (interface_id, public_key, period, rx, tx)"
+                f" VALUES (?, ?, ?, ?, ?)",
+                (
+                    (interface_id, public_key, period, rx, tx)
+                    for interface_id, public_key, rx, tx in rows
+                ),
+            )
@@ -0,0 +1,36 @@
+from .connector import Table, Column
+from .interfaces import Interfaces
+
+
+class AppliedConfigs(
+    Table,
+    name="applied_configs",
+    columns=[
+        Column("interface_name", "TEXT", primary_key=True),
+        Column("config_hash", "TEXT", not_null=True),
+    ],
+):
+    @classmethod
+    def get(cls, interface_name: str) -> str | None:
+        cls.storage.execute(
+            f"SELECT config_hash FROM {cls.name} WHERE interface_name = ?",
+            (interface_name,),
+        )
+        return row.str() if (row := cls.storage.fetchone()) else None
+
+    @classmethod
+    def set(cls, interface_name: str, config_hash: str) -> None:
+        """Record the hash, unless the interface was deleted or renamed since."""
+        cls.storage.execute(
+            f"INSERT OR REPLACE INTO {cls.name} (interface_name, config_hash)"
+            f" SELECT name, ? FROM {Interfaces.name} WHERE name = ?",
+            (config_hash, interface_name),
+        )
+        cls.storage.commit()
+
+    @classmethod
+    def delete(cls, interface_name: str) -> None:
+        cls.storage.execute(
+            f"DELETE FROM {cls.name} WHERE interface_name = ?", (interface_name,)
+        )
+        cls.storage.commit()
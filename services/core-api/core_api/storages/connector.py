@@ -1,8 +1,13 @@
 import sqlite3
-from typing import Literal, Type
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Iterator, Literal, Type
 
 from loguru import logger
 
+from ..config import Config
+
 
 class Storage:
     class Row:
@@ -40,10 +45,25 @@ class Storage:
             cls._singleton = super(Storage, cls).__new__(cls)
         return cls._singleton
 
-    def __init__(self, db_path: str = "wg.db"):
+    def __init__(self, db_path: str = Config.Storage.DB_PATH):
         self.db_path = db_path
-        self.conn = sqlite3.connect(self.db_path)
-        self.cursor = self.conn.cursor()
+        self._local = threading.local()
+
+    def _connection(self) -> threading.local:
+        """Connection of the current thread, opened on first use."""
+        if not hasattr(self._local, "conn"):
+            self._local.conn = sqlite3.connect(self.db_path)
+            self._local.cursor = self._local.conn.cursor()
+            self._local.depth = 0
+        return self._local
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self._connection().conn
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        return self._connection().cursor
 
     def fetchall(self) -> list[Row]:
         return [self.Row(self.cursor, row) for row in self.cursor.fetchall()]
@@ -55,8 +75,42 @@ class Storage:
         logger.debug(f"SQL\n{args}")
         return self.cursor.execute(*args)
 
+    def iterate(self, *args, size: int = 1000) -> Iterator[tuple]:
+        """Yield raw rows of a query in batches of `size`, from a cursor of its own."""
+        logger.debug(f"SQL\n{args}")
+        cursor = self.conn.execute(*args)
+        try:
+            while rows := cursor.fetchmany(size):
+                yield from rows
+        finally:
+            cursor.close()
+
     def commit(self):
-        return self.conn.commit()
+        """Commit, unless a `transaction` of this thread is open."""
+        local = self._connection()
+        if not local.depth:
+            local.conn.commit()
+
+    @contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """Commit the block at once, or roll it back if it raises."""
+        local = self._connection()
+        outermost = not local.depth
+        if outermost and immediate:
+            # Takes the write lock up front, and also covers schema statements
+            # that sqlite3 otherwise runs outside of transactions
+            local.conn.execute("BEGIN IMMEDIATE")
+        local.depth += 1
+        try:
+            yield local.conn
+            if outermost:
+                local.conn.commit()
+        except BaseException:
+            if outermost:
+                local.conn.rollback()
+            raise
+        finally:
+            local.depth -= 1
 
 
 class Column:
@@ -68,12 +122,14 @@ class Column:
         primary_key: bool = False,
         not_null: bool = False,
         unique: bool = False,
+        default: str | int | None = None,
     ):
         self.type = type
         self.name = name
         self.unique = unique
         self.primary_key = primary_key
         self.not_null = not_null
+        self.default = default
 
     def __repr__(self):
         return f"<Column {self.name} {self.type}>"
@@ -88,8 +144,16 @@ class Column:
             f" {'PRIMARY KEY' if self.primary_key else ''}"
             f" {'NOT NULL' if self.not_null else ''}"
             f" {'UNIQUE' if self.unique else ''}"
+            f" {self._default()}"
         )
 
+    def _default(self) -> str:
+        if self.default is None:
+            return ""
+        if isinstance(self.default, str):
+            return "DEFAULT '{}'".format(self.default.replace("'", "''"))
+        return f"DEFAULT {int(self.default)}"
+
 
 class ForeignKey(Column):
     def __init__(
@@ -111,13 +175,36 @@ class ForeignKey(Column):
         )
 
 
+class Index:
+    def __init__(self, name: str, columns: list[str], *, unique: bool = False):
+        self.name = name
+        self.columns = columns
+        self.unique = unique
+
+    def __repr__(self):
+        return f"<Index {self.name} {self.columns}>"
+
+    def create(self, table: str) -> str:
+        return (
+            f"CREATE {'UNIQUE ' if self.unique else ''}INDEX IF NOT EXISTS"
+            f" {self.name} ON {table} ({', '.join(self.columns)})"
+        )
+
+
 class Table:
     storage = Storage()
     name: str
     columns: list[Column]
+    indexes: list[Index]
     _tables: dict[str, Type["Table"]] = {}
 
-    def __init_subclass__(cls, name: str, columns: list[Column] = [], **kwargs):
+    def __init_subclass__(
+        cls,
+        name: str,
+        columns: list[Column] = [],
+        indexes: list[Index] = [],
+        **kwargs,
+    ):
         if not name:
             raise ValueError("Name is required")
         if not columns:
@@ -125,15 +212,54 @@ class Table:
         if cls.__name__ in cls._tables:
             raise ValueError(f"Table {cls.__name__} already exists")
         cls.columns = columns
+        cls.indexes = indexes
         cls.name = name
         cls._tables[cls.__name__] = cls
-        cls._create_table()
+
+    @classmethod
+    def schema_version(cls) -> int:
+        """Checksum of the schema of all tables, kept in PRAGMA user_version."""
+        schema = "\n".join(
+            f"{table.name} ({', '.join(map(str, table.columns))})"
+            + "".join(f"\n{index.create(table.name)}" for index in table.indexes)
+            for table in cls._tables.values()
+        )
+        return zlib.crc32(schema.encode()) & 0x7FFFFFFF
+
+    @classmethod
+    def create_tables(cls) -> bool:
+        """Create missing tables, columns and indexes, return whether any were."""
+        version = cls.schema_version()
+        if cls.storage.execute("PRAGMA user_version").fetchone()[0] == version:
+            return False
+        # Workers that start together wait here for the first one
+        with cls.storage.transaction(immediate=True) as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] == version:
+                return False
+            for table in cls._tables.values():
+                table._create_table()
+            conn.execute(f"PRAGMA user_version = {version}")
+        logger.info(f"Database schema is at version {version}")
+        return True
 
     @classmethod
     def _create_table(cls):
         _columns = ", ".join(map(str, cls.columns))
         cls.storage.execute(f"CREATE TABLE IF NOT EXISTS {cls.name} ({_columns});")
-        cls.storage.commit()
+        cls._add_missing_columns()
+        for index in cls.indexes:
+            cls.storage.execute(index.create(cls.name))
+
+    @classmethod
+    def _add_missing_columns(cls):
+        """Add columns introduced after the table was created."""
+        cls.storage.execute(f"PRAGMA table_info({cls.name})")
+        existing = {row[1] for row in cls.storage.fetchall()}
+        for column in cls.columns:
+            if isinstance(column, ForeignKey) or column.name in existing:
+                continue
+            logger.info(f"Adding column {column.name} to table {cls.name}")
+            cls.storage.execute(f"ALTER TABLE {cls.name} ADD COLUMN {column}")
 
     @classmethod
     def _insert(cls, data: dict) -> int:
@@ -158,3 +284,4 @@ class Table:
             f"UPDATE {cls.name} SET {columns} WHERE {where_columns}",
             tuple(data.values()) + tuple(where.values()),
         )
+        cls.storage.commit()
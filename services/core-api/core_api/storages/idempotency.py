@@ -0,0 +1,66 @@
+from .connector import Column, Index, Table
+
+
+class IdempotencyKeys(
+    Table,
+    name="idempotency_keys",
+    columns=[
+        Column("key", "TEXT", primary_key=True),
+        Column("fingerprint", "BLOB", not_null=True),
+        Column("created_at", "REAL", not_null=True),
+        Column("expires_at", "REAL", not_null=True),
+        # NULL while the first request runs
+        Column("status_code", "INTEGER"),
+        Column("body", "BLOB"),
+        Column("headers", "JSON"),
+    ],
+    indexes=[
+        Index("idempotency_keys_created_at", ["created_at"]),
+        Index("idempotency_keys_expires_at", ["expires_at"]),
+    ],
+):
+    """Responses of requests with an Idempotency-Key, shared by the workers."""
+
+    @classmethod
+    def claim(
+        cls, key: str, fingerprint: bytes, expires_at: float, now: float, size: int
+    ) -> bool:
+        """Add a pending row for the key, False if the key is taken."""
+        with cls.storage.transaction(immediate=True):
+            cls.storage.execute(f"DELETE FROM {cls.name} WHERE expires_at <= ?", (now,))
+            cls.storage.execute(
+                f"INSERT OR IGNORE INTO {cls.name}"
+                f" (key, fingerprint, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, fingerprint, now, expires_at),
+            )
+            claimed = cls.storage.cursor.rowcount == 1
+            cls.storage.execute(
+                f"DELETE FROM {cls.name} WHERE key IN (SELECT key FROM {cls.name}"
+                f" ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (size,),
+            )
+        return claimed
+
+    @classmethod
+    def get(cls, key: str) -> dict | None:
+        cls.storage.execute(f"SELECT * FROM {cls.name} WHERE key = ?", (key,))
+        return row.dict() if (row := cls.storage.fetchone()) else None
+
+    @classmethod
+    def store(
+        cls, key: str, status_code: int, body: bytes, headers: str, expires_at: float
+    ) -> None:
+        cls.storage.execute(
+            f"UPDATE {cls.name} SET status_code = ?, body = ?, headers = ?,"
+            f" expires_at = ? WHERE key = ?",
+            (status_code, body, headers, expires_at, key),
+        )
+        cls.storage.commit()
+
+    @classmethod
+    def release(cls, key: str) -> None:
+        """Drop the pending row of a request that failed."""
+        cls.storage.execute(
+            f"DELETE FROM {cls.name} WHERE key = ? AND status_code IS NULL", (key,)
+        )
+        cls.storage.commit()
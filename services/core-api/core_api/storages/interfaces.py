@@ -23,6 +23,7 @@ class Interface(BaseModel):
     default_persistent_keepalive: int
 
     enabled: bool
+    node: str = "local"
 
     def to_table_model(self) -> dict:
         data = self.model_dump()
@@ -59,6 +60,7 @@ class Interfaces(
         Column("default_allowed_ips", "TEXT", not_null=True),
         Column("default_persistent_keepalive", "INTEGER", not_null=True),
         Column("enabled", "BOOLEAN", not_null=True),
+        Column("node", "TEXT", not_null=True, default="local"),
     ],
 ):
     @classmethod
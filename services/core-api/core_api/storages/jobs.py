@@ -0,0 +1,47 @@
+from .connector import Column, Index, Table
+
+
+class Jobs(
+    Table,
+    name="jobs",
+    columns=[
+        Column("id", "TEXT", primary_key=True),
+        Column("interface_id", "INTEGER", not_null=True),
+        Column("interface", "TEXT", not_null=True),
+        Column("sync", "BOOLEAN", not_null=True),
+        Column("status", "TEXT", not_null=True),
+        Column("requests", "INTEGER", not_null=True),
+        Column("created_at", "REAL", not_null=True),
+        Column("started_at", "REAL"),
+        Column("finished_at", "REAL"),
+        Column("result", "JSON"),
+    ],
+    indexes=[Index("jobs_finished_at", ["finished_at"])],
+):
+    """Background applies, so every worker process can report their status."""
+
+    @classmethod
+    def save(cls, job: dict) -> None:
+        columns = ", ".join(job)
+        values = ", ".join("?" * len(job))
+        cls.storage.execute(
+            f"INSERT OR REPLACE INTO {cls.name} ({columns}) VALUES ({values})",
+            tuple(job.values()),
+        )
+        cls.storage.commit()
+
+    @classmethod
+    def get(cls, id: str) -> dict | None:
+        cls.storage.execute(f"SELECT * FROM {cls.name} WHERE id = ?", (id,))
+        return row.dict() if (row := cls.storage.fetchone()) else None
+
+    @classmethod
+    def prune(cls, keep: int) -> None:
+        """Delete the finished jobs but the latest `keep`."""
+        cls.storage.execute(
+            f"DELETE FROM {cls.name} WHERE id IN (SELECT id FROM {cls.name}"
+            f" WHERE finished_at IS NOT NULL ORDER BY finished_at DESC"
+            f" LIMIT -1 OFFSET ?)",
+            (keep,),
+        )
+        cls.storage.commit()
@@ -0,0 +1,45 @@
+from typing import Iterable
+
+from .connector import Column, Table
+
+
+class PeerChanges(
+    Table,
+    name="peer_changes",
+    columns=[
+        Column("id", "INTEGER", primary_key=True),
+        Column("peer_id", "INTEGER"),
+    ],
+):
+    """Log of peer and quota writes of every worker, read by the leader worker.
+
+    Quota writes are logged without a peer id.
+    """
+
+    @classmethod
+    def add(cls, peer_ids: Iterable[int | None]) -> None:
+        with cls.storage.transaction() as conn:
+            conn.executemany(
+                f"INSERT INTO {cls.name} (peer_id) VALUES (?)",
+                ((peer_id,) for peer_id in peer_ids),
+            )
+
+    @classmethod
+    def last(cls) -> int:
+        """Id of the latest change, 0 without changes."""
+        cls.storage.execute(f"SELECT COALESCE(MAX(id), 0) FROM {cls.name}")
+        return cls.storage.fetchone()[0]
+
+    @classmethod
+    def since(cls, id: int) -> list[tuple[int, int | None]]:
+        """(id, peer_id) of the changes after `id`, oldest first."""
+        cls.storage.execute(
+            f"SELECT id, peer_id FROM {cls.name} WHERE id > ? ORDER BY id", (id,)
+        )
+        return [(row[0], row[1]) for row in cls.storage.fetchall()]
+
+    @classmethod
+    def prune(cls, id: int) -> None:
+        """Delete the changes before `id`, it is kept so ids keep growing."""
+        cls.storage.execute(f"DELETE FROM {cls.name} WHERE id < ?", (id,))
+        cls.storage.commit()
@@ -1,5 +1,7 @@
-from .connector import Table, Column, ForeignKey
+from .connector import Table, Column, ForeignKey, Index
 from .interfaces import Interface, Interfaces
+from .peer_changes import PeerChanges
+from typing import Iterable, Iterator
 from pydantic import BaseModel
 from ipaddress import IPv4Address, IPv4Interface, IPv6Network, IPv4Network
 
@@ -19,6 +21,14 @@ class Peer(BaseModel):
     remote_dns: str | None
     remote_persistent_keepalive: int | None
 
+    group_name: str | None = None
+
+    enabled: bool = True
+    # Unix time after which the peer is disabled
+    expires_at: int | None = None
+    # rx + tx bytes per accounting month after which the peer is disabled
+    quota: int | None = None
+
     def to_table_model(self) -> dict:
         data = self.model_dump()
         if data["allowed_ips"]:
@@ -61,8 +71,13 @@ class Peers(
         Column("remote_allowed_ips", "TEXT", not_null=False),
         Column("remote_dns", "TEXT", not_null=False),
         Column("remote_persistent_keepalive", "INTEGER", not_null=False),
+        Column("group_name", "TEXT", not_null=False),
+        Column("enabled", "BOOLEAN", not_null=True, default=True),
+        Column("expires_at", "INTEGER", not_null=False),
+        Column("quota", "INTEGER", not_null=False),
         ForeignKey("interface_id", Interfaces),
     ],
+    indexes=[Index("peers_interface_address", ["interface_id", "address"])],
 ):
     @classmethod
     def get(cls, id: int) -> Peer | None:
@@ -112,6 +127,106 @@ class Peers(
         )
         return [Peer.from_table_model(row.dict()) for row in cls.storage.fetchall()]
 
+    @classmethod
+    def get_page(cls, interface: Interface, after: int, limit: int) -> list[Peer]:
+        """Up to `limit` interface peers with an id above `after`, ordered by id."""
+        cls.storage.execute(
+            f"SELECT * FROM {cls.name} WHERE interface_id = ? AND id > ?"
+            f" ORDER BY id LIMIT ?",
+            (interface.id, after, limit),
+        )
+        return [Peer.from_table_model(row.dict()) for row in cls.storage.fetchall()]
+
+    @classmethod
+    def iter_config_rows(cls, interface: Interface) -> Iterator[tuple[str, str, str]]:
+        """Yield (public_key, preshared_key, allowed_ips) of enabled interface peers."""
+        return cls.storage.iterate(
+            f"SELECT public_key, preshared_key,"
+            f" COALESCE(NULLIF(allowed_ips, ''), address || '/32')"
+            f" FROM {cls.name} WHERE interface_id = ? AND enabled",
+            (interface.id,),
+        )
+
+    @classmethod
+    def iter_expiring(cls) -> Iterator[tuple[int, int, int]]:
+        """Yield (id, interface_id, expires_at) of enabled peers with an expiry."""
+        return cls.storage.iterate(
+            f"SELECT id, interface_id, expires_at FROM {cls.name}"
+            f" WHERE enabled AND expires_at IS NOT NULL"
+        )
+
+    @classmethod
+    def get_expiring(cls, ids: list[int]) -> dict[int, tuple[int, int]]:
+        """Enabled peers of `ids` with an expiry, id: (interface_id, expires_at)."""
+        expiring = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start : start + 500]
+            cls.storage.execute(
+                f"SELECT id, interface_id, expires_at FROM {cls.name}"
+                f" WHERE enabled AND expires_at IS NOT NULL"
+                f" AND id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            expiring.update(
+                (row[0], (row[1], row[2])) for row in cls.storage.fetchall()
+            )
+        return expiring
+
+    @classmethod
+    def iter_quotas(cls) -> Iterator[tuple[int, str, int]]:
+        """Yield (interface_id, public_key, quota) of enabled peers with a quota."""
+        return cls.storage.iterate(
+            f"SELECT interface_id, public_key, quota FROM {cls.name}"
+            f" WHERE enabled AND quota IS NOT NULL"
+        )
+
+    @classmethod
+    def update_keys(cls, keys: Iterable[tuple[int, str, str, str]]) -> None:
+        """Set (id, private_key, public_key, preshared_key) of peers in one transaction."""
+        keys = list(keys)
+        with cls.storage.transaction() as conn:
+            conn.executemany(
+                f"UPDATE {cls.name} SET private_key = ?, public_key = ?,"
+                f" preshared_key = ? WHERE id = ?",
+                (
+                    (private_key, public_key, preshared_key, id)
+                    for id, private_key, public_key, preshared_key in keys
+                ),
+            )
+            PeerChanges.add(id for id, *_ in keys)
+
+    @classmethod
+    def disable(cls, ids: Iterable[int]) -> None:
+        ids = list(ids)
+        with cls.storage.transaction() as conn:
+            conn.executemany(
+                f"UPDATE {cls.name} SET enabled = 0 WHERE id = ?",
+                ((id,) for id in ids),
+            )
+            PeerChanges.add(ids)
+
+    @classmethod
+    def disable_by_public_keys(cls, public_keys: Iterable[str]) -> None:
+        public_keys = list(public_keys)
+        with cls.storage.transaction() as conn:
+            conn.executemany(
+                f"UPDATE {cls.name} SET enabled = 0 WHERE public_key = ?",
+                ((public_key,) for public_key in public_keys),
+            )
+            conn.executemany(
+                f"INSERT INTO {PeerChanges.name} (peer_id)"
+                f" SELECT id FROM {cls.name} WHERE public_key = ?",
+                ((public_key,) for public_key in public_keys),
+            )
+
+    @classmethod
+    def iter_groups(cls) -> Iterator[tuple[int, str, str]]:
+        """Yield (interface_id, public_key, group_name) of grouped peers."""
+        return cls.storage.iterate(
+            f"SELECT interface_id, public_key, group_name FROM {cls.name}"
+            f" WHERE group_name IS NOT NULL"
+        )
+
     @classmethod
     def get_all(cls) -> list[Peer]:
         cls.storage.execute(f"SELECT * FROM {cls.name}")
@@ -119,16 +234,68 @@ class Peers(
 
     @classmethod
     def add(cls, peer: Peer) -> int:
-        return cls._insert(peer.to_table_model())
+        with cls.storage.transaction():
+            peer_id = cls._insert(peer.to_table_model())
+            PeerChanges.add([peer_id])
+        return peer_id
+
+    @classmethod
+    def add_many(cls, peers: list[Peer]) -> None:
+        """Insert peers in one transaction, none are added if one conflicts."""
+        if not peers:
+            return
+        rows = [peer.to_table_model() for peer in peers]
+        for row in rows:
+            row.pop("id", None)
+        columns = ", ".join(rows[0].keys())
+        values = ", ".join("?" * len(rows[0]))
+        with cls.storage.transaction() as conn:
+            conn.executemany(
+                f"INSERT INTO {cls.name} ({columns}) VALUES ({values})",
+                (tuple(row.values()) for row in rows),
+            )
+            # Ids are consecutive, no other connection writes until the commit
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            PeerChanges.add(range(last_id - len(rows) + 1, last_id + 1))
+
+    @classmethod
+    def taken_addresses(cls, interface: Interface, addresses: list[str]) -> set[str]:
+        """Addresses of the list that interface peers already have."""
+        if not addresses:
+            return set()
+        cls.storage.execute(
+            f"SELECT address FROM {cls.name} WHERE interface_id = ?"
+            f" AND address IN ({', '.join('?' * len(addresses))})",
+            (interface.id, *addresses),
+        )
+        return {row[0] for row in cls.storage.fetchall()}
+
+    @classmethod
+    def taken_keys(cls, keys: list[str]) -> set[str]:
+        """Keys of the list already used as a public, private or preshared key."""
+        if not keys:
+            return set()
+        placeholders = ", ".join("?" * len(keys))
+        cls.storage.execute(
+            " UNION ".join(
+                f"SELECT {column} FROM {cls.name} WHERE {column} IN ({placeholders})"
+                for column in ("public_key", "private_key", "preshared_key")
+            ),
+            (*keys, *keys, *keys),
+        )
+        return {row[0] for row in cls.storage.fetchall()}
 
     @classmethod
     def update(cls, peer: Peer) -> None:
         base_peer = cls.get(peer.id)
         if not base_peer:
             raise ValueError("Interface not found")
-        cls._update(peer.to_table_model(), {"id": peer.id})
+        with cls.storage.transaction():
+            cls._update(peer.to_table_model(), {"id": peer.id})
+            PeerChanges.add([peer.id])
 
     @classmethod
     def delete(cls, id: int) -> None:
-        cls.storage.execute(f"DELETE FROM {cls.name} WHERE id = ?", (id,))
-        cls.storage.commit()
+        with cls.storage.transaction():
+            cls.storage.execute(f"DELETE FROM {cls.name} WHERE id = ?", (id,))
+            PeerChanges.add([id])
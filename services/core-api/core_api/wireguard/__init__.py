@@ -1 +1,7 @@
-from .wireguard import Wireguard
+def __getattr__(name: str):
+    # Imported lazily, so the agent can use the connectors without the database
+    if name == "Wireguard":
+        from .wireguard import Wireguard
+
+        return Wireguard
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,269 @@
+from datetime import datetime, timezone
+from threading import Lock
+from time import perf_counter, time
+
+import numpy as np
+from loguru import logger
+from pydantic import BaseModel
+
+from ..storages import GroupQuotas, PeerChanges, Peers, TrafficUsage
+from .snapshot import PeerKey
+
+
+class InterfaceUsage(BaseModel):
+    interface_id: int
+    rx: int
+    tx: int
+
+
+class GroupUsage(BaseModel):
+    group: str
+    peers: int
+    rx: int
+    tx: int
+    quota: int | None
+    exceeded: bool
+
+
+class AccountingReport(BaseModel):
+    period: str
+    evaluated_at: float
+    duration: float
+    peers: int
+    interfaces: list[InterfaceUsage]
+    groups: list[GroupUsage]
+
+
+def accounting_period(now: float) -> str:
+    """Calendar month in UTC, e.g. 2024-09."""
+    return datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m")
+
+
+class TrafficAccounting:
+    """Transfer of every peer in the current month, kept in columnar arrays."""
+
+    COLUMNS = (
+        "interface_ids",
+        "groups",
+        "quotas_left",
+        "last_rx",
+        "last_tx",
+        "rx",
+        "tx",
+        "seen",
+    )
+    # Columns of rows without a value
+    EMPTY = {"groups": -1, "quotas_left": -1}
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        refresh_interval: float = 60,
+        checkpoint_interval: float = 60,
+    ) -> None:
+        self.capacity = capacity
+        self.refresh_interval = refresh_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.period: str | None = None
+        self.report: AccountingReport | None = None
+        self._exceeded: list[PeerKey] = []
+        self._exceeded_lock = Lock()
+        self._refreshed_at = 0.0
+        # Latest peer or quota change seen by the last refresh, of any worker
+        self._changes = 0
+        self._checkpointed_at = 0.0
+        self._clear()
+
+    def _clear(self) -> None:
+        self._rows: dict[PeerKey, int] = {}
+        self._keys: list[PeerKey] = []
+        self.interface_ids = np.zeros(self.capacity, np.int64)
+        self.groups = np.full(self.capacity, -1, np.int64)
+        # Byte quota of peers, -1 for peers without one or already reported
+        self.quotas_left = np.full(self.capacity, -1, np.int64)
+        # Counters of the last sample, they start over when an interface restarts
+        self.last_rx = np.zeros(self.capacity, np.int64)
+        self.last_tx = np.zeros(self.capacity, np.int64)
+        # Traffic of the period
+        self.rx = np.zeros(self.capacity, np.int64)
+        self.tx = np.zeros(self.capacity, np.int64)
+        # Rows with a sample to compute deltas from
+        self.seen = np.zeros(self.capacity, bool)
+        self._group_names: list[str] = []
+        self._group_codes: dict[str, int] = {}
+        self.quotas: dict[str, int] = {}
+
+    def _grow(self) -> None:
+        for column in self.COLUMNS:
+            array = getattr(self, column)
+            grown = np.full(len(array) * 2, self.EMPTY.get(column, 0), array.dtype)
+            grown[: len(array)] = array
+            setattr(self, column, grown)
+
+    def _row(self, key: PeerKey) -> int:
+        if (row := self._rows.get(key)) is None:
+            row = self._rows[key] = len(self._keys)
+            self._keys.append(key)
+            if row == len(self.rx):
+                self._grow()
+            self.interface_ids[row] = key[0]
+        return row
+
+    def _group_code(self, name: str) -> int:
+        if (code := self._group_codes.get(name)) is None:
+            code = self._group_codes[name] = len(self._group_names)
+            self._group_names.append(name)
+        return code
+
+    def _refresh(self) -> None:
+        self.groups[:] = -1
+        self._group_names, self._group_codes = [], {}
+        for interface_id, public_key, group_name in Peers.iter_groups():
+            self.groups[self._row((interface_id, public_key))] = self._group_code(
+                group_name
+            )
+        self.quotas = GroupQuotas.get_all()
+        for name in self.quotas:
+            self._group_code(name)
+
+        self.quotas_left[:] = -1
+        for interface_id, public_key, quota in Peers.iter_quotas():
+            self.quotas_left[self._row((interface_id, public_key))] = quota
+
+    def _start_period(self, period: str) -> None:
+        self._clear()
+        self.period = period
+        for interface_id, public_key, rx, tx in TrafficUsage.iter_period(period):
+            row = self._row((interface_id, public_key))
+            self.rx[row], self.tx[row] = rx, tx
+        self._refreshed_at = 0.0
+
+    def checkpoint(self) -> None:
+        if self.period is None:
+            return
+        n = len(self._keys)
+        TrafficUsage.save(
+            self.period,
+            (
+                (interface_id, public_key, int(rx), int(tx))
+                for (interface_id, public_key), rx, tx in zip(
+                    self._keys, self.rx[:n], self.tx[:n]
+                )
+            ),
+        )
+        self._checkpointed_at = time()
+
+    def observe(
+        self, keys: list[PeerKey], rx: list[int], tx: list[int], now: float
+    ) -> AccountingReport:
+        """Add the traffic of one sample and evaluate the totals and quotas."""
+        started = perf_counter()
+        if (period := accounting_period(now)) != self.period:
+            if self.period is not None:
+                self.checkpoint()
+            self._start_period(period)
+
+        new_rows = len(self._keys)
+        rows = np.fromiter(map(self._row, keys), np.int64, len(keys))
+        changes = PeerChanges.last()
+        if (
+            len(self._keys) > new_rows
+            or changes != self._changes
+            or now - self._refreshed_at >= self.refresh_interval
+        ):
+            self._refresh()
+            self._refreshed_at = now
+            self._changes = changes
+
+        current_rx = np.asarray(rx, np.int64)
+        current_tx = np.asarray(tx, np.int64)
+        last_rx, last_tx = self.last_rx[rows], self.last_tx[rows]
+        reset = (current_rx < last_rx) | (current_tx < last_tx)
+        seen = self.seen[rows]
+        self.rx[rows] += np.where(
+            seen, np.where(reset, current_rx, current_rx - last_rx), 0
+        )
+        self.tx[rows] += np.where(
+            seen, np.where(reset, current_tx, current_tx - last_tx), 0
+        )
+        self.last_rx[rows] = current_rx
+        self.last_tx[rows] = current_tx
+        self.seen[rows] = True
+        self._check_quotas(rows)
+
+        if now - self._checkpointed_at >= self.checkpoint_interval:
+            try:
+                self.checkpoint()
+            except Exception:
+                logger.exception("Failed to checkpoint traffic usage")
+
+        self.report = self.evaluate(now, started)
+        return self.report
+
+    def _check_quotas(self, rows: np.ndarray) -> None:
+        """Report peers of the sampled rows that used up their quota, once."""
+        quotas = self.quotas_left[rows]
+        used = self.rx[rows] + self.tx[rows]
+        exceeded = rows[(quotas >= 0) & (used >= quotas)]
+        if not len(exceeded):
+            return
+        self.quotas_left[exceeded] = -1
+        with self._exceeded_lock:
+            self._exceeded.extend(self._keys[row] for row in exceeded.tolist())
+
+    def take_exceeded(self) -> list[PeerKey]:
+        """Peers that exceeded their quota since the last call."""
+        with self._exceeded_lock:
+            exceeded, self._exceeded = self._exceeded, []
+        return exceeded
+
+    def evaluate(self, now: float, started: float | None = None) -> AccountingReport:
+        started = perf_counter() if started is None else started
+        n = len(self._keys)
+        rx, tx = self.rx[:n], self.tx[:n]
+
+        interface_ids, inverse = np.unique(self.interface_ids[:n], return_inverse=True)
+        interface_rx = np.bincount(inverse, rx, len(interface_ids)).astype(np.int64)
+        interface_tx = np.bincount(inverse, tx, len(interface_ids)).astype(np.int64)
+
+        groups = len(self._group_names)
+        grouped = self.groups[:n] >= 0
+        codes = self.groups[:n][grouped]
+        group_peers = np.bincount(codes, minlength=groups)
+        group_rx = np.bincount(codes, rx[grouped], groups).astype(np.int64)
+        group_tx = np.bincount(codes, tx[grouped], groups).astype(np.int64)
+        quotas = np.array(
+            [self.quotas.get(name, -1) for name in self._group_names], np.int64
+        )
+        exceeded = (quotas >= 0) & (group_rx + group_tx >= quotas)
+
+        return AccountingReport(
+            period=self.period or accounting_period(now),
+            evaluated_at=now,
+            duration=perf_counter() - started,
+            peers=n,
+            interfaces=[
+                InterfaceUsage(interface_id=interface_id, rx=r, tx=t)
+                for interface_id, r, t in zip(
+                    interface_ids.tolist(), interface_rx.tolist(), interface_tx.tolist()
+                )
+            ],
+            groups=[
+                GroupUsage(
+                    group=name,
+                    peers=count,
+                    rx=r,
+                    tx=t,
+                    quota=quota if quota >= 0 else None,
+                    exceeded=over,
+                )
+                for name, count, r, t, quota, over in zip(
+                    self._group_names,
+                    group_peers.tolist(),
+                    group_rx.tolist(),
+                    group_tx.tolist(),
+                    quotas.tolist(),
+                    exceeded.tolist(),
+                )
+            ],
+        )
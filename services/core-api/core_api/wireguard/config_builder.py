@@ -1,4 +1,4 @@
-from typing import Self
+from typing import Iterable, Iterator, Self
 
 
 class Block:
@@ -87,4 +87,28 @@ class InterfaceBuilder(Block):
     def add_peer(self, peer: PeerBuilder) -> Self:
         self.peers.append(peer)
         return self
-      
\ No newline at end of file
+
+
+def render_peer(public_key: str, preshared_key: str, allowed_ips: str) -> str:
+    """Render a [Peer] block exactly like PeerBuilder without building one."""
+    lines = ["[Peer]"]
+    if public_key:
+        lines.append(f"PublicKey = {public_key}")
+    if preshared_key:
+        lines.append(f"PresharedKey = {preshared_key}")
+    if allowed_ips:
+        lines.append(f"AllowedIPs = {allowed_ips}")
+    return "\n".join(lines)
+
+
+def render_interface(
+    interface: InterfaceBuilder, peers: Iterable[tuple[str, str, str]]
+) -> Iterator[str]:
+    """Yield the config of `interface` chunk by chunk, identical to `build()`."""
+    yield Block.build(interface).strip()
+    for peer in interface.peers:
+        yield "\n\n"
+        yield peer.build().strip()
+    for row in peers:
+        yield "\n\n"
+        yield render_peer(*row)
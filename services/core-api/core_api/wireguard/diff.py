@@ -0,0 +1,51 @@
+from dataclasses import dataclass, field
+from typing import Iterable, NamedTuple
+
+from .wg_connector import PeerInfo
+
+
+class PeerConfig(NamedTuple):
+    public_key: str
+    preshared_key: str
+    allowed_ips: str
+
+
+@dataclass
+class PeerDiff:
+    upsert: list[PeerConfig] = field(default_factory=list)
+    remove: list[str] = field(default_factory=list)
+    added: int = 0  # peers in `upsert` missing from the kernel
+
+    def __bool__(self) -> bool:
+        return bool(self.upsert or self.remove)
+
+    def __len__(self) -> int:
+        return len(self.upsert) + len(self.remove)
+
+
+def _allowed_ips(value: str) -> frozenset[str]:
+    return frozenset(value.replace(",", " ").split()) - {"(none)"}
+
+
+def _same_allowed_ips(kernel: str, desired: str) -> bool:
+    # The kernel usually reports them in our order, so avoid building sets
+    return kernel == desired.replace(" ", "") or (
+        _allowed_ips(kernel) == _allowed_ips(desired)
+    )
+
+
+def diff_peers(desired: Iterable[PeerConfig], actual: Iterable[PeerInfo]) -> PeerDiff:
+    """Minimal peer operations that turn `actual` kernel state into `desired`."""
+    current = {peer.public_key: peer for peer in actual}
+    diff = PeerDiff()
+    for peer in desired:
+        info = current.pop(peer.public_key, None)
+        if info is None:
+            diff.upsert.append(peer)
+            diff.added += 1
+        elif info.preshared_key != (
+            peer.preshared_key or "(none)"
+        ) or not _same_allowed_ips(info.allowed_ips, peer.allowed_ips):
+            diff.upsert.append(peer)
+    diff.remove.extend(current)
+    return diff
@@ -0,0 +1,146 @@
+import heapq
+from threading import Event, Lock, Thread
+from time import time
+
+from loguru import logger
+
+from ..config import Config
+from ..storages import PeerChanges, Peers
+from .accounting import TrafficAccounting
+from .wireguard import ApplyResult, Peer, Wireguard
+
+
+class PeerEnforcer:
+    """Disables peers that expired or used up their quota."""
+
+    def __init__(
+        self,
+        wireguard: Wireguard | None = None,
+        accounting: TrafficAccounting | None = None,
+        interval: float = Config.Stats.INTERVAL,
+    ) -> None:
+        self.wg = wireguard or Wireguard()
+        self.accounting = accounting
+        self.interval = interval
+        self._lock = Lock()
+        # (expires_at, peer id, interface id)
+        self._heap: list[tuple[int, int, int]] = []
+        # peer id: current expiry, heap entries that differ are stale
+        self._deadlines: dict[int, int] = {}
+        # Latest peer change that was scheduled
+        self._changes = 0
+        self._wake = Event()
+        self._stopped = Event()
+
+    def load(self) -> None:
+        """Schedule all expiring peers, on startup and leadership takeover."""
+        with self._lock:
+            self._changes = PeerChanges.last()
+            self._deadlines = {}
+            self._heap = []
+            for peer_id, interface_id, expires_at in Peers.iter_expiring():
+                self._deadlines[peer_id] = expires_at
+                self._heap.append((expires_at, peer_id, interface_id))
+            heapq.heapify(self._heap)
+        logger.info(f"Loaded {len(self._heap)} peer expiries")
+
+    def schedule(self, peer: Peer) -> None:
+        """Track the expiry of a created or updated peer."""
+        if not peer.enabled or peer.expires_at is None:
+            self._forget(peer.id)
+        else:
+            self._schedule(peer.id, peer.interface_id, peer.expires_at)
+
+    def _forget(self, peer_id: int) -> None:
+        with self._lock:
+            self._deadlines.pop(peer_id, None)
+
+    def _schedule(self, peer_id: int, interface_id: int, expires_at: int) -> None:
+        with self._lock:
+            if self._deadlines.get(peer_id) == expires_at:
+                return
+            self._deadlines[peer_id] = expires_at
+            heapq.heappush(self._heap, (expires_at, peer_id, interface_id))
+            earliest = self._heap[0][0] == expires_at
+        if earliest:
+            self._wake.set()
+
+    def schedule_changes(self) -> None:
+        """Schedule the peers written since the last call, by any worker."""
+        changes = PeerChanges.since(self._changes)
+        if not changes:
+            return
+        peer_ids = list({peer_id for _, peer_id in changes if peer_id is not None})
+        expiring = Peers.get_expiring(peer_ids)
+        for peer_id in peer_ids:
+            if peer_id in expiring:
+                self._schedule(peer_id, *expiring[peer_id])
+            else:
+                self._forget(peer_id)
+        self._changes = changes[-1][0]
+        PeerChanges.prune(self._changes)
+
+    def _due(self, now: float) -> list[tuple[int, int]]:
+        """Pop the (peer id, interface id) of the expired peers."""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, peer_id, interface_id = heapq.heappop(self._heap)
+                if self._deadlines.get(peer_id) != expires_at:
+                    continue
+                del self._deadlines[peer_id]
+                due.append((peer_id, interface_id))
+        return due
+
+    def tick(self, now: float | None = None) -> list[ApplyResult]:
+        now = time() if now is None else now
+        self.schedule_changes()
+        expired = self._due(now)
+        exceeded = self.accounting.take_exceeded() if self.accounting else []
+        if not expired and not exceeded:
+            return []
+
+        if expired:
+            logger.info(f"Disabling {len(expired)} expired peers")
+            Peers.disable(peer_id for peer_id, _ in expired)
+        if exceeded:
+            logger.info(f"Disabling {len(exceeded)} peers over their quota")
+            Peers.disable_by_public_keys(public_key for _, public_key in exceeded)
+
+        interface_ids = {interface_id for _, interface_id in expired} | {
+            interface_id for interface_id, _ in exceeded
+        }
+        interfaces = [
+            interface
+            for interface_id in sorted(interface_ids)
+            if (interface := self.wg.get_interface(interface_id))
+        ]
+        return self.wg.apply_all(self.wg.apply_peers, interfaces)
+
+    def _timeout(self) -> float:
+        with self._lock:
+            if not self._heap:
+                return self.interval
+            return max(0.0, min(self.interval, self._heap[0][0] - time()))
+
+    def run(self) -> None:
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Failed to load peer expiries")
+        while not self._stopped.is_set():
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Failed to enforce peer limits")
+            self._wake.wait(self._timeout())
+            self._wake.clear()
+
+    def start(self) -> Thread:
+        thread = Thread(target=self.run, name="wg-enforcer", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
@@ -0,0 +1,106 @@
+import asyncio
+from threading import Lock
+from typing import AsyncIterator, Literal
+
+from loguru import logger
+from pydantic import BaseModel
+
+from ..config import Config
+
+
+class PeerEvent(BaseModel):
+    type: Literal["handshake", "traffic", "online", "offline"]
+    interface_id: int
+    interface: str
+    public_key: str
+    latest_handshake: int
+    transfer_rx: int
+    transfer_tx: int
+    rx_delta: int = 0
+    tx_delta: int = 0
+    time: float
+
+
+class Subscription:
+    """Bounded queue of the events of one subscriber, dropped once it is full."""
+
+    def __init__(
+        self,
+        bus: "EventBus",
+        interface_ids: set[int] | None,
+        loop: asyncio.AbstractEventLoop,
+        maxsize: int,
+    ) -> None:
+        self.bus = bus
+        self.interface_ids = interface_ids
+        self.loop = loop
+        self.queue: asyncio.Queue[PeerEvent | None] = asyncio.Queue(maxsize)
+        self.dropped = False
+
+    def wants(self, event: PeerEvent) -> bool:
+        return self.interface_ids is None or event.interface_id in self.interface_ids
+
+    def _deliver(self, events: list[PeerEvent]) -> None:
+        """Runs on the subscriber's event loop."""
+        if self.dropped:
+            return
+        for event in events:
+            if self.queue.full():
+                logger.warning("Dropping slow event subscriber")
+                self.dropped = True
+                self.bus.unsubscribe(self)
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                self.queue.put_nowait(None)
+                return
+            self.queue.put_nowait(event)
+
+    async def __aiter__(self) -> AsyncIterator[PeerEvent]:
+        while (event := await self.queue.get()) is not None:
+            yield event
+
+    async def get(self, timeout: float | None = None) -> PeerEvent | None:
+        """Next event, None once dropped. Raises TimeoutError after `timeout`."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """Fans out peer events from the stats sampler thread to async subscribers."""
+
+    def __init__(self, queue_size: int = Config.Stats.SUBSCRIBER_QUEUE) -> None:
+        self.queue_size = queue_size
+        self._subscriptions: set[Subscription] = set()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, interface_ids: set[int] | None = None) -> Subscription:
+        """Subscribe from a running event loop, to all interfaces by default."""
+        subscription = Subscription(
+            self, interface_ids, asyncio.get_running_loop(), self.queue_size
+        )
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, events: list[PeerEvent]) -> None:
+        if not events:
+            return
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            wanted = [event for event in events if subscription.wants(event)]
+            if not wanted:
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, wanted)
+            except RuntimeError:  # The loop is closed
+                self.unsubscribe(subscription)
@@ -0,0 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import perf_counter, time
+from typing import Literal
+from uuid import uuid4
+
+from loguru import logger
+from pydantic import BaseModel
+
+from ..config import Config
+from ..storages import Jobs
+from .wireguard import ApplyResult, Interface, Wireguard
+
+
+class Job(BaseModel):
+    id: str
+    interface_id: int
+    interface: str
+    # Full sync, or only the peer diff
+    sync: bool
+    status: Literal["queued", "running", "done", "failed"] = "queued"
+    # Mutations merged into the job
+    requests: int = 1
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: ApplyResult | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_table_model(self) -> dict:
+        data = self.model_dump(exclude={"result"})
+        data["result"] = self.result.model_dump_json() if self.result else None
+        return data
+
+    @classmethod
+    def from_table_model(cls, data: dict) -> "Job":
+        if data["result"] is not None:
+            data["result"] = ApplyResult.model_validate_json(data["result"])
+        return cls.model_validate(data)
+
+
+class JobQueue:
+    """Applies interfaces in the background on a bounded pool of workers."""
+
+    def __init__(
+        self,
+        wireguard: Wireguard,
+        workers: int = Config.Wireguard.JOB_WORKERS,
+        history: int = Config.Wireguard.JOB_HISTORY,
+    ) -> None:
+        self.wg = wireguard
+        self.history = history
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="wg-job"
+        )
+        self._lock = Lock()
+        # interface id: waiting job and the interface it applies
+        self._queued: dict[int, tuple[Job, Interface]] = {}
+        self._running: set[int] = set()
+
+    def submit(self, interface: Interface, sync: bool) -> Job:
+        with self._lock:
+            if queued := self._queued.get(interface.id):
+                job, _ = queued
+                job.sync = job.sync or sync
+                job.requests += 1
+                self._queued[interface.id] = (job, interface)
+                Jobs.save(job.to_table_model())
+                return job.model_copy()
+
+            job = Job(
+                id=uuid4().hex,
+                interface_id=interface.id,
+                interface=interface.name,
+                sync=sync,
+                created_at=time(),
+            )
+            Jobs.save(job.to_table_model())
+            self._queued[interface.id] = (job, interface)
+            if interface.id not in self._running:
+                self._start(interface.id)
+            return job.model_copy()
+
+    def get(self, id: str) -> Job | None:
+        data = Jobs.get(id)
+        return Job.from_table_model(data) if data else None
+
+    def _start(self, interface_id: int) -> None:
+        self._running.add(interface_id)
+        self._pool.submit(self._run, interface_id)
+
+    def _run(self, interface_id: int) -> None:
+        with self._lock:
+            job, interface = self._queued.pop(interface_id)
+        started = perf_counter()
+        try:
+            job.status = "running"
+            job.started_at = time()
+            Jobs.save(job.to_table_model())
+            job.result = self.wg.run_apply(
+                lambda interface: self.wg.apply_changed(interface, job.sync), interface
+            )
+        except Exception as e:
+            logger.exception(f"Job {job.id} for interface {job.interface} failed")
+            job.result = ApplyResult(
+                interface_id=interface_id,
+                name=job.interface,
+                ok=False,
+                error=str(e) or type(e).__name__,
+                duration=perf_counter() - started,
+            )
+        finally:
+            # The next job of the interface starts even if this one broke down
+            job.status = "done" if job.result and job.result.ok else "failed"
+            job.finished_at = time()
+            with self._lock:
+                self._running.discard(interface_id)
+                if interface_id in self._queued:
+                    self._start(interface_id)
+            self._finish(job)
+
+    def _finish(self, job: Job) -> None:
+        try:
+            Jobs.save(job.to_table_model())
+            Jobs.prune(self.history)
+        except Exception:
+            logger.exception(f"Failed to store job {job.id}")
+        logger.info(
+            f"Job {job.id} {job.status} for interface {job.interface}"
+            f" after {job.finished_at - (job.started_at or job.created_at):.3f}s,"
+            f" {job.requests} requests merged"
+        )
+
+    def stop(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,26 @@
+"""WireGuard keys without running `wg genkey`/`wg pubkey`/`wg genpsk`."""
+
+from base64 import b64decode, b64encode
+from secrets import token_bytes
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+
+def genkey() -> str:
+    private_key = bytearray(token_bytes(32))
+    # Clamped like `wg genkey`
+    private_key[0] &= 248
+    private_key[31] = (private_key[31] & 127) | 64
+    return b64encode(private_key).decode()
+
+
+def pubkey(private_key: str) -> str:
+    public_key = X25519PrivateKey.from_private_bytes(
+        b64decode(private_key)
+    ).public_key()
+    return b64encode(public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)).decode()
+
+
+def genpsk() -> str:
+    return b64encode(token_bytes(32)).decode()
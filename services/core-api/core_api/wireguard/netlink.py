@@ -0,0 +1,375 @@
+import os
+import socket
+import struct
+from base64 import b64decode, b64encode
+from ipaddress import ip_address, ip_network
+from itertools import islice
+from threading import local
+from typing import TYPE_CHECKING, Generator, Iterable, Iterator, Protocol
+
+from loguru import logger
+
+from .wg_connector import SubprocessWG, InterfaceInfo, PeerInfo
+
+if TYPE_CHECKING:
+    from .diff import PeerConfig
+
+
+NETLINK_GENERIC = 16
+
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 0x2
+NLMSG_DONE = 0x3
+
+NLA_F_NESTED = 1 << 15
+NLA_TYPE_MASK = ~(NLA_F_NESTED | (1 << 14)) & 0xFFFF
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+WG_GENL_NAME = "wireguard"
+WG_GENL_VERSION = 1
+WG_CMD_GET_DEVICE = 0
+WG_CMD_SET_DEVICE = 1
+
+WGDEVICE_A_IFNAME = 2
+WGDEVICE_A_PRIVATE_KEY = 3
+WGDEVICE_A_PUBLIC_KEY = 4
+WGDEVICE_A_LISTEN_PORT = 6
+WGDEVICE_A_FWMARK = 7
+WGDEVICE_A_PEERS = 8
+
+WGPEER_A_PUBLIC_KEY = 1
+WGPEER_A_PRESHARED_KEY = 2
+WGPEER_A_FLAGS = 3
+WGPEER_A_ENDPOINT = 4
+WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL = 5
+WGPEER_A_LAST_HANDSHAKE_TIME = 6
+WGPEER_A_RX_BYTES = 7
+WGPEER_A_TX_BYTES = 8
+WGPEER_A_ALLOWEDIPS = 9
+
+WGPEER_F_REMOVE_ME = 1 << 0
+WGPEER_F_REPLACE_ALLOWEDIPS = 1 << 1
+
+WGALLOWEDIP_A_FAMILY = 1
+WGALLOWEDIP_A_IPADDR = 2
+WGALLOWEDIP_A_CIDR_MASK = 3
+
+KEY_LENGTH = 32
+EMPTY_KEY = bytes(KEY_LENGTH)
+SYSFS_NET = "/sys/class/net"
+RECV_BUFFER = 1 << 16
+SET_PEERS_BATCH = 256
+
+NLMSG_HDR = struct.Struct("=IHHII")
+GENL_HDR = struct.Struct("=BBH")
+NLA_HDR = struct.Struct("=HH")
+
+
+class NetlinkError(OSError):
+    pass
+
+
+class NetlinkSocket(Protocol):
+    def send(self, data: bytes, /) -> int: ...
+
+    def recv(self, size: int, /) -> bytes: ...
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def attr(type: int, payload: bytes) -> bytes:
+    length = NLA_HDR.size + len(payload)
+    return NLA_HDR.pack(length, type) + payload + bytes(_align(length) - length)
+
+
+def nested(type: int, attrs: Iterable[bytes]) -> bytes:
+    return attr(type | NLA_F_NESTED, b"".join(attrs))
+
+
+def parse_attrs(data: bytes) -> Iterator[tuple[int, bytes]]:
+    offset = 0
+    while offset + NLA_HDR.size <= len(data):
+        length, type = NLA_HDR.unpack_from(data, offset)
+        if length < NLA_HDR.size:
+            break
+        yield type & NLA_TYPE_MASK, data[offset + NLA_HDR.size : offset + length]
+        offset += _align(length)
+
+
+def _key(value: bytes) -> str:
+    return b64encode(value).decode() if value != EMPTY_KEY else "(none)"
+
+
+def _endpoint(value: bytes) -> str:
+    family, port = struct.unpack_from("=H2s", value)
+    port = int.from_bytes(port, "big")
+    if family == socket.AF_INET:
+        return f"{ip_address(value[4:8])}:{port}"
+    if family == socket.AF_INET6:
+        return f"[{ip_address(value[8:24])}]:{port}"
+    return "(none)"
+
+
+def _allowed_ip(value: bytes) -> str:
+    family = address = cidr = None
+    for type, payload in parse_attrs(value):
+        if type == WGALLOWEDIP_A_FAMILY:
+            (family,) = struct.unpack("=H", payload)
+        elif type == WGALLOWEDIP_A_IPADDR:
+            address = payload
+        elif type == WGALLOWEDIP_A_CIDR_MASK:
+            (cidr,) = struct.unpack("=B", payload)
+    if family not in (socket.AF_INET, socket.AF_INET6) or address is None:
+        raise NetlinkError(f"Malformed allowed IP for family {family}")
+    return f"{ip_address(address)}/{cidr}"
+
+
+def _peer(value: bytes) -> PeerInfo:
+    peer = PeerInfo("", "(none)", "(none)", "", 0, 0, 0, None)
+    allowed_ips: list[str] = []
+    for type, payload in parse_attrs(value):
+        if type == WGPEER_A_PUBLIC_KEY:
+            peer.public_key = _key(payload)
+        elif type == WGPEER_A_PRESHARED_KEY:
+            peer.preshared_key = _key(payload)
+        elif type == WGPEER_A_ENDPOINT:
+            peer.endpoint = _endpoint(payload)
+        elif type == WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL:
+            peer.persistent_keepalive = struct.unpack("=H", payload)[0] or None
+        elif type == WGPEER_A_LAST_HANDSHAKE_TIME:
+            peer.latest_handshake = struct.unpack_from("=q", payload)[0]
+        elif type == WGPEER_A_RX_BYTES:
+            (peer.transfer_rx,) = struct.unpack("=Q", payload)
+        elif type == WGPEER_A_TX_BYTES:
+            (peer.transfer_tx,) = struct.unpack("=Q", payload)
+        elif type == WGPEER_A_ALLOWEDIPS:
+            allowed_ips.extend(_allowed_ip(item) for _, item in parse_attrs(payload))
+    peer.allowed_ips = ",".join(allowed_ips) or "(none)"
+    return peer
+
+
+def _encode_allowed_ip(network: str) -> bytes:
+    network = ip_network(network.strip(), strict=False)
+    return nested(
+        0,
+        [
+            attr(
+                WGALLOWEDIP_A_FAMILY,
+                struct.pack(
+                    "=H", socket.AF_INET if network.version == 4 else socket.AF_INET6
+                ),
+            ),
+            attr(WGALLOWEDIP_A_IPADDR, network.network_address.packed),
+            attr(WGALLOWEDIP_A_CIDR_MASK, struct.pack("=B", network.prefixlen)),
+        ],
+    )
+
+
+def _encode_peer(peer: "PeerConfig") -> bytes:
+    return nested(
+        0,
+        [
+            attr(WGPEER_A_PUBLIC_KEY, b64decode(peer.public_key)),
+            attr(
+                WGPEER_A_PRESHARED_KEY,
+                b64decode(peer.preshared_key) if peer.preshared_key else EMPTY_KEY,
+            ),
+            attr(WGPEER_A_FLAGS, struct.pack("=I", WGPEER_F_REPLACE_ALLOWEDIPS)),
+            nested(
+                WGPEER_A_ALLOWEDIPS,
+                [
+                    _encode_allowed_ip(network)
+                    for network in peer.allowed_ips.replace(",", " ").split()
+                ],
+            ),
+        ],
+    )
+
+
+def _encode_removal(public_key: str) -> bytes:
+    return nested(
+        0,
+        [
+            attr(WGPEER_A_PUBLIC_KEY, b64decode(public_key)),
+            attr(WGPEER_A_FLAGS, struct.pack("=I", WGPEER_F_REMOVE_ME)),
+        ],
+    )
+
+
+class WireguardNetlink:
+    """Client of the kernel WireGuard generic netlink family."""
+
+    def __init__(self, sock: NetlinkSocket | None = None) -> None:
+        self.sock = sock or self._open()
+        self.seq = 0
+        self.family_id = self._resolve_family()
+
+    @staticmethod
+    def _open() -> socket.socket:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        sock.bind((0, 0))
+        return sock
+
+    def _request(self, type: int, flags: int, payload: bytes) -> list[bytes]:
+        """Send a request and return the payloads of the replies."""
+        self.seq += 1
+        self.sock.send(
+            NLMSG_HDR.pack(
+                NLMSG_HDR.size + len(payload),
+                type,
+                NLM_F_REQUEST | flags,
+                self.seq,
+                0,
+            )
+            + payload
+        )
+        replies: list[bytes] = []
+        while True:
+            data = self.sock.recv(RECV_BUFFER)
+            offset = 0
+            while offset + NLMSG_HDR.size <= len(data):
+                length, msg_type, _, seq, _ = NLMSG_HDR.unpack_from(data, offset)
+                body = data[offset + NLMSG_HDR.size : offset + length]
+                offset += _align(length)
+                if seq != self.seq:
+                    continue
+                if msg_type == NLMSG_ERROR:
+                    (error,) = struct.unpack_from("=i", body)
+                    if error:
+                        raise NetlinkError(-error, os.strerror(-error))
+                    return replies
+                if msg_type == NLMSG_DONE:
+                    return replies
+                replies.append(body[GENL_HDR.size :])
+
+    def _resolve_family(self) -> int:
+        replies = self._request(
+            GENL_ID_CTRL,
+            NLM_F_ACK,
+            GENL_HDR.pack(CTRL_CMD_GETFAMILY, 1, 0)
+            + attr(CTRL_ATTR_FAMILY_NAME, WG_GENL_NAME.encode() + b"\0"),
+        )
+        for reply in replies:
+            for type, payload in parse_attrs(reply):
+                if type == CTRL_ATTR_FAMILY_ID:
+                    return struct.unpack("=H", payload)[0]
+        raise NetlinkError(f"Generic netlink family {WG_GENL_NAME} not found")
+
+    def get_device(self, interface_name: str) -> InterfaceInfo:
+        replies = self._request(
+            self.family_id,
+            NLM_F_DUMP,
+            GENL_HDR.pack(WG_CMD_GET_DEVICE, WG_GENL_VERSION, 0)
+            + attr(WGDEVICE_A_IFNAME, interface_name.encode() + b"\0"),
+        )
+        info = InterfaceInfo(interface_name, "(none)", "(none)", 0, "off")
+        for reply in replies:
+            for type, payload in parse_attrs(reply):
+                if type == WGDEVICE_A_PRIVATE_KEY:
+                    info.private_key = _key(payload)
+                elif type == WGDEVICE_A_PUBLIC_KEY:
+                    info.public_key = _key(payload)
+                elif type == WGDEVICE_A_LISTEN_PORT:
+                    (info.listen_port,) = struct.unpack("=H", payload)
+                elif type == WGDEVICE_A_FWMARK:
+                    fwmark = struct.unpack("=I", payload)[0]
+                    info.fwmark = hex(fwmark) if fwmark else "off"
+                elif type == WGDEVICE_A_PEERS:
+                    for _, item in parse_attrs(payload):
+                        peer = _peer(item)
+                        # A peer with many allowed IPs continues in the next message
+                        if info.peers and info.peers[-1].public_key == peer.public_key:
+                            info.peers[-1].allowed_ips += f",{peer.allowed_ips}"
+                        else:
+                            info.peers.append(peer)
+        return info
+
+    def set_peers(
+        self,
+        interface_name: str,
+        peers: Iterable["PeerConfig"] = (),
+        remove: Iterable[str] = (),
+    ) -> None:
+        encoded = iter(
+            [
+                *(_encode_peer(peer) for peer in peers),
+                *(_encode_removal(public_key) for public_key in remove),
+            ]
+        )
+        while batch := list(islice(encoded, SET_PEERS_BATCH)):
+            self._request(
+                self.family_id,
+                NLM_F_ACK,
+                GENL_HDR.pack(WG_CMD_SET_DEVICE, WG_GENL_VERSION, 0)
+                + attr(WGDEVICE_A_IFNAME, interface_name.encode() + b"\0")
+                + nested(WGDEVICE_A_PEERS, batch),
+            )
+
+
+class NetlinkWG(SubprocessWG):
+    """WG backend that reads and updates devices over generic netlink."""
+
+    _local = local()
+    _unavailable = False
+
+    @staticmethod
+    def _client() -> WireguardNetlink | None:
+        if NetlinkWG._unavailable:
+            return None
+        if (client := getattr(NetlinkWG._local, "client", None)) is None:
+            try:
+                client = NetlinkWG._local.client = WireguardNetlink()
+            except OSError as e:
+                logger.warning(f"WireGuard netlink is unavailable, using wg: {e}")
+                NetlinkWG._unavailable = True
+                return None
+        return client
+
+    @staticmethod
+    def interfaces() -> list[str]:
+        if NetlinkWG._client() is None:
+            return SubprocessWG.interfaces()
+        names = []
+        for name in sorted(os.listdir(SYSFS_NET)):
+            try:
+                with open(os.path.join(SYSFS_NET, name, "uevent")) as f:
+                    if "DEVTYPE=wireguard" in f.read():
+                        names.append(name)
+            except OSError:
+                continue
+        return names
+
+    @staticmethod
+    def get_interface_info(interface_name: str) -> InterfaceInfo:
+        if (client := NetlinkWG._client()) is None:
+            return SubprocessWG.get_interface_info(interface_name)
+        return client.get_device(interface_name)
+
+    @staticmethod
+    def get_interfaces_info() -> Generator[InterfaceInfo, None, None]:
+        if (client := NetlinkWG._client()) is None:
+            yield from SubprocessWG.get_interfaces_info()
+            return
+        for interface_name in NetlinkWG.interfaces():
+            try:
+                yield client.get_device(interface_name)
+            except NetlinkError as e:
+                logger.warning(f"Failed to read interface {interface_name}: {e}")
+
+    @staticmethod
+    def set_peers(
+        interface_name: str,
+        peers: Iterable["PeerConfig"] = (),
+        remove: Iterable[str] = (),
+    ) -> None:
+        if (client := NetlinkWG._client()) is None:
+            return SubprocessWG.set_peers(interface_name, peers, remove)
+        client.set_peers(interface_name, peers, remove)
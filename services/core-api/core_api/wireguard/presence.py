@@ -0,0 +1,85 @@
+from bisect import bisect_left
+from threading import Lock
+
+
+class PresenceIndex:
+    """Peers of every interface ordered by their last handshake."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        # interface id: public key: latest handshake
+        self._handshakes: dict[int, dict[str, int]] = {}
+        # interface id: sorted (latest handshake, public key)
+        self._order: dict[int, list[tuple[int, str]]] = {}
+        # Interfaces changed since their order was sorted, it is sorted again
+        # on the next read, so a sample pays one sort instead of one per peer
+        self._changed: set[int] = set()
+
+    def update(self, interface_id: int, public_key: str, latest_handshake: int) -> None:
+        with self._lock:
+            handshakes = self._handshakes.setdefault(interface_id, {})
+            if handshakes.get(public_key) == latest_handshake:
+                return
+            handshakes[public_key] = latest_handshake
+            self._changed.add(interface_id)
+
+    def remove(self, interface_id: int, public_key: str) -> None:
+        with self._lock:
+            handshakes = self._handshakes.get(interface_id, {})
+            if handshakes.pop(public_key, None) is None:
+                return
+            self._changed.add(interface_id)
+            if not handshakes:
+                del self._handshakes[interface_id]
+
+    def _sorted(self, interface_id: int) -> list[tuple[int, str]]:
+        if interface_id in self._changed:
+            self._changed.discard(interface_id)
+            if handshakes := self._handshakes.get(interface_id):
+                self._order[interface_id] = sorted(
+                    (handshake, public_key)
+                    for public_key, handshake in handshakes.items()
+                )
+            else:
+                self._order.pop(interface_id, None)
+        return self._order.get(interface_id, [])
+
+    def online(self, interface_id: int, since: int) -> list[tuple[str, int]]:
+        """(public key, latest handshake) of peers with a handshake at `since`
+        or later, most recent first."""
+        with self._lock:
+            order = self._sorted(interface_id)
+            start = bisect_left(order, (since, ""))
+            return [(key, handshake) for handshake, key in reversed(order[start:])]
+
+    def count(self, interface_id: int, since: int) -> int:
+        with self._lock:
+            order = self._sorted(interface_id)
+            return len(order) - bisect_left(order, (since, ""))
+
+    def counts(self, since: int) -> dict[int, int]:
+        with self._lock:
+            for interface_id in list(self._changed):
+                self._sorted(interface_id)
+            return {
+                interface_id: len(order) - bisect_left(order, (since, ""))
+                for interface_id, order in self._order.items()
+            }
+
+    def dump(self) -> dict[int, dict[str, int]]:
+        with self._lock:
+            return {
+                interface_id: dict(handshakes)
+                for interface_id, handshakes in self._handshakes.items()
+            }
+
+    def restore(self, handshakes: dict[int, dict[str, int]]) -> None:
+        handshakes = {
+            interface_id: dict(peers)
+            for interface_id, peers in handshakes.items()
+            if peers
+        }
+        with self._lock:
+            self._handshakes = handshakes
+            self._order = {}
+            self._changed = set(handshakes)
@@ -0,0 +1,176 @@
+from threading import Event, Lock, Thread
+from time import perf_counter
+
+from loguru import logger
+from pydantic import BaseModel
+
+from ..config import Config
+from .diff import PeerDiff
+from .wireguard import ApplyResult, Interface, Wireguard
+
+
+class ReconcileReport(BaseModel):
+    duration: float
+    synced: list[str]
+    peer_operations: dict[str, int]
+    peers_added: int
+    peers_updated: int
+    peers_removed: int
+    results: list[ApplyResult]
+
+
+class ReconcileMetrics:
+    """Counters of the reconcile passes in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.passes = 0
+        self.errors = 0
+        self.last_duration = 0.0
+        self.interfaces_synced = 0
+        self.peers_added = 0
+        self.peers_updated = 0
+        self.peers_removed = 0
+        # interface name: peer operations of the last pass
+        self.drift: dict[str, int] = {}
+
+    def observe(self, report: ReconcileReport) -> None:
+        with self._lock:
+            self.passes += 1
+            self.errors += sum(not result.ok for result in report.results)
+            self.last_duration = report.duration
+            self.interfaces_synced += len(report.synced)
+            self.peers_added += report.peers_added
+            self.peers_updated += report.peers_updated
+            self.peers_removed += report.peers_removed
+            self.drift = dict(report.peer_operations)
+
+    def observe_failure(self) -> None:
+        with self._lock:
+            self.passes += 1
+            self.errors += 1
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# TYPE wghub_reconcile_passes_total counter",
+                f"wghub_reconcile_passes_total {self.passes}",
+                "# TYPE wghub_reconcile_errors_total counter",
+                f"wghub_reconcile_errors_total {self.errors}",
+                "# TYPE wghub_reconcile_last_duration_seconds gauge",
+                f"wghub_reconcile_last_duration_seconds {self.last_duration:.6f}",
+                "# TYPE wghub_reconcile_interfaces_synced_total counter",
+                f"wghub_reconcile_interfaces_synced_total {self.interfaces_synced}",
+                "# TYPE wghub_reconcile_peers_added_total counter",
+                f"wghub_reconcile_peers_added_total {self.peers_added}",
+                "# TYPE wghub_reconcile_peers_updated_total counter",
+                f"wghub_reconcile_peers_updated_total {self.peers_updated}",
+                "# TYPE wghub_reconcile_peers_removed_total counter",
+                f"wghub_reconcile_peers_removed_total {self.peers_removed}",
+                "# TYPE wghub_drift_peers gauge",
+                *(
+                    f'wghub_drift_peers{{interface="{name}"}} {count}'
+                    for name, count in sorted(self.drift.items())
+                ),
+            ]
+        return "\n".join(lines) + "\n"
+
+
+class Reconciler:
+    """Brings kernel WireGuard state in line with the database, every `interval`."""
+
+    def __init__(
+        self,
+        wireguard: Wireguard | None = None,
+        interval: float = Config.Wireguard.RECONCILE_INTERVAL,
+    ) -> None:
+        self.wg = wireguard or Wireguard()
+        self.interval = interval
+        self.ready = Event()
+        self.report: ReconcileReport | None = None
+        self.metrics = ReconcileMetrics()
+        self._stopped = Event()
+
+    def reconcile(self) -> ReconcileReport:
+        started = perf_counter()
+        interfaces = self.wg.interfaces
+        dumps = self.wg.get_interfaces_info()
+        running = {
+            (node, info.name): info for node, infos in dumps.items() for info in infos
+        }
+
+        unknown = running.keys() - {
+            (interface.node, interface.name) for interface in interfaces
+        }
+        if unknown:
+            logger.warning(f"Interfaces not managed by core-api: {sorted(unknown)}")
+        # Nodes that could not be read are retried on the next pass
+        interfaces = [interface for interface in interfaces if interface.node in dumps]
+
+        synced: list[str] = []
+        diffs: dict[str, PeerDiff] = {}
+
+        def apply(interface: Interface) -> None:
+            info = running.get((interface.node, interface.name))
+            if info is None or not interface.enabled:
+                self.wg.sync_interface(interface)
+                synced.append(interface.name)
+            elif self.wg.needs_restart(interface, info):
+                self.wg.sync_interface(interface, restart=True)
+                synced.append(interface.name)
+            else:
+                diffs[interface.name] = self.wg.apply_peer_diff(interface, info)
+
+        results = self.wg.apply_all(
+            apply,
+            [
+                interface
+                for interface in interfaces
+                if interface.enabled or (interface.node, interface.name) in running
+            ],
+        )
+        return ReconcileReport(
+            duration=perf_counter() - started,
+            synced=synced,
+            peer_operations={name: len(diff) for name, diff in diffs.items()},
+            peers_added=sum(diff.added for diff in diffs.values()),
+            peers_updated=sum(len(diff.upsert) - diff.added for diff in diffs.values()),
+            peers_removed=sum(len(diff.remove) for diff in diffs.values()),
+            results=results,
+        )
+
+    def reconcile_once(self) -> None:
+        try:
+            self.report = self.reconcile()
+        except Exception:
+            logger.exception("Failed to reconcile interfaces")
+            self.metrics.observe_failure()
+            return
+        self.metrics.observe(self.report)
+        if self.report.synced or any(self.report.peer_operations.values()):
+            logger.info(
+                f"Reconciled drift in {self.report.duration:.3f}s:"
+                f" synced {self.report.synced},"
+                f" peer operations {self.report.peer_operations}"
+            )
+
+    def run(self) -> None:
+        logger.info("Reconciling interfaces")
+        try:
+            self.reconcile_once()
+        finally:
+            self.ready.set()
+        logger.info("Interfaces reconciled")
+
+        if self.interval <= 0:
+            return
+        while not self._stopped.wait(self.interval):
+            self.reconcile_once()
+
+    def start(self) -> Thread:
+        thread = Thread(target=self.run, name="wg-reconciler", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stopped.set()
@@ -0,0 +1,208 @@
+from threading import Event, Thread
+from time import time
+from typing import Callable
+
+from loguru import logger
+
+from ..config import Config
+from .accounting import TrafficAccounting
+from .events import EventBus, PeerEvent
+from .presence import PresenceIndex
+from .snapshot import PeerStats, StatsSnapshot
+from .wg_connector import PeerInfo
+from .wireguard import Wireguard
+
+
+class PeerState:
+    """Counters of a peer at the last sample and at its last traffic event."""
+
+    __slots__ = (
+        "node",
+        "interface_id",
+        "interface",
+        "public_key",
+        "latest_handshake",
+        "rx",
+        "tx",
+        "reported_rx",
+        "reported_tx",
+        "online",
+    )
+
+    def __init__(
+        self,
+        node: str,
+        interface_id: int,
+        interface: str,
+        peer: PeerInfo,
+        online: bool,
+    ) -> None:
+        self.node = node
+        self.interface_id = interface_id
+        self.interface = interface
+        self.public_key = peer.public_key
+        self.latest_handshake = peer.latest_handshake
+        self.rx = self.reported_rx = peer.transfer_rx
+        self.tx = self.reported_tx = peer.transfer_tx
+        self.online = online
+
+    def event(
+        self, type: str, now: float, rx_delta: int = 0, tx_delta: int = 0
+    ) -> PeerEvent:
+        return PeerEvent(
+            type=type,
+            interface_id=self.interface_id,
+            interface=self.interface,
+            public_key=self.public_key,
+            latest_handshake=self.latest_handshake,
+            transfer_rx=self.rx,
+            transfer_tx=self.tx,
+            rx_delta=rx_delta,
+            tx_delta=tx_delta,
+            time=now,
+        )
+
+
+class StatsSampler:
+    """Samples peer stats of all nodes and publishes what changed."""
+
+    def __init__(
+        self,
+        wireguard: Wireguard | None = None,
+        bus: EventBus | None = None,
+        interval: float = Config.Stats.INTERVAL,
+        traffic_threshold: int = Config.Stats.TRAFFIC_THRESHOLD,
+        online_window: int = Config.Stats.ONLINE_WINDOW,
+    ) -> None:
+        self.wg = wireguard or Wireguard()
+        self.bus = bus or EventBus()
+        self.presence = PresenceIndex()
+        self.snapshot = StatsSnapshot()
+        self.accounting = TrafficAccounting()
+        self.interval = interval
+        self.traffic_threshold = traffic_threshold
+        self.online_window = online_window
+        # (interface id, public key): state at the last sample
+        self._peers: dict[tuple[int, str], PeerState] = {}
+        self._sampled = False
+        self._stopped = Event()
+        # Called with the events of every sample
+        self.on_sample: Callable[[list[PeerEvent]], None] | None = None
+
+    def _update(self, state: PeerState, peer: PeerInfo, now: float) -> list[PeerEvent]:
+        online = now - peer.latest_handshake <= self.online_window
+        handshake = peer.latest_handshake > state.latest_handshake
+        if peer.transfer_rx < state.rx or peer.transfer_tx < state.tx:
+            # Counters were reset by an interface restart
+            state.reported_rx, state.reported_tx = peer.transfer_rx, peer.transfer_tx
+        if peer.latest_handshake != state.latest_handshake:
+            self.presence.update(
+                state.interface_id, state.public_key, peer.latest_handshake
+            )
+        state.latest_handshake = peer.latest_handshake
+        state.rx, state.tx = peer.transfer_rx, peer.transfer_tx
+
+        events = []
+        if online != state.online:
+            state.online = online
+            events.append(state.event("online" if online else "offline", now))
+        if handshake:
+            events.append(state.event("handshake", now))
+        rx_delta = state.rx - state.reported_rx
+        tx_delta = state.tx - state.reported_tx
+        if rx_delta + tx_delta >= self.traffic_threshold:
+            events.append(state.event("traffic", now, rx_delta, tx_delta))
+            state.reported_rx, state.reported_tx = state.rx, state.tx
+        return events
+
+    def sample(self, now: float | None = None) -> list[PeerEvent]:
+        """Take one sample, publish and return the changes."""
+        now = time() if now is None else now
+        interfaces = {
+            (interface.node, interface.name): interface
+            for interface in self.wg.interfaces
+        }
+        running = self.wg.get_interfaces_info()
+
+        events: list[PeerEvent] = []
+        changed: list[PeerStats] = []
+        seen: set[tuple[int, str]] = set()
+        # Counters in sample order for the accounting
+        keys: list[tuple[int, str]] = []
+        rx: list[int] = []
+        tx: list[int] = []
+        for node, infos in running.items():
+            for info in infos:
+                if (interface := interfaces.get((node, info.name))) is None:
+                    continue
+                for peer in info.peers:
+                    key = (interface.id, peer.public_key)
+                    seen.add(key)
+                    keys.append(key)
+                    rx.append(peer.transfer_rx)
+                    tx.append(peer.transfer_tx)
+                    state = self._peers.get(key)
+                    if state is None or (
+                        peer.latest_handshake != state.latest_handshake
+                        or peer.transfer_rx != state.rx
+                        or peer.transfer_tx != state.tx
+                    ):
+                        changed.append(
+                            PeerStats(
+                                interface_id=interface.id,
+                                public_key=peer.public_key,
+                                latest_handshake=peer.latest_handshake,
+                                transfer_rx=peer.transfer_rx,
+                                transfer_tx=peer.transfer_tx,
+                            )
+                        )
+                    if state is None:
+                        # New peers start offline, so coming online is reported
+                        state = self._peers[key] = PeerState(
+                            node, interface.id, interface.name, peer, False
+                        )
+                        self.presence.update(
+                            interface.id, peer.public_key, peer.latest_handshake
+                        )
+                    changes = self._update(state, peer, now)
+                    if self._sampled:
+                        events.extend(changes)
+
+        # Removed peers and stopped interfaces, unless their node could not be read
+        removed = [
+            key
+            for key, state in self._peers.items()
+            if key not in seen and state.node in running
+        ]
+        for key in removed:
+            state = self._peers.pop(key)
+            self.presence.remove(*key)
+            if state.online and self._sampled:
+                events.append(state.event("offline", now))
+
+        self.snapshot.apply(changed, removed)
+        self.accounting.observe(keys, rx, tx, now)
+        self._sampled = True
+        self.bus.publish(events)
+        return events
+
+    def sample_once(self) -> None:
+        try:
+            events = self.sample()
+            if self.on_sample:
+                self.on_sample(events)
+        except Exception:
+            logger.exception("Failed to sample peer stats")
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            self.sample_once()
+            self._stopped.wait(self.interval)
+
+    def start(self) -> Thread:
+        thread = Thread(target=self.run, name="wg-stats", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stopped.set()
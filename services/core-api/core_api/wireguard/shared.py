@@ -0,0 +1,132 @@
+import os
+from threading import Event, Thread
+from time import time
+from typing import Callable
+
+from loguru import logger
+from pydantic import BaseModel
+
+from ..config import Config
+from ..files import AtomicFile, FileLock
+from .accounting import AccountingReport
+from .events import PeerEvent
+from .reconciler import ReconcileReport, Reconciler
+from .sampler import StatsSampler
+from .snapshot import SnapshotState
+
+
+class SharedState(BaseModel):
+    pid: int
+    sample: int
+    time: float
+    ready: bool
+    reconcile: ReconcileReport | None
+    snapshot: SnapshotState
+    # interface id: public key: latest handshake
+    presence: dict[int, dict[str, int]]
+    accounting: AccountingReport | None
+    # Events of the sample
+    events: list[PeerEvent]
+
+
+class SharedStats:
+    """Stats of the leader worker, shared with the other worker processes."""
+
+    def __init__(
+        self,
+        sampler: StatsSampler,
+        reconciler: Reconciler,
+        path: str = Config.Stats.SHARED_PATH,
+    ) -> None:
+        self.sampler = sampler
+        self.reconciler = reconciler
+        self.path = path
+        self._samples = 0
+        self._stamp: tuple[int, int, int] | None = None
+        self._loaded = False
+
+    def write(self, events: list[PeerEvent]) -> None:
+        self._samples += 1
+        state = SharedState(
+            pid=os.getpid(),
+            sample=self._samples,
+            time=time(),
+            ready=self.reconciler.ready.is_set(),
+            reconcile=self.reconciler.report,
+            snapshot=self.sampler.snapshot.dump(),
+            presence=self.sampler.presence.dump(),
+            accounting=self.sampler.accounting.report,
+            events=events,
+        )
+        with AtomicFile(self.path) as f:
+            f.write(state.model_dump_json().encode())
+
+    def _stat(self) -> tuple[int, int, int] | None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def load(self) -> bool:
+        """Take over the state of the file if it changed, return whether it did."""
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return False
+        with open(self.path, "rb") as f:
+            state = SharedState.model_validate_json(f.read())
+        self._stamp = stamp
+
+        self.sampler.snapshot.restore(state.snapshot)
+        self.sampler.presence.restore(state.presence)
+        self.sampler.accounting.report = state.accounting
+        self.reconciler.report = state.reconcile
+        if state.ready:
+            self.reconciler.ready.set()
+        if self._loaded:
+            self.sampler.bus.publish(state.events)
+        self._loaded = True
+        return True
+
+
+class Leadership:
+    """Runs the background tasks in the worker that holds the leader lock."""
+
+    def __init__(
+        self,
+        start_tasks: Callable[[], None],
+        stats: SharedStats,
+        lock_path: str = os.path.join(Config.Wireguard.LOCK_DIR, "leader.lock"),
+        interval: float = Config.Stats.INTERVAL / 2,
+    ) -> None:
+        self.start_tasks = start_tasks
+        self.stats = stats
+        self.lock = FileLock(lock_path)
+        self.interval = interval
+        self._stopped = Event()
+
+    @property
+    def leader(self) -> bool:
+        return self.lock.held
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            if self.lock.acquire(blocking=False):
+                logger.info(f"Worker {os.getpid()} runs the background tasks")
+                self.stats.sampler.on_sample = self.stats.write
+                self.start_tasks()
+                return
+            try:
+                self.stats.load()
+            except Exception:
+                logger.exception("Failed to load the shared stats")
+            self._stopped.wait(self.interval)
+
+    def start(self) -> Thread:
+        thread = Thread(target=self.run, name="wg-leadership", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.lock.release()
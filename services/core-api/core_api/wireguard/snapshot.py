@@ -0,0 +1,122 @@
+from collections import OrderedDict
+from threading import Lock
+
+from pydantic import BaseModel
+
+PeerKey = tuple[int, str]  # (interface id, public key)
+
+
+class PeerStats(BaseModel):
+    interface_id: int
+    public_key: str
+    latest_handshake: int
+    transfer_rx: int
+    transfer_tx: int
+
+
+class RemovedPeer(BaseModel):
+    interface_id: int
+    public_key: str
+
+
+class StatsDelta(BaseModel):
+    cursor: int
+    # The cursor was too old: `peers` holds every peer, drop everything else
+    reset: bool
+    peers: list[PeerStats]
+    removed: list[RemovedPeer]
+
+
+class SnapshotState(BaseModel):
+    version: int
+    horizon: int
+    peers: list[PeerStats]
+    # (interface id, public key, version) of the log, oldest first
+    log: list[tuple[int, str, int]]
+
+
+class StatsSnapshot:
+    """Peer counters versioned by sample, with a log of the last change of each peer."""
+
+    def __init__(self, max_removed: int = 10000) -> None:
+        self.max_removed = max_removed
+        self.version = 0
+        self._lock = Lock()
+        self._peers: dict[PeerKey, PeerStats] = {}
+        # key: version of its last change, oldest first
+        self._log: OrderedDict[PeerKey, int] = OrderedDict()
+        self._removed = 0
+        # Changes at or before this version may be missing from the log
+        self._horizon = 0
+
+    def apply(self, changed: list[PeerStats], removed: list[PeerKey]) -> int:
+        """Record the changes of one sample as a new version."""
+        if not changed and not removed:
+            return self.version
+        with self._lock:
+            self.version += 1
+            for stats in changed:
+                key = (stats.interface_id, stats.public_key)
+                if key in self._log and key not in self._peers:
+                    self._removed -= 1
+                self._peers[key] = stats
+                self._log[key] = self.version
+                self._log.move_to_end(key)
+            for key in removed:
+                if self._peers.pop(key, None) is None:
+                    continue
+                self._removed += 1
+                self._log[key] = self.version
+                self._log.move_to_end(key)
+
+            while self._removed > self.max_removed:
+                key, self._horizon = self._log.popitem(last=False)
+                if key not in self._peers:
+                    self._removed -= 1
+            return self.version
+
+    def changes(self, since: int = 0) -> StatsDelta:
+        with self._lock:
+            if since < self._horizon or since > self.version:
+                return StatsDelta(
+                    cursor=self.version,
+                    reset=True,
+                    peers=list(self._peers.values()),
+                    removed=[],
+                )
+
+            peers: list[PeerStats] = []
+            removed: list[RemovedPeer] = []
+            for key in reversed(self._log):
+                if self._log[key] <= since:
+                    break
+                if (stats := self._peers.get(key)) is not None:
+                    peers.append(stats)
+                else:
+                    removed.append(RemovedPeer(interface_id=key[0], public_key=key[1]))
+            return StatsDelta(
+                cursor=self.version, reset=False, peers=peers, removed=removed
+            )
+
+    def dump(self) -> SnapshotState:
+        with self._lock:
+            return SnapshotState(
+                version=self.version,
+                horizon=self._horizon,
+                peers=list(self._peers.values()),
+                log=[(key[0], key[1], version) for key, version in self._log.items()],
+            )
+
+    def restore(self, state: SnapshotState) -> None:
+        """Take over the snapshot of another process, cursors stay valid."""
+        peers = {(stats.interface_id, stats.public_key): stats for stats in state.peers}
+        log = OrderedDict(
+            ((interface_id, public_key), version)
+            for interface_id, public_key, version in state.log
+        )
+        with self._lock:
+            self.version = state.version
+            self._horizon = state.horizon
+            self._peers = peers
+            self._log = log
+            self._removed = sum(1 for key in log if key not in peers)
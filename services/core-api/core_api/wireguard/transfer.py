@@ -0,0 +1,213 @@
+import sqlite3
+import zlib
+from ipaddress import IPv4Address, IPv4Network, IPv6Network
+from typing import AsyncIterator, Iterator
+
+from loguru import logger
+from pydantic import BaseModel, ValidationError
+
+from ..storages import Peers
+from . import keys
+from .wireguard import ApplyResult, Interface, Peer, Wireguard
+
+# Rows validated and inserted per transaction
+IMPORT_CHUNK_SIZE = 500
+# Longest accepted NDJSON row
+MAX_LINE = 1 << 16
+
+
+class PeerRecord(BaseModel):
+    """Peer of an export, and a row of an import."""
+
+    name: str
+    address: IPv4Address
+    public_key: str | None = None
+    private_key: str | None = None
+    preshared_key: str | None = None
+    allowed_ips: list[IPv4Network | IPv6Network] | None = None
+
+    remote_allowed_ips: list[IPv4Network | IPv6Network] | None = None
+    remote_dns: str | None = None
+    remote_persistent_keepalive: int | None = None
+
+    group_name: str | None = None
+    enabled: bool = True
+    expires_at: int | None = None
+    quota: int | None = None
+
+
+# Peer fields that are not part of a record
+EXPORT_EXCLUDE = set(Peer.model_fields) - set(PeerRecord.model_fields)
+
+
+class RowError(BaseModel):
+    line: int
+    error: str
+
+
+class ChunkReport(BaseModel):
+    chunk: int
+    rows: int
+    imported: int
+    errors: list[RowError]
+
+
+class ImportResult(BaseModel):
+    imported: int
+    rejected: int
+    chunks: int
+    apply: ApplyResult | None
+
+
+def _validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, item['loc'])) or 'row'}: {item['msg']}"
+        for item in error.errors(include_url=False)
+    )
+
+
+class PeerImporter:
+    """Imports NDJSON peer records into an interface chunk by chunk."""
+
+    def __init__(self, wireguard: Wireguard, interface: Interface) -> None:
+        self.wg = wireguard
+        self.interface = interface
+        self.chunks = 0
+        self.lines = 0
+        self.imported = 0
+        self.rejected = 0
+
+    def _record(self, line: bytes) -> PeerRecord:
+        record = PeerRecord.model_validate_json(line)
+        if record.private_key is None:
+            if record.public_key is not None:
+                raise ValueError("public_key needs its private_key")
+            record.private_key = keys.genkey()
+        if record.public_key is None:
+            record.public_key = keys.pubkey(record.private_key)
+        if record.preshared_key is None:
+            record.preshared_key = keys.genpsk()
+        return record
+
+    def import_chunk(self, lines: list[bytes]) -> ChunkReport:
+        errors: list[RowError] = []
+        records: list[tuple[int, PeerRecord]] = []
+        rows = 0
+        for line in lines:
+            self.lines += 1
+            if not line.strip():
+                continue
+            rows += 1
+            try:
+                records.append((self.lines, self._record(line)))
+            except ValidationError as error:
+                errors.append(RowError(line=self.lines, error=_validation_error(error)))
+            except ValueError as error:
+                errors.append(RowError(line=self.lines, error=str(error)))
+
+        taken_addresses = Peers.taken_addresses(
+            self.interface, [str(record.address) for _, record in records]
+        )
+        taken_addresses.add(str(self.interface.local_ip.ip))
+        taken_keys = Peers.taken_keys(
+            [
+                key
+                for _, record in records
+                for key in (record.public_key, record.private_key, record.preshared_key)
+            ]
+        )
+
+        peers: list[Peer] = []
+        accepted: list[int] = []
+        for line, record in records:
+            address = str(record.address)
+            record_keys = {record.public_key, record.private_key, record.preshared_key}
+            if address in taken_addresses:
+                errors.append(RowError(line=line, error=f"Address {address} is taken"))
+            elif len(record_keys) < 3 or record_keys & taken_keys:
+                errors.append(RowError(line=line, error="Key is already used"))
+            else:
+                taken_addresses.add(address)
+                taken_keys |= record_keys
+                accepted.append(line)
+                peers.append(
+                    Peer(interface_id=self.interface.id, **record.model_dump())
+                )
+
+        try:
+            Peers.add_many(peers)
+        except sqlite3.IntegrityError as error:
+            errors.extend(RowError(line=line, error=str(error)) for line in accepted)
+            peers = []
+
+        errors.sort(key=lambda error: error.line)
+        self.chunks += 1
+        self.imported += len(peers)
+        self.rejected += len({error.line for error in errors})
+        return ChunkReport(
+            chunk=self.chunks,
+            rows=rows,
+            imported=len(peers),
+            errors=errors,
+        )
+
+    def stop(self, error: str) -> ChunkReport:
+        """Report that the rest of the body could not be read."""
+        self.chunks += 1
+        return ChunkReport(
+            chunk=self.chunks,
+            rows=0,
+            imported=0,
+            errors=[RowError(line=self.lines + 1, error=error)],
+        )
+
+    def finish(self) -> ImportResult:
+        apply = None
+        if self.imported:
+            logger.info(
+                f"Imported {self.imported} peers into interface {self.interface.name}"
+            )
+            (apply,) = self.wg.apply_all(self.wg.apply_peers, [self.interface])
+        return ImportResult(
+            imported=self.imported,
+            rejected=self.rejected,
+            chunks=self.chunks,
+            apply=apply,
+        )
+
+
+def _inflate(decompressor: "zlib._Decompress", data: bytes) -> Iterator[bytes]:
+    """Gunzip `data` in pieces of at most MAX_LINE bytes."""
+    while True:
+        piece = decompressor.decompress(data, MAX_LINE)
+        yield piece
+        data = decompressor.unconsumed_tail
+        if not data and len(piece) < MAX_LINE:
+            return
+
+
+async def iter_line_chunks(
+    stream: AsyncIterator[bytes],
+    size: int = IMPORT_CHUNK_SIZE,
+    gzip: bool = False,
+) -> AsyncIterator[list[bytes]]:
+    """Lines of a request body in lists of `size`, gunzipped if `gzip`."""
+    decompressor = zlib.decompressobj(wbits=31) if gzip else None
+    buffer = b""
+    lines: list[bytes] = []
+    async for data in stream:
+        for piece in _inflate(decompressor, data) if decompressor else (data,):
+            *complete, buffer = (buffer + piece).split(b"\n")
+            if len(buffer) > MAX_LINE:
+                raise ValueError(f"Line longer than {MAX_LINE} bytes")
+            for line in complete:
+                lines.append(line)
+                if len(lines) == size:
+                    yield lines
+                    lines = []
+    if decompressor:
+        buffer += decompressor.flush()
+    if buffer:
+        lines.append(buffer)
+    if lines:
+        yield lines
@@ -1,33 +1,92 @@
-from subprocess import PIPE, run
-from typing import Generator
+import os
+from itertools import islice
+from subprocess import PIPE, Popen, run
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING, Generator, Iterable, Iterator
+from ..config import Config
 from .config_builder import InterfaceBuilder
 
+if TYPE_CHECKING:
+    from .diff import PeerConfig
+
+
+SET_PEERS_BATCH = 1000
+
 
 class PeerInfo:
-    def __init__(self) -> None:
-        self.public_key: str
-        self.preshared_key: str
-        self.endpoint: str
-        self.allowed_ips: str
-        self.latest_handshake: str
-        self.transfer_rx: str
-        self.transfer_tx: str
-        self.persistent_keepalive: str
+    """Peer line of `wg show dump`."""
+
+    __slots__ = (
+        "public_key",
+        "preshared_key",
+        "endpoint",
+        "allowed_ips",
+        "latest_handshake",
+        "transfer_rx",
+        "transfer_tx",
+        "persistent_keepalive",
+        "_endpoint_address",
+    )
+
+    def __init__(
+        self,
+        public_key: str,
+        preshared_key: str,
+        endpoint: str,
+        allowed_ips: str,
+        latest_handshake: int,
+        transfer_rx: int,
+        transfer_tx: int,
+        persistent_keepalive: int | None,
+    ) -> None:
+        self.public_key = public_key
+        self.preshared_key = preshared_key
+        self.endpoint = endpoint
+        self.allowed_ips = allowed_ips
+        self.latest_handshake = latest_handshake
+        self.transfer_rx = transfer_rx
+        self.transfer_tx = transfer_tx
+        self.persistent_keepalive = persistent_keepalive
+        self._endpoint_address: tuple[str, int] | None = None
 
     @classmethod
-    def from_dump(cls, line: str) -> "PeerInfo":
-        info = cls()
+    def from_fields(cls, fields: list[str]) -> "PeerInfo":
         (
-            info.public_key,
-            info.preshared_key,
-            info.endpoint,
-            info.allowed_ips,
-            info.latest_handshake,
-            info.transfer_rx,
-            info.transfer_tx,
-            info.persistent_keepalive,
-        ) = line.split("\t")
-        return info
+            public_key,
+            preshared_key,
+            endpoint,
+            allowed_ips,
+            latest_handshake,
+            transfer_rx,
+            transfer_tx,
+            persistent_keepalive,
+        ) = fields
+        return cls(
+            public_key,
+            preshared_key,
+            endpoint,
+            allowed_ips,
+            int(latest_handshake),
+            int(transfer_rx),
+            int(transfer_tx),
+            None if persistent_keepalive == "off" else int(persistent_keepalive),
+        )
+
+    @classmethod
+    def from_dump(cls, line: str) -> "PeerInfo":
+        return cls.from_fields(line.split("\t"))
+
+    @property
+    def endpoint_address(self) -> tuple[str, int] | None:
+        """(host, port) of the endpoint, None if the peer has not connected."""
+        if self._endpoint_address is None and self.endpoint != "(none)":
+            host, _, port = self.endpoint.rpartition(":")
+            self._endpoint_address = (host.strip("[]"), int(port))
+        return self._endpoint_address
+
+    @classmethod
+    def load(cls, data: dict) -> "PeerInfo":
+        return cls(**data)
 
     def dump(self) -> dict:
         return {
@@ -43,34 +102,59 @@ class PeerInfo:
 
 
 class InterfaceInfo:
-    def __init__(self) -> None:
-        self.name: str
-        self.private_key: str
-        self.public_key: str
-        self.listen_port: str
-        self.fwmark: str
+    """Interface of `wg show dump` with its peers."""
+
+    __slots__ = (
+        "name",
+        "private_key",
+        "public_key",
+        "listen_port",
+        "fwmark",
+        "peers",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        private_key: str,
+        public_key: str,
+        listen_port: int,
+        fwmark: str,
+    ) -> None:
+        self.name = name
+        self.private_key = private_key
+        self.public_key = public_key
+        self.listen_port = listen_port
+        self.fwmark = fwmark
         self.peers: list[PeerInfo] = []
 
     @classmethod
-    def from_dump(cls, dump: str) -> "InterfaceInfo":
-        info = cls()
-        lines = dump.strip().split("\n")
+    def from_fields(cls, name: str, fields: list[str]) -> "InterfaceInfo":
+        private_key, public_key, listen_port, fwmark = fields
+        return cls(name, private_key, public_key, int(listen_port), fwmark)
 
-        (
-            info.private_key,
-            info.public_key,
-            info.listen_port,
-            info.fwmark,
-        ) = lines.pop(
-            0
-        ).split("\t")
-
-        for line in lines:
-            info.peers.append(PeerInfo.from_dump(line))
+    @classmethod
+    def from_dump(cls, dump: str, name: str = "") -> "InterfaceInfo":
+        lines = iter(dump.strip().split("\n"))
+        info = cls.from_fields(name, next(lines).split("\t"))
+        info.peers.extend(PeerInfo.from_dump(line) for line in lines)
+        return info
+
+    @classmethod
+    def load(cls, data: dict) -> "InterfaceInfo":
+        info = cls(
+            data["name"],
+            data["private_key"],
+            data["public_key"],
+            data["listen_port"],
+            data["fwmark"],
+        )
+        info.peers.extend(PeerInfo.load(peer) for peer in data["peers"])
         return info
 
     def dump(self) -> dict:
         return {
+            "name": self.name,
             "private_key": self.private_key,
             "public_key": self.public_key,
             "listen_port": self.listen_port,
@@ -79,7 +163,35 @@ class InterfaceInfo:
         }
 
 
-class WG:
+def parse_all_dump(lines: Iterable[str]) -> Iterator[InterfaceInfo]:
+    """Parse `wg show all dump` lines, yielding each interface once it is complete."""
+    info: InterfaceInfo | None = None
+    for line in lines:
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) == 5:
+            if info is not None:
+                yield info
+            info = InterfaceInfo.from_fields(fields[0], fields[1:])
+        elif len(fields) == 9 and info is not None:
+            info.peers.append(PeerInfo.from_fields(fields[1:]))
+    if info is not None:
+        yield info
+
+
+class SubprocessWG:
+    """WG backend that runs the `wg` and `wg-quick` tools."""
+
+    @staticmethod
+    def _show(*args: str) -> Iterator[str]:
+        """Stream output lines of `wg show` straight from the pipe."""
+        process = Popen(["wg", "show", *args], stdout=PIPE, text=True)
+        assert process.stdout is not None
+        try:
+            yield from process.stdout
+        finally:
+            process.stdout.close()
+            process.wait()
+
     @staticmethod
     def interfaces() -> list[str]:
         return (
@@ -90,43 +202,59 @@ class WG:
 
     @staticmethod
     def get_interface_info(interface_name: str) -> InterfaceInfo:
-        data = run(
-            ["wg", "show", interface_name, "dump"], stdout=PIPE, text=True
-        ).stdout.strip()
-        info = InterfaceInfo.from_dump(data)
-        info.name = interface_name
+        lines = SubprocessWG._show(interface_name, "dump")
+        if (header := next(lines, None)) is None:
+            raise ValueError(f"Interface {interface_name} is not running")
+        info = InterfaceInfo.from_fields(
+            interface_name, header.rstrip("\n").split("\t")
+        )
+        info.peers.extend(
+            PeerInfo.from_fields(line.rstrip("\n").split("\t")) for line in lines
+        )
         return info
 
     @staticmethod
     def get_interfaces_info() -> Generator[InterfaceInfo, None, None]:
-        data = run(["wg", "show", "all", "dump"], stdout=PIPE, text=True).stdout.strip()
-        interface_data = []
-        current_interface = ""
-
-        for line in data.split("\n"):
-            interface_name, _ = line.split("\t", 1)
-            if interface_name != current_interface:
-                if interface_data:
-                    info = InterfaceInfo.from_dump("\n".join(interface_data))
-                    info.name = current_interface
-                    yield info
-                current_interface = interface_name
-                interface_data = [line]
-            else:
-                interface_data.append(line)
-
-        if interface_data:
-            info = InterfaceInfo.from_dump("\n".join(interface_data))
-            info.name = current_interface
-            yield info
+        yield from parse_all_dump(SubprocessWG._show("all", "dump"))
 
     @staticmethod
     def up(interface_name: str) -> None:
-        run(["wg-quick", "up", interface_name])
+        run(["wg-quick", "up", interface_name], check=True)
 
     @staticmethod
     def down(interface_name: str) -> None:
-        run(["wg-quick", "down", interface_name])
+        run(["wg-quick", "down", interface_name], check=True)
+
+    @staticmethod
+    def set_peers(
+        interface_name: str,
+        peers: Iterable["PeerConfig"] = (),
+        remove: Iterable[str] = (),
+    ) -> None:
+        """Add/update and remove peers of a running interface without a restart."""
+        with TemporaryDirectory() as keys_dir:
+            args: list[str] = []
+            for n, peer in enumerate(peers):
+                args += ["peer", peer.public_key]
+                if peer.preshared_key:
+                    key_path = os.path.join(keys_dir, str(n))
+                    with open(key_path, "w") as f:
+                        f.write(peer.preshared_key)
+                    args += ["preshared-key", key_path]
+                args += ["allowed-ips", peer.allowed_ips.replace(" ", "")]
+                if (n + 1) % SET_PEERS_BATCH == 0:
+                    run(["wg", "set", interface_name, *args], check=True)
+                    args = []
+
+            remove = iter(remove)
+            while batch := list(islice(remove, SET_PEERS_BATCH)):
+                for public_key in batch:
+                    args += ["peer", public_key, "remove"]
+                run(["wg", "set", interface_name, *args], check=True)
+                args = []
+
+            if args:
+                run(["wg", "set", interface_name, *args], check=True)
 
     @staticmethod
     def genkey() -> str:
@@ -141,3 +269,14 @@ class WG:
     @staticmethod
     def genpsk() -> str:
         return run(["wg", "genpsk"], stdout=PIPE, text=True).stdout.strip()
+
+
+def _backend() -> type[SubprocessWG]:
+    if Config.Wireguard.BACKEND == "netlink":
+        from .netlink import NetlinkWG
+
+        return NetlinkWG
+    return SubprocessWG
+
+
+WG = _backend()
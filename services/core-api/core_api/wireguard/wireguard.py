@@ -1,5 +1,17 @@
-from typing import Iterable, Union, overload
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from contextlib import contextmanager
+from threading import Lock, local
+from time import perf_counter, time
+from typing import Callable, Iterable, Iterator, Union, overload
+from pydantic import BaseModel
+from ..cluster import LOCAL_NODE, AgentClient, Cluster
+from ..config import Config
+from ..files import AtomicFile, FileLock
 from ..storages import (
+    AppliedConfigs,
     Interfaces,
     Peers,
     Interface as StorageInterface,
@@ -7,11 +19,19 @@ from ..storages import (
 )
 from loguru import logger
 
-from .config_builder import InterfaceBuilder, PeerBuilder
-from .wg_connector import InterfaceInfo, PeerInfo, WG
+from .config_builder import InterfaceBuilder, PeerBuilder, render_interface
+from . import keys
+from .diff import PeerConfig, PeerDiff, diff_peers
+from .wg_connector import InterfaceInfo, PeerInfo, SubprocessWG, WG
 from ipaddress import IPv4Interface, IPv4Network, IPv4Address, IPv6Network
 
 
+CONFIG_DIR = "/etc/wireguard"
+CONFIG_WRITE_BUFFER = 1 << 16
+# Peers per page of streamed listings
+PEER_PAGE_SIZE = 500
+
+
 class Interface(StorageInterface):
     id: int = -1
 
@@ -25,14 +45,95 @@ class Peer(StoragePeer):
     transfer_tx: int | None = None
 
 
+class ApplyResult(BaseModel):
+    interface_id: int
+    name: str
+    ok: bool
+    error: str | None = None
+    duration: float
+
+
+class DeferredApplies:
+    """Interfaces changed in a `Wireguard.deferred_applies` block."""
+
+    def __init__(self) -> None:
+        self.interfaces: dict[int, Interface] = {}
+        # Interfaces that were changed themselves and need a full sync
+        self.sync: set[int] = set()
+        self.results: list[ApplyResult] = []
+
+
+class RotatedPeer(BaseModel):
+    peer_id: int
+    name: str
+    public_key: str
+    config: str
+
+
+class RotationManifest(BaseModel):
+    interface_id: int
+    keypairs: bool
+    peers: list[RotatedPeer]
+
+
+class InterfaceStats(BaseModel):
+    interface_id: int
+    name: str
+    node: str
+    running: bool
+    peers: int
+    active_peers: int
+    transfer_rx: int
+    transfer_tx: int
+
+
+class FleetStats(BaseModel):
+    interfaces: list[InterfaceStats]
+    peers: list[Peer]
+
+
 class Wireguard:
     _singleton = None
+    _apply_locks: defaultdict[str, Lock]
+    _apply_locks_guard: Lock
+    _local: local
+    cluster: Cluster
 
     def __new__(cls) -> "Wireguard":
         if cls._singleton is None:
             cls._singleton = super().__new__(cls)
+            cls._singleton._apply_locks = defaultdict(Lock)
+            cls._singleton._apply_locks_guard = Lock()
+            cls._singleton._local = local()
+            cls._singleton.cluster = Cluster.from_config()
         return cls._singleton
 
+    def connector(self, interface: Interface) -> type[SubprocessWG] | AgentClient:
+        """`WG` for local interfaces, the node's agent for the others."""
+        if interface.node == LOCAL_NODE:
+            return WG
+        return self.cluster.client(interface.node)
+
+    def get_interfaces_info(self) -> dict[str, list[InterfaceInfo]]:
+        """Running interfaces by node, nodes that can't be read are left out."""
+        running = {
+            node: dump.interfaces
+            for node, dump in self.cluster.dump_all().items()
+            if dump.interfaces is not None
+        }
+        running[LOCAL_NODE] = list(WG.get_interfaces_info())
+        return running
+
+    @contextmanager
+    def _apply_lock(self, interface: Interface) -> Iterator[None]:
+        """Serialize the applies of an interface across threads and workers."""
+        with self._apply_locks_guard:
+            lock = self._apply_locks[interface.name]
+        with lock, FileLock(
+            os.path.join(Config.Wireguard.LOCK_DIR, f"{interface.name}.lock")
+        ):
+            yield
+
     @property
     def interfaces(self) -> list[Interface]:
         return [
@@ -60,20 +161,21 @@ class Wireguard:
                 if not (interface := self.get_interface(peer.interface_id)):
                     raise ValueError(f"Interface with id {peer.interface_id} not found")
                 cached_interfaces[peer.interface_id] = interface
-            interface = cached_interfaces[peer.interface_id]
-            if not peer.allowed_ips:
-                peer.allowed_ips = [IPv4Interface(peer.address).network]
-            if not peer.remote_allowed_ips:
-                peer.remote_allowed_ips = interface.default_allowed_ips
-            if not peer.remote_dns:
-                peer.remote_dns = interface.default_dns
-            if not peer.remote_persistent_keepalive:
-                peer.remote_persistent_keepalive = (
-                    interface.default_persistent_keepalive
-                )
+            self._fill_defaults(peer, cached_interfaces[peer.interface_id])
 
         return list(peers)
 
+    @staticmethod
+    def _fill_defaults(peer: Peer, interface: Interface) -> None:
+        if not peer.allowed_ips:
+            peer.allowed_ips = [IPv4Interface(peer.address).network]
+        if not peer.remote_allowed_ips:
+            peer.remote_allowed_ips = interface.default_allowed_ips
+        if not peer.remote_dns:
+            peer.remote_dns = interface.default_dns
+        if not peer.remote_persistent_keepalive:
+            peer.remote_persistent_keepalive = interface.default_persistent_keepalive
+
     def fill_peer_defaults(self, peer: Peer) -> Peer:
         return self.fill_peers_defaults([peer])[0]
 
@@ -94,21 +196,90 @@ class Wireguard:
         for interface in interfaces():
             if not self.is_running(interface):
                 continue
-            interface_info = WG.get_interface_info(interface.name)
+            interface_info = self.connector(interface).get_interface_info(
+                interface.name
+            )
             _peers = {
                 peer.public_key: peer for peer in peers_by_interface[interface.id]
             }
             for peer_info in interface_info.peers:
                 if peer := _peers.get(peer_info.public_key):
-                    peer.latest_handshake = int(peer_info.latest_handshake)
-                    peer.transfer_rx = int(peer_info.transfer_rx)
-                    peer.transfer_tx = int(peer_info.transfer_tx)
+                    peer.latest_handshake = peer_info.latest_handshake
+                    peer.transfer_rx = peer_info.transfer_rx
+                    peer.transfer_tx = peer_info.transfer_tx
 
         return list(peers)
 
+    def fill_all_stats(self) -> FleetStats:
+        """Stats of all peers and per interface totals, from one dump per node."""
+        running = {
+            (node, info.name): info
+            for node, infos in self.get_interfaces_info().items()
+            for info in infos
+        }
+        peers = [Peer(**peer.model_dump()) for peer in Peers.get_all()]
+        peers_by_key = {(peer.interface_id, peer.public_key): peer for peer in peers}
+        peer_counts = Counter(peer.interface_id for peer in peers)
+        active_since = time() - Config.Stats.ONLINE_WINDOW
+
+        interfaces: list[InterfaceStats] = []
+        for interface in self.interfaces:
+            stats = InterfaceStats(
+                interface_id=interface.id,
+                name=interface.name,
+                node=interface.node,
+                running=(interface.node, interface.name) in running,
+                peers=peer_counts[interface.id],
+                active_peers=0,
+                transfer_rx=0,
+                transfer_tx=0,
+            )
+            interfaces.append(stats)
+            info = running.get((interface.node, interface.name))
+            for peer_info in info.peers if info else ():
+                peer = peers_by_key.get((interface.id, peer_info.public_key))
+                if peer is None:
+                    continue
+                peer.latest_handshake = peer_info.latest_handshake
+                peer.transfer_rx = peer_info.transfer_rx
+                peer.transfer_tx = peer_info.transfer_tx
+                stats.transfer_rx += peer_info.transfer_rx
+                stats.transfer_tx += peer_info.transfer_tx
+                stats.active_peers += peer_info.latest_handshake >= active_since
+
+        return FleetStats(interfaces=interfaces, peers=peers)
+
     def fill_peer_stats(self, peer: Peer) -> Peer:
         return self.fill_peers_stats([peer])[0]
 
+    def iter_peer_pages(
+        self,
+        interfaces: Iterable[Interface],
+        fill_defaults: bool = True,
+        fill_stats: bool = True,
+        size: int = PEER_PAGE_SIZE,
+    ) -> Iterator[list[Peer]]:
+        """Peers of the interfaces in pages of `size`, one query per page."""
+        for interface in interfaces:
+            stats: dict[str, PeerInfo] = {}
+            if fill_stats and self.is_running(interface):
+                info = self.connector(interface).get_interface_info(interface.name)
+                stats = {peer_info.public_key: peer_info for peer_info in info.peers}
+            after = 0
+            while page := [
+                Peer(**peer.model_dump())
+                for peer in Peers.get_page(interface, after, size)
+            ]:
+                after = page[-1].id
+                for peer in page:
+                    if fill_defaults:
+                        self._fill_defaults(peer, interface)
+                    if peer_info := stats.get(peer.public_key):
+                        peer.latest_handshake = peer_info.latest_handshake
+                        peer.transfer_rx = peer_info.transfer_rx
+                        peer.transfer_tx = peer_info.transfer_tx
+                yield page
+
     def get_peers(self, interface: Interface) -> list[Peer]:
         return [
             Peer(**peer.model_dump()) for peer in Peers().get_by_interface(interface)
@@ -148,15 +319,19 @@ class Wireguard:
 
     def update_interface(self, interface: Interface) -> None:
         logger.info(f"Updating interface {interface.name}")
+        previous = Interfaces.get(interface.id)
         Interfaces.update(interface)
+        if previous and previous.name != interface.name:
+            AppliedConfigs.delete(previous.name)
         logger.info(f"Interface {interface.name} updated")
-        self.sync_interface(interface)
+        self._apply(interface, sync=True)
 
     def delete_interface(self, interface: Interface) -> None:
         logger.info(f"Deleting interface {interface.name}")
         Interfaces.delete(interface.id)
+        AppliedConfigs.delete(interface.name)
         logger.info(f"Interface {interface.name} deleted")
-        self.sync_interface(interface)
+        self._apply(interface, sync=True)
 
     def add_peer(self, peer: Peer) -> int:
         logger.info(f"Adding peer {peer.id}")
@@ -165,7 +340,7 @@ class Wireguard:
             raise ValueError(f"Interface with id {peer.interface_id} not found")
         peer_id = Peers.add(peer)
         logger.info(f"Peer {peer.id} added")
-        self.sync_interface(interface)
+        self._apply(interface)
         return peer_id
 
     def update_peer(self, peer: Peer) -> None:
@@ -175,7 +350,7 @@ class Wireguard:
             raise ValueError(f"Interface with id {peer.interface_id} not found")
         Peers.update(peer)
         logger.info(f"Peer {peer.id} updated")
-        self.sync_interface(interface)
+        self._apply(interface)
 
     def delete_peer(self, peer: Peer) -> None:
         logger.info(f"Deleting peer {peer.id}")
@@ -184,7 +359,7 @@ class Wireguard:
             raise ValueError(f"Interface with id {peer.interface_id} not found")
         Peers.delete(peer.id)
         logger.info(f"Peer {peer.id} deleted")
-        self.sync_interface(interface)
+        self._apply(interface)
 
     def create_peer(
         self,
@@ -194,10 +369,13 @@ class Wireguard:
         remote_allowed_ips: list[IPv4Network | IPv6Network] | None = None,
         remote_dns: str | None = None,
         remote_persistent_keepalive: int | None = None,
+        group_name: str | None = None,
+        expires_at: int | None = None,
+        quota: int | None = None,
     ) -> Peer:
-        private_key = WG.genkey()
-        public_key = WG.pubkey(private_key)
-        preshared_key = WG.genkey()
+        private_key = keys.genkey()
+        public_key = keys.pubkey(private_key)
+        preshared_key = keys.genpsk()
         peer = Peer(
             interface_id=interface.id,
             name=name,
@@ -209,6 +387,9 @@ class Wireguard:
             remote_allowed_ips=remote_allowed_ips,
             remote_dns=remote_dns,
             remote_persistent_keepalive=remote_persistent_keepalive,
+            group_name=group_name,
+            expires_at=expires_at,
+            quota=quota,
         )
         peer_id = self.add_peer(peer)
         peer = self.get_peer(peer_id)
@@ -228,9 +409,12 @@ class Wireguard:
             IPv6Network("::/0"),
         ],
         default_persistent_keepalive: int = 25,
+        node: str = LOCAL_NODE,
     ) -> Interface:
-        private_key = WG.genkey()
-        public_key = WG.pubkey(private_key)
+        if node != LOCAL_NODE:
+            self.cluster.client(node)  # Fail before the interface is stored
+        private_key = keys.genkey()
+        public_key = keys.pubkey(private_key)
         interface = Interface(
             name=name,
             local_ip=local_ip,
@@ -246,6 +430,7 @@ class Wireguard:
             default_allowed_ips=default_allowed_ips,
             default_persistent_keepalive=default_persistent_keepalive,
             enabled=False,
+            node=node,
         )
         _id = self.add_interface(interface)
         interface = self.get_interface(_id)
@@ -254,7 +439,7 @@ class Wireguard:
         return interface
 
     def is_running(self, interface: Interface) -> bool:
-        return interface.name in WG.interfaces()
+        return interface.name in self.connector(interface).interfaces()
 
     def up_interface(self, interface: Interface) -> None:
         logger.info(f"Enabling interface {interface.name}")
@@ -268,8 +453,8 @@ class Wireguard:
         self.update_interface(interface)
         logger.info(f"Disabled interface {interface.name}")
 
-    def build_interface(self, interface: Interface) -> InterfaceBuilder:
-        builder = (
+    def _interface_builder(self, interface: Interface) -> InterfaceBuilder:
+        return (
             InterfaceBuilder(interface.name)
             .address(str(interface.local_ip))
             .listen_port(str(interface.port))
@@ -280,7 +465,12 @@ class Wireguard:
             .post_down(interface.post_down)
         )
 
+    def build_interface(self, interface: Interface) -> InterfaceBuilder:
+        builder = self._interface_builder(interface)
+
         for peer in Peers.get_by_interface(interface):
+            if not peer.enabled:
+                continue
             builder.add_peer(
                 PeerBuilder()
                 .public_key(peer.public_key)
@@ -294,34 +484,257 @@ class Wireguard:
 
         return builder
 
-    def sync_interface(self, interface: Interface) -> None:
+    def render_interface(self, interface: Interface) -> Iterator[str]:
+        return render_interface(
+            self._interface_builder(interface), Peers.iter_config_rows(interface)
+        )
+
+    def desired_peers(self, interface: Interface) -> Iterator[PeerConfig]:
+        return (PeerConfig(*row) for row in Peers.iter_config_rows(interface))
+
+    def needs_restart(self, interface: Interface, info: InterfaceInfo) -> bool:
+        """Whether the running interface differs beyond what `wg set` can fix."""
+        return (
+            info.private_key != interface.private_key
+            or info.listen_port != interface.port
+        )
+
+    def apply_peer_diff(self, interface: Interface, info: InterfaceInfo) -> PeerDiff:
+        """Bring peers of a running interface in line with the database."""
+        with self._apply_lock(interface):
+            diff = diff_peers(self.desired_peers(interface), info.peers)
+            if diff:
+                logger.info(
+                    f"Updating {len(diff.upsert)} and removing {len(diff.remove)}"
+                    f" peers of interface {interface.name}"
+                )
+                self.connector(interface).set_peers(
+                    interface.name, diff.upsert, diff.remove
+                )
+            if diff or AppliedConfigs.get(interface.name) is None:
+                if interface.node == LOCAL_NODE:
+                    self.write_config(interface)
+                else:
+                    self.write_remote_config(interface)
+            return diff
+
+    def apply_peers(self, interface: Interface) -> PeerDiff | None:
+        """Apply changed peers of an interface, without restarting it."""
+        if interface.enabled and self.is_running(interface):
+            info = self.connector(interface).get_interface_info(interface.name)
+            return self.apply_peer_diff(interface, info)
+        self.sync_interface(interface)
+        return None
+
+    def _apply(self, interface: Interface, sync: bool = False) -> None:
+        """Sync or apply the peers of a changed interface, or defer it."""
+        deferred: DeferredApplies | None = getattr(self._local, "deferred", None)
+        if deferred is None:
+            self.apply_changed(interface, sync)
+            return
+        deferred.interfaces[interface.id] = interface
+        if sync:
+            deferred.sync.add(interface.id)
+
+    @contextmanager
+    def deferred_applies(self, apply: bool = True) -> Iterator[DeferredApplies]:
+        """Apply every interface changed in the block once, on a clean exit."""
+        if (deferred := getattr(self._local, "deferred", None)) is not None:
+            yield deferred
+            return
+        deferred = DeferredApplies()
+        self._local.deferred = deferred
+        try:
+            yield deferred
+        finally:
+            self._local.deferred = None
+        if apply:
+            deferred.results = self.apply_all(
+                lambda interface: self.apply_changed(
+                    interface, interface.id in deferred.sync
+                ),
+                list(deferred.interfaces.values()),
+            )
+
+    def apply_changed(self, interface: Interface, sync: bool) -> None:
+        if sync:
+            self.sync_interface(interface)
+        else:
+            self.apply_peers(interface)
+
+    def config_path(self, interface: Interface) -> str:
+        return os.path.join(CONFIG_DIR, f"{interface.name}.conf")
+
+    def write_config(self, interface: Interface) -> bool:
+        """Stream the interface config to its file, return whether it changed."""
+        config_path = self.config_path(interface)
+        config_hash = sha256()
+        for chunk in self.render_interface(interface):
+            config_hash.update(chunk.encode())
+        unchanged = AppliedConfigs.get(interface.name) == config_hash.hexdigest()
+        if unchanged and os.path.exists(config_path):
+            return False
+
+        # Hashed again while written, peers may have changed in between
+        config_hash = sha256()
+        with AtomicFile(config_path, buffering=CONFIG_WRITE_BUFFER) as f:
+            for chunk in self.render_interface(interface):
+                data = chunk.encode()
+                config_hash.update(data)
+                f.write(data)
+        AppliedConfigs.set(interface.name, config_hash.hexdigest())
+        return True
+
+    def write_remote_config(self, interface: Interface) -> bool:
+        config = "".join(self.render_interface(interface))
+        changed = self.cluster.client(interface.node).write_config(
+            interface.name, config
+        )
+        AppliedConfigs.set(interface.name, sha256(config.encode()).hexdigest())
+        return changed
+
+    def sync_interface(self, interface: Interface, restart: bool = False) -> None:
+        """Write the interface config and bring the interface to its state."""
+        with self._apply_lock(interface):
+            self._sync_interface(interface, restart)
+
+    def _sync_interface(self, interface: Interface, restart: bool) -> None:
+        if interface.node != LOCAL_NODE:
+            return self._sync_remote_interface(interface, restart)
         logger.info(f"Syncing interface {interface.name}")
         is_running = self.is_running(interface)
 
+        logger.info(f"Writing configuration to {self.config_path(interface)}")
+        changed = self.write_config(interface)
+        logger.info(
+            f"Configuration written to {self.config_path(interface)}"
+            if changed
+            else f"Configuration of {interface.name} is unchanged"
+        )
+        if not changed and not restart and is_running == interface.enabled:
+            logger.info(f"Interface {interface.name} is up to date")
+            return
+
         if is_running:
             logger.info(f"Disabling interface {interface.name}")
             WG.down(interface.name)  # Turn off the interface with old configuration
             logger.info(f"Interface {interface.name} is disabled")
             is_running = False
 
-        builder = self.build_interface(interface)
-        with open(f"/etc/wireguard/{interface.name}.conf", "w") as f:
-            logger.info(
-                f"Writing configuration to /etc/wireguard/{interface.name}.conf"
-            )
-            f.write(builder.build())
-            logger.info(
-                f"Configuration written to /etc/wireguard/{interface.name}.conf"
-            )
-
         if interface.enabled:
             logger.info(f"Enabling interface {interface.name}")
             WG.up(interface.name)
             logger.info(f"Interface {interface.name} is enabled")
         logger.info(f"Interface {interface.name} is synced")
 
-    def get_config(self, peer: Peer) -> str:
-        interface = self.get_interface(peer.interface_id)
+    def _sync_remote_interface(self, interface: Interface, restart: bool) -> None:
+        logger.info(f"Syncing interface {interface.name} on node {interface.node}")
+        config = "".join(self.render_interface(interface))
+        changed = self.cluster.client(interface.node).apply_config(
+            interface.name, config, interface.enabled, restart
+        )
+        AppliedConfigs.set(interface.name, sha256(config.encode()).hexdigest())
+        logger.info(
+            f"Interface {interface.name} is synced"
+            if changed
+            else f"Configuration of {interface.name} is unchanged"
+        )
+
+    def apply_all(
+        self, apply: Callable[[Interface], None], interfaces: list[Interface]
+    ) -> list[ApplyResult]:
+        """Run `apply` for every interface on a bounded pool of workers."""
+        if not interfaces:
+            return []
+        with ThreadPoolExecutor(
+            max_workers=min(Config.Wireguard.APPLY_WORKERS, len(interfaces)),
+            thread_name_prefix="wg-apply",
+        ) as pool:
+            return list(
+                pool.map(lambda interface: self.run_apply(apply, interface), interfaces)
+            )
+
+    def run_apply(
+        self, apply: Callable[[Interface], None], interface: Interface
+    ) -> ApplyResult:
+        """Run `apply` for an interface, catching and reporting its error."""
+        started = perf_counter()
+        error = None
+        try:
+            apply(interface)
+        except Exception as e:
+            logger.exception(f"Failed to apply interface {interface.name}")
+            error = str(e) or type(e).__name__
+        return ApplyResult(
+            interface_id=interface.id,
+            name=interface.name,
+            ok=error is None,
+            error=error,
+            duration=perf_counter() - started,
+        )
+
+    def sync_all(self, interfaces: list[Interface] | None = None) -> list[ApplyResult]:
+        return self.apply_all(
+            self.sync_interface, self.interfaces if interfaces is None else interfaces
+        )
+
+    def up_all(self, interfaces: list[Interface] | None = None) -> list[ApplyResult]:
+        return self.apply_all(
+            self.up_interface, self.interfaces if interfaces is None else interfaces
+        )
+
+    def down_all(self, interfaces: list[Interface] | None = None) -> list[ApplyResult]:
+        return self.apply_all(
+            self.down_interface, self.interfaces if interfaces is None else interfaces
+        )
+
+    def rotate_keys(
+        self,
+        interface: Interface,
+        peer_ids: Iterable[int] | None = None,
+        group_name: str | None = None,
+        keypairs: bool = False,
+    ) -> RotationManifest:
+        """Give peers of an interface new preshared keys, and keypairs if asked."""
+        ids = None if peer_ids is None else set(peer_ids)
+        peers = [
+            peer
+            for peer in Peers.get_by_interface(interface)
+            if (ids is None or peer.id in ids)
+            and (group_name is None or peer.group_name == group_name)
+        ]
+        logger.info(
+            f"Rotating {'keypairs and ' if keypairs else ''}preshared keys"
+            f" of {len(peers)} peers of interface {interface.name}"
+        )
+        for peer in peers:
+            peer.preshared_key = keys.genpsk()
+            if keypairs:
+                peer.private_key = keys.genkey()
+                peer.public_key = keys.pubkey(peer.private_key)
+        Peers.update_keys(
+            (peer.id, peer.private_key, peer.public_key, peer.preshared_key)
+            for peer in peers
+        )
+        if peers:
+            self.apply_peers(interface)
+
+        return RotationManifest(
+            interface_id=interface.id,
+            keypairs=keypairs,
+            peers=[
+                RotatedPeer(
+                    peer_id=peer.id,
+                    name=peer.name,
+                    public_key=peer.public_key,
+                    config=self.get_config(peer, interface),
+                )
+                for peer in peers
+            ],
+        )
+
+    def get_config(self, peer: Peer, interface: Interface | None = None) -> str:
+        interface = interface or self.get_interface(peer.interface_id)
         if not interface:
             raise ValueError(f"Interface with id {peer.interface_id} not found")
         return (
@@ -331,7 +744,7 @@ class Wireguard:
             .private_key(peer.private_key)
             .add_peer(
                 PeerBuilder()
-                .public_key(peer.public_key)
+                .public_key(interface.public_key)
                 .preshared_key(peer.preshared_key)
                 .endpoint(f"{interface.public_hostname}:{interface.port}")
                 .allowed_ips(
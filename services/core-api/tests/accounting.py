@@ -0,0 +1,120 @@
+from time import perf_counter
+from unittest import TestCase
+from unittest.mock import patch
+
+from core_api.wireguard import accounting
+from core_api.wireguard.accounting import TrafficAccounting, accounting_period
+
+NOW = 1_725_000_000  # 2024-08-30
+NEXT_MONTH = NOW + 5 * 86400
+
+
+class TestTrafficAccounting(TestCase):
+    def setUp(self) -> None:
+        self.groups: list[tuple[int, str, str]] = []
+        self.quotas: dict[str, int] = {}
+        self.peer_quotas: list[tuple[int, str, int]] = []
+        self.saved: list[tuple] = []
+        self.refreshes = 0
+        self.changes = 0
+        for patcher in (
+            patch.object(accounting.Peers, "iter_groups", self.iter_groups),
+            patch.object(accounting.PeerChanges, "last", lambda: self.changes),
+            patch.object(accounting.GroupQuotas, "get_all", lambda: self.quotas),
+            patch.object(
+                accounting.Peers, "iter_quotas", lambda: iter(self.peer_quotas)
+            ),
+            patch.object(accounting.TrafficUsage, "iter_period", lambda period: []),
+            patch.object(accounting.TrafficUsage, "save", self.save),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.accounting = TrafficAccounting(capacity=2)
+
+    def iter_groups(self):
+        self.refreshes += 1
+        return iter(self.groups)
+
+    def save(self, period: str, rows) -> None:
+        self.saved.append((period, list(rows)))
+
+    def usage(self, report) -> dict:
+        return {usage.interface_id: (usage.rx, usage.tx) for usage in report.interfaces}
+
+    def test_deltas_and_resets(self):
+        keys = [(1, "a"), (1, "b"), (2, "c")]
+        self.accounting.observe(keys, [100, 100, 100], [10, 10, 10], NOW)
+        report = self.accounting.observe(keys, [150, 300, 100], [20, 10, 15], NOW + 5)
+        self.assertEqual(self.usage(report), {1: (250, 10), 2: (0, 5)})
+
+        # b was restarted, its counters are the traffic since then
+        report = self.accounting.observe(keys, [160, 40, 100], [20, 4, 15], NOW + 10)
+        self.assertEqual(self.usage(report), {1: (300, 14), 2: (0, 5)})
+        self.assertEqual(report.peers, 3)
+
+    def test_groups_and_quotas(self):
+        self.groups = [(1, "a", "team"), (2, "c", "team"), (1, "b", "other")]
+        self.quotas = {"team": 100, "free": 0}
+        keys = [(1, "a"), (1, "b"), (2, "c")]
+        self.accounting.observe(keys, [0, 0, 0], [0, 0, 0], NOW)
+        report = self.accounting.observe(keys, [60, 500, 30], [0, 0, 20], NOW + 5)
+
+        groups = {group.group: group for group in report.groups}
+        self.assertEqual((groups["team"].peers, groups["team"].rx), (2, 90))
+        self.assertTrue(groups["team"].exceeded)
+        self.assertFalse(groups["other"].exceeded)
+        self.assertIsNone(groups["other"].quota)
+        self.assertEqual(groups["free"].peers, 0)
+
+    def test_refreshes(self):
+        self.accounting.refresh_interval = 60
+        keys = [(1, "a")]
+        self.accounting.observe(keys, [0], [0], NOW)
+        self.accounting.observe(keys, [0], [0], NOW + 5)
+        self.assertEqual(self.refreshes, 1)
+
+        # New rows, the interval and peer or quota writes reload the groups
+        self.accounting.observe(keys + [(1, "b")], [0, 0], [0, 0], NOW + 10)
+        self.assertEqual(self.refreshes, 2)
+        self.changes += 1
+        self.groups = [(1, "b", "team")]
+        report = self.accounting.observe(keys, [0], [0], NOW + 15)
+        self.assertEqual(self.refreshes, 3)
+        self.assertEqual([group.group for group in report.groups], ["team"])
+        self.accounting.observe(keys, [0], [0], NOW + 75)
+        self.assertEqual(self.refreshes, 4)
+
+    def test_peer_quotas(self):
+        self.peer_quotas = [(1, "a", 100), (1, "b", 1000)]
+        keys = [(1, "a"), (1, "b")]
+        self.accounting.observe(keys, [0, 0], [0, 0], NOW)
+        self.accounting.observe(keys, [60, 60], [0, 0], NOW + 5)
+        self.assertEqual(self.accounting.take_exceeded(), [])
+
+        self.accounting.observe(keys, [60, 60], [50, 50], NOW + 10)
+        self.accounting.observe(keys, [70, 70], [50, 50], NOW + 15)
+        # Reported once
+        self.assertEqual(self.accounting.take_exceeded(), [(1, "a")])
+        self.assertEqual(self.accounting.take_exceeded(), [])
+
+    def test_new_period(self):
+        self.accounting.observe([(1, "a")], [0], [0], NOW)
+        self.accounting.observe([(1, "a")], [50], [50], NOW + 5)
+        report = self.accounting.observe([(1, "a")], [80], [60], NEXT_MONTH)
+
+        self.assertEqual(report.period, accounting_period(NEXT_MONTH))
+        self.assertEqual(self.saved[-1], (accounting_period(NOW), [(1, "a", 50, 50)]))
+        self.assertEqual(self.usage(report), {1: (0, 0)})
+
+    def test_many_peers(self):
+        keys = [(n % 50, str(n)) for n in range(100_000)]
+        counters = list(range(100_000))
+        self.accounting.observe(keys, counters, counters, NOW)
+        self.accounting.observe(keys, counters, counters, NOW + 5)
+
+        started = perf_counter()
+        report = self.accounting.observe(
+            keys, [c + 10 for c in counters], counters, NOW + 10
+        )
+        self.assertLess(perf_counter() - started, 1)
+        self.assertEqual(sum(usage.rx for usage in report.interfaces), 1_000_000)
@@ -0,0 +1,265 @@
+import gzip
+import json
+import os
+from ipaddress import IPv4Address
+from time import time
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core_api import api
+from core_api.api import api_router
+from core_api.auth import new_token
+from core_api.pihole.connector import PiHole
+from core_api.storages import Peers
+from core_api.wireguard.presence import PresenceIndex
+
+from tests.wireguard import (
+    FakeWG,
+    WireguardTestCase,
+    add_interface,
+    add_peer,
+)
+
+app = FastAPI()
+app.include_router(api_router)
+
+
+class ApiTestCase(WireguardTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.client = TestClient(
+            app, headers={"Authorization": f"Bearer {new_token()}"}
+        )
+
+
+class TestBulkApply(ApiTestCase):
+    def test_up_sync_and_down(self):
+        first, second = add_interface("wg0"), add_interface("wg1")
+        response = self.client.post("/api/interfaces/up")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(result["name"], result["ok"]) for result in response.json()],
+            [("wg0", True), ("wg1", True)],
+        )
+        self.assertEqual(sorted(self.fake.running), ["wg0", "wg1"])
+
+        response = self.client.post(
+            "/api/interfaces/down", json={"interface_ids": [second.id]}
+        )
+        self.assertEqual([result["name"] for result in response.json()], ["wg1"])
+        self.assertEqual(list(self.fake.running), ["wg0"])
+
+        del self.fake.running["wg0"]
+        response = self.client.post("/api/interfaces/sync")
+        self.assertTrue(all(result["ok"] for result in response.json()))
+        self.assertEqual(list(self.fake.running), ["wg0"])
+
+        response = self.client.post(
+            "/api/interfaces/sync", json={"interface_ids": [first.id, 999]}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_reports_failed_interfaces(self):
+        add_interface("wg0", enabled=True)
+        add_interface("wg1", enabled=True)
+
+        def up(interface_name: str) -> None:
+            if interface_name == "wg0":
+                raise RuntimeError("wg-quick failed")
+            FakeWG.up(self.fake, interface_name)
+
+        self.fake.up = up
+        response = self.client.post("/api/interfaces/sync")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (result["name"], result["ok"], result["error"])
+                for result in response.json()
+            ],
+            [("wg0", False, "wg-quick failed"), ("wg1", True, None)],
+        )
+
+
+class TestOnlinePeers(ApiTestCase):
+    def test_online_peers(self):
+        interface = add_interface("wg0")
+        self.enterContext(patch.object(api.sampler, "presence", PresenceIndex()))
+        api.sampler.presence.update(interface.id, "a", int(time()) - 5)
+        api.sampler.presence.update(interface.id, "b", 0)
+        response = self.client.get(f"/api/interfaces/{interface.id}/peers/online")
+        self.assertEqual([peer["public_key"] for peer in response.json()], ["a"])
+        response = self.client.get("/api/interfaces/999/peers/online")
+        self.assertEqual(response.status_code, 404)
+
+
+class TestCreatePeer(ApiTestCase):
+    def test_replays_without_an_apply_slot(self):
+        interface = add_interface("wg0")
+        url = f"/api/interfaces/{interface.id}/peers"
+        body = {"name": "peer", "address": "10.20.0.2"}
+        headers = {"idempotency-key": "create-peer"}
+        created = self.client.put(url, json=body, headers=headers)
+        self.assertEqual(created.status_code, 200)
+
+        self.enterContext(patch.object(api.applies, "limit", 1))
+        self.enterContext(patch.object(api.applies, "in_flight", 1))
+        replayed = self.client.put(url, json=body, headers=headers)
+        self.assertEqual(replayed.status_code, 200)
+        self.assertEqual(replayed.json(), created.json())
+
+        response = self.client.put(url, json={"name": "other", "address": "10.20.0.3"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(api.applies.in_flight, 1)
+
+
+class TestRotateKeys(ApiTestCase):
+    def test_rotate(self):
+        interface = add_interface("wg0")
+        peer = add_peer(interface, 1)
+        response = self.client.post(
+            f"/api/interfaces/{interface.id}/rotate", json={"keypairs": True}
+        )
+        self.assertEqual(response.status_code, 200)
+        manifest = response.json()
+        self.assertTrue(manifest["keypairs"])
+        self.assertEqual(
+            [rotated["peer_id"] for rotated in manifest["peers"]], [peer.id]
+        )
+        self.assertNotEqual(manifest["peers"][0]["public_key"], peer.public_key)
+
+        response = self.client.post(f"/api/interfaces/{interface.id}/rotate")
+        self.assertEqual(response.json()["keypairs"], False)
+        self.assertEqual(
+            manifest["peers"][0]["public_key"],
+            response.json()["peers"][0]["public_key"],
+        )
+        self.assertEqual(
+            self.client.post("/api/interfaces/999/rotate").status_code, 404
+        )
+
+
+class TestImport(ApiTestCase):
+    def test_reports_each_chunk(self):
+        interface = add_interface("wg0")
+        # Chunks of 500 rows
+        body = "".join(
+            json.dumps(
+                {"name": f"peer{n}", "address": str(IPv4Address("10.20.0.2") + n)}
+            )
+            + "\n"
+            for n in range(600)
+        )
+        response = self.client.post(
+            f"/api/interfaces/{interface.id}/peers:import",
+            content=gzip.compress(body.encode()),
+            headers={"content-encoding": "gzip"},
+        )
+        self.assertEqual(response.status_code, 200)
+        *chunks, result = map(json.loads, response.text.splitlines())
+        self.assertEqual([chunk["rows"] for chunk in chunks], [500, 100])
+        self.assertEqual(
+            (result["imported"], result["rejected"], result["chunks"]), (600, 0, 2)
+        )
+        self.assertTrue(result["apply"]["ok"])
+        self.assertEqual(len(Peers.get_by_interface(interface)), 600)
+        self.assertEqual(api.applies.in_flight, 0)
+
+
+class TestBatch(ApiTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.rewrites = os.path.join(self.config_dir, "custom.list")
+        self.enterContext(patch.object(api, "ph", PiHole(self.rewrites)))
+        self.apply_changed = self.enterContext(
+            patch.object(self.wg, "apply_changed", wraps=self.wg.apply_changed)
+        )
+
+    def test_failed_operation_rolls_back(self):
+        interface = add_interface("wg0", enabled=True)
+        response = self.client.post(
+            "/api/batch/",
+            json={
+                "operations": [
+                    {
+                        "op": "create_peer",
+                        "interface_id": interface.id,
+                        "peer": {"name": "a", "address": "10.20.0.2"},
+                    },
+                    {"op": "add_dns_rewrite", "domain": "a.lan", "ip": "10.20.0.2"},
+                    {"op": "delete_peer", "peer_id": 999},
+                ]
+            },
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["detail"]["index"], 2)
+        self.assertEqual(Peers.get_by_interface(interface), [])
+        self.assertFalse(os.path.exists(self.rewrites))
+        self.apply_changed.assert_not_called()
+
+    def test_dns_conflict_rolls_back(self):
+        interface = add_interface("wg0", enabled=True)
+        api.ph.add_rewrite("a.lan", IPv4Address("10.20.0.9"))
+        response = self.client.post(
+            "/api/batch/",
+            json={
+                "operations": [
+                    {
+                        "op": "create_peer",
+                        "interface_id": interface.id,
+                        "peer": {"name": "a", "address": "10.20.0.2"},
+                    },
+                    {"op": "add_dns_rewrite", "domain": "a.lan", "ip": "10.20.0.2"},
+                ]
+            },
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["detail"]["index"], 1)
+        self.assertEqual(Peers.get_by_interface(interface), [])
+        with open(self.rewrites) as f:
+            self.assertEqual(f.read(), "10.20.0.9 a.lan")
+        self.apply_changed.assert_not_called()
+
+    def test_applies_each_interface_once(self):
+        first = add_interface("wg0", enabled=True)
+        second = add_interface("wg1", enabled=True)
+        peer = add_peer(second, 1)
+        self.wg.sync_all()
+        response = self.client.post(
+            "/api/batch/",
+            json={
+                "operations": [
+                    *(
+                        {
+                            "op": "create_peer",
+                            "interface_id": first.id,
+                            "peer": {"name": f"peer{n}", "address": f"10.20.0.{n}"},
+                        }
+                        for n in (2, 3)
+                    ),
+                    {"op": "update_peer", "peer_id": peer.id, "peer": {"name": "b"}},
+                    {
+                        "op": "update_interface",
+                        "interface_id": second.id,
+                        "interface": {"port": 51821},
+                    },
+                    {"op": "add_dns_rewrite", "domain": "a.lan", "ip": "10.20.0.2"},
+                ]
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(result["name"], result["ok"]) for result in response.json()["applied"]],
+            [("wg0", True), ("wg1", True)],
+        )
+        self.assertEqual(
+            sorted(
+                (call.args[0].name, call.args[1])
+                for call in self.apply_changed.call_args_list
+            ),
+            [("wg0", False), ("wg1", True)],
+        )
+        self.assertEqual(len(Peers.get_by_interface(first)), 2)
+        with open(self.rewrites) as f:
+            self.assertEqual(f.read(), "10.20.0.2 a.lan")
@@ -0,0 +1,210 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter, sleep
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from core_api.cluster import AgentError, Cluster, protocol
+from core_api.cluster.agent import Agent
+from core_api.cluster.cluster import parse_nodes
+from core_api.cluster.protocol import client_context, server_context
+from core_api.wireguard.diff import PeerConfig
+from core_api.wireguard.wg_connector import InterfaceInfo, PeerInfo
+
+TOKEN = "secret"
+
+
+class FakeWG:
+    """In-memory `WG` of one node."""
+
+    def __init__(self, *names: str, delay: float = 0) -> None:
+        self.running = {name: self._info(name) for name in names}
+        self.delay = delay
+        self.calls: list[tuple] = []
+
+    @staticmethod
+    def _info(name: str) -> InterfaceInfo:
+        info = InterfaceInfo(name, "private", "public", 51820, "off")
+        info.peers.append(
+            PeerInfo("peer", "psk", "(none)", "10.0.0.2/32", 0, 10, 20, None)
+        )
+        return info
+
+    def interfaces(self) -> list[str]:
+        return list(self.running)
+
+    def get_interfaces_info(self) -> list[InterfaceInfo]:
+        sleep(self.delay)
+        return list(self.running.values())
+
+    def get_interface_info(self, name: str) -> InterfaceInfo:
+        return self.running[name]
+
+    def set_peers(self, name, peers, remove) -> None:
+        self.calls.append(("set_peers", name, list(peers), list(remove)))
+
+    def up(self, name: str) -> None:
+        self.calls.append(("up", name))
+        self.running[name] = self._info(name)
+
+    def down(self, name: str) -> None:
+        self.calls.append(("down", name))
+        del self.running[name]
+
+
+class TestCluster(TestCase):
+    def setUp(self) -> None:
+        self.config_dir = TemporaryDirectory()
+        self.backends = {
+            "edge1": FakeWG("wg1"),
+            "edge2": FakeWG("wg2", "wg3"),
+            "slow": FakeWG("wg4", delay=2),
+        }
+        self.agents = []
+        nodes = {}
+        for name, backend in self.backends.items():
+            agent = Agent(
+                ("127.0.0.1", 0),
+                token=TOKEN,
+                wg=backend,
+                config_dir=self.config_dir.name,
+            )
+            Thread(target=agent.serve_forever, args=(0.05,), daemon=True).start()
+            self.agents.append(agent)
+            nodes[name] = agent.server_address
+        self.cluster = Cluster(nodes, token=TOKEN, timeout=0.5)
+
+    def tearDown(self) -> None:
+        for client in self.cluster.clients.values():
+            client.close()
+        for agent in self.agents:
+            agent.shutdown()
+            agent.server_close()
+        self.config_dir.cleanup()
+
+    def test_parse_nodes(self):
+        self.assertEqual(
+            parse_nodes("a=10.0.0.2:51900, b=[fd00::1]:7000"),
+            {"a": ("10.0.0.2", 51900), "b": ("fd00::1", 7000)},
+        )
+        with self.assertRaises(ValueError):
+            parse_nodes("local=127.0.0.1:1")
+        with self.assertRaises(ValueError):
+            parse_nodes("a=10.0.0.2")
+
+    def test_dump_all_tolerates_slow_node(self):
+        started = perf_counter()
+        dumps = self.cluster.dump_all()
+        self.assertLess(perf_counter() - started, 1.5)
+
+        self.assertEqual([info.name for info in dumps["edge1"].interfaces], ["wg1"])
+        self.assertEqual(
+            [info.name for info in dumps["edge2"].interfaces], ["wg2", "wg3"]
+        )
+        self.assertEqual(dumps["edge1"].interfaces[0].peers[0].transfer_tx, 20)
+        self.assertIsNone(dumps["slow"].interfaces)
+        self.assertIn("timed out", dumps["slow"].error)
+
+    def test_apply_config(self):
+        client = self.cluster.client("edge1")
+        self.assertTrue(client.apply_config("wg9", "[Interface]\n", enabled=True))
+        with open(os.path.join(self.config_dir.name, "wg9.conf")) as f:
+            self.assertEqual(f.read(), "[Interface]\n")
+        self.assertIn("wg9", client.interfaces())
+
+        self.assertFalse(client.apply_config("wg9", "[Interface]\n", enabled=True))
+        self.assertEqual(self.backends["edge1"].calls, [("up", "wg9")])
+
+        client.apply_config("wg9", "[Interface]\n", enabled=False)
+        self.assertNotIn("wg9", client.interfaces())
+
+    def test_set_peers(self):
+        self.cluster.client("edge2").set_peers(
+            "wg2", [PeerConfig("key", "psk", "10.0.0.3/32")], ["old"]
+        )
+        self.assertEqual(
+            self.backends["edge2"].calls,
+            [("set_peers", "wg2", [PeerConfig("key", "psk", "10.0.0.3/32")], ["old"])],
+        )
+
+    def test_errors(self):
+        with self.assertRaises(AgentError):
+            self.cluster.client("edge1").get_interface_info("missing")
+        # The connection is still usable after an error reply
+        self.assertEqual(self.cluster.client("edge1").interfaces(), ["wg1"])
+
+        client = Cluster(
+            {"edge1": self.agents[0].server_address}, token="wrong"
+        ).client("edge1")
+        with self.assertRaises(AgentError):
+            client.interfaces()
+        client.close()
+
+    def test_rejects_bad_names(self):
+        client = self.cluster.client("edge1")
+        for name in ["../wg0", "wg0/x", "", "a" * 16]:
+            with self.assertRaises(AgentError):
+                client.write_config(name, "[Interface]\n")
+        self.assertEqual(os.listdir(self.config_dir.name), [])
+
+    def test_rejects_long_messages(self):
+        self.enterContext(patch.object(protocol, "MAX_MESSAGE", 1024))
+        with socket.create_connection(self.agents[0].server_address) as sock:
+            f = sock.makefile("rwb")
+            f.write(b'{"token": "' + b"x" * 4096 + b'"}\n')
+            f.flush()
+            self.assertIn("longer than 1024", json.loads(f.readline())["error"])
+            self.assertEqual(f.readline(), b"")
+        self.assertEqual(self.cluster.client("edge1").interfaces(), ["wg1"])
+
+    def test_requires_token(self):
+        with self.assertRaises(ValueError):
+            Agent(("127.0.0.1", 0), token="", wg=FakeWG())
+
+
+@skipUnless(shutil.which("openssl"), "openssl is not installed")
+class TestTLS(TestCase):
+    def setUp(self) -> None:
+        directory = self.enterContext(TemporaryDirectory())
+        cert, key = os.path.join(directory, "cert.pem"), os.path.join(
+            directory, "key.pem"
+        )
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes"]
+            + ["-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=wghub"]
+            + ["-addext", "subjectAltName=IP:127.0.0.1"],
+            check=True,
+            capture_output=True,
+        )
+        self.agent = Agent(
+            ("127.0.0.1", 0),
+            token=TOKEN,
+            wg=FakeWG("wg1"),
+            tls=server_context(cert, key),
+        )
+        Thread(target=self.agent.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(self.agent.server_close)
+        self.addCleanup(self.agent.shutdown)
+        self.cert = cert
+
+    def test_round_trip(self):
+        cluster = Cluster(
+            {"edge1": self.agent.server_address},
+            token=TOKEN,
+            tls=client_context(self.cert),
+        )
+        self.addCleanup(cluster.client("edge1").close)
+        self.assertEqual(cluster.client("edge1").interfaces(), ["wg1"])
+
+    def test_plaintext_client_is_refused(self):
+        client = Cluster(
+            {"edge1": self.agent.server_address}, token=TOKEN, timeout=0.5
+        ).client("edge1")
+        self.addCleanup(client.close)
+        with self.assertRaises(Exception):
+            client.interfaces()
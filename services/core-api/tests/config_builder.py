@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from core_api.wireguard.config_builder import (
+    InterfaceBuilder,
+    PeerBuilder,
+    render_interface,
+)
+
+
+class TestRenderInterface(TestCase):
+    ROWS = [
+        ("pub1", "psk1", "10.0.0.2/32"),
+        ("pub2", "", "10.0.0.3/32, 10.1.0.0/24"),
+    ]
+
+    def builder(self) -> InterfaceBuilder:
+        return (
+            InterfaceBuilder("wg0")
+            .address("10.0.0.1/24")
+            .listen_port("51820")
+            .private_key("private")
+            .pre_up("")
+        )
+
+    def test_matches_builder(self):
+        builder = self.builder()
+        for public_key, preshared_key, allowed_ips in self.ROWS:
+            builder.add_peer(
+                PeerBuilder()
+                .public_key(public_key)
+                .preshared_key(preshared_key)
+                .allowed_ips(allowed_ips)
+            )
+        self.assertEqual(
+            "".join(render_interface(self.builder(), self.ROWS)), builder.build()
+        )
+
+    def test_without_peers(self):
+        self.assertEqual(
+            "".join(render_interface(self.builder(), [])), self.builder().build()
+        )
+
+    def test_consumes_rows_lazily(self):
+        def rows():
+            yield self.ROWS[0]
+            raise AssertionError("rows consumed eagerly")
+
+        chunks = render_interface(self.builder(), rows())
+        self.assertTrue(next(chunks).startswith("[Interface]"))
+        self.assertEqual(next(chunks), "\n\n")
+        self.assertTrue(next(chunks).startswith("[Peer]"))
@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+from core_api.wireguard.diff import PeerConfig, diff_peers
+from core_api.wireguard.wg_connector import PeerInfo
+
+
+def info(public_key: str, preshared_key: str, allowed_ips: str) -> PeerInfo:
+    return PeerInfo.from_dump(
+        "\t".join(
+            [public_key, preshared_key, "(none)", allowed_ips, "0", "0", "0", "off"]
+        )
+    )
+
+
+class TestDiffPeers(TestCase):
+    def test_in_sync(self):
+        diff = diff_peers(
+            [PeerConfig("a", "psk", "10.0.0.2/32, 10.1.0.0/24")],
+            [info("a", "psk", "10.1.0.0/24,10.0.0.2/32")],
+        )
+        self.assertFalse(diff)
+
+    def test_missing_changed_and_extra(self):
+        diff = diff_peers(
+            [
+                PeerConfig("new", "psk1", "10.0.0.2/32"),
+                PeerConfig("psk", "psk2", "10.0.0.3/32"),
+                PeerConfig("ips", "psk3", "10.0.0.4/32"),
+                PeerConfig("same", "", "10.0.0.5/32"),
+            ],
+            [
+                info("psk", "old", "10.0.0.3/32"),
+                info("ips", "psk3", "10.0.0.40/32"),
+                info("same", "(none)", "10.0.0.5/32"),
+                info("extra", "psk4", "10.0.0.6/32"),
+            ],
+        )
+        self.assertEqual(
+            [peer.public_key for peer in diff.upsert], ["new", "psk", "ips"]
+        )
+        self.assertEqual(diff.remove, ["extra"])
+        self.assertEqual(diff.added, 1)
+        self.assertEqual(len(diff), 4)
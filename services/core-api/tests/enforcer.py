@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from core_api.storages import GroupQuotas, PeerChanges, Peers
+from core_api.storages.connector import Table
+from core_api.wireguard import enforcer
+from core_api.wireguard.enforcer import PeerEnforcer
+
+from tests.storages import temporary_storage
+from tests.wireguard import add_interface, add_peer
+
+NOW = 1_725_000_000
+
+
+class FakeWireguard:
+    def __init__(self) -> None:
+        self.applied: list[list[int]] = []
+
+    def get_interface(self, id: int):
+        return SimpleNamespace(id=id)
+
+    def apply_peers(self, interface) -> None:
+        pass
+
+    def apply_all(self, apply, interfaces) -> list:
+        self.applied.append([interface.id for interface in interfaces])
+        return []
+
+
+class FakeAccounting:
+    def __init__(self) -> None:
+        self.exceeded: list[tuple[int, str]] = []
+
+    def take_exceeded(self) -> list[tuple[int, str]]:
+        exceeded, self.exceeded = self.exceeded, []
+        return exceeded
+
+
+def peer(id: int, interface_id: int, expires_at: int | None, enabled: bool = True):
+    return SimpleNamespace(
+        id=id, interface_id=interface_id, expires_at=expires_at, enabled=enabled
+    )
+
+
+class TestPeerEnforcer(TestCase):
+    def setUp(self) -> None:
+        self.enterContext(temporary_storage())
+        Table.create_tables()
+        self.disabled: list[int] = []
+        self.disabled_keys: list[str] = []
+        for patcher in (
+            patch.object(
+                enforcer.Peers,
+                "iter_expiring",
+                lambda: iter([(1, 1, NOW + 10), (2, 1, NOW + 20), (3, 2, NOW + 10)]),
+            ),
+            patch.object(enforcer.Peers, "disable", self.disabled.extend),
+            patch.object(
+                enforcer.Peers, "disable_by_public_keys", self.disabled_keys.extend
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.wg = FakeWireguard()
+        self.accounting = FakeAccounting()
+        self.enforcer = PeerEnforcer(self.wg, self.accounting)
+        self.enforcer.load()
+
+    def test_expiry(self):
+        self.enforcer.tick(NOW)
+        self.assertEqual((self.disabled, self.wg.applied), ([], []))
+
+        self.enforcer.tick(NOW + 15)
+        self.assertEqual(sorted(self.disabled), [1, 3])
+        # One apply per affected interface
+        self.assertEqual(self.wg.applied, [[1, 2]])
+
+        self.enforcer.tick(NOW + 15)
+        self.assertEqual(len(self.wg.applied), 1)
+
+    def test_rescheduled_and_disabled_peers(self):
+        self.enforcer.schedule(peer(1, 1, NOW + 100))
+        self.enforcer.schedule(peer(2, 1, NOW + 20, enabled=False))
+        self.enforcer.schedule(peer(4, 3, NOW + 5))
+
+        self.enforcer.tick(NOW + 30)
+        self.assertEqual(sorted(self.disabled), [3, 4])
+        self.enforcer.tick(NOW + 100)
+        self.assertEqual(sorted(self.disabled), [1, 3, 4])
+
+    def test_quota(self):
+        self.accounting.exceeded = [(2, "a"), (5, "b")]
+        self.enforcer.tick(NOW)
+        self.assertEqual(self.disabled_keys, ["a", "b"])
+        self.assertEqual(self.wg.applied, [[2, 5]])
+
+
+class TestScheduleChanges(TestCase):
+    def setUp(self) -> None:
+        self.enterContext(temporary_storage())
+        Table.create_tables()
+        self.wg = FakeWireguard()
+        self.enforcer = PeerEnforcer(self.wg)
+
+    def test_schedules_written_peers(self):
+        interface = add_interface("wg0")
+        first, second = add_peer(interface, 1), add_peer(interface, 2)
+        first.expires_at = second.expires_at = NOW + 10
+        Peers.update(first)
+        self.enforcer.load()
+
+        with patch.object(Peers, "iter_expiring") as iter_expiring:
+            # Written by another worker
+            Peers.update(second)
+            Peers.delete(first.id)
+            GroupQuotas.set("team", 100)
+            self.enforcer.tick(NOW + 20)
+        iter_expiring.assert_not_called()
+        self.assertEqual(self.wg.applied, [[interface.id]])
+        self.assertFalse(Peers.get(second.id).enabled)
+        # Changes are pruned once scheduled, the latest one is kept
+        self.enforcer.tick(NOW + 20)
+        self.assertEqual(len(PeerChanges.since(0)), 1)
@@ -0,0 +1,211 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import TestCase, enterModuleContext
+
+from core_api.storages.connector import Table
+from core_api.wireguard.events import EventBus, PeerEvent
+from core_api.wireguard.presence import PresenceIndex
+from core_api.wireguard.sampler import StatsSampler
+from core_api.wireguard.snapshot import PeerStats, StatsSnapshot
+from core_api.wireguard.wg_connector import InterfaceInfo, PeerInfo
+
+from tests.storages import temporary_storage
+
+NOW = 1_700_000_000
+
+
+def setUpModule() -> None:
+    # The sampler's accounting reads the traffic usage table
+    enterModuleContext(temporary_storage())
+    Table.create_tables()
+
+
+class FakeWireguard:
+    def __init__(self) -> None:
+        self.interfaces = [SimpleNamespace(id=1, name="wg0", node="local")]
+        self.peers: dict[str, tuple[int, int, int]] = {}
+
+    def get_interfaces_info(self) -> dict[str, list[InterfaceInfo]]:
+        info = InterfaceInfo("wg0", "private", "public", 51820, "off")
+        info.peers.extend(
+            PeerInfo(key, "", "(none)", "", handshake, rx, tx, None)
+            for key, (handshake, rx, tx) in self.peers.items()
+        )
+        return {"local": [info]}
+
+
+def event(type: str, interface_id: int = 1) -> PeerEvent:
+    return PeerEvent(
+        type=type,
+        interface_id=interface_id,
+        interface="wg0",
+        public_key="a",
+        latest_handshake=0,
+        transfer_rx=0,
+        transfer_tx=0,
+        time=0,
+    )
+
+
+class TestStatsSampler(TestCase):
+    def setUp(self) -> None:
+        self.wg = FakeWireguard()
+        self.sampler = StatsSampler(
+            self.wg, EventBus(), traffic_threshold=1000, online_window=180
+        )
+
+    def types(self, now: float) -> list[tuple[str, str]]:
+        return [(e.type, e.public_key) for e in self.sampler.sample(now)]
+
+    def test_changes(self):
+        self.wg.peers = {"a": (NOW, 0, 0), "b": (0, 0, 0)}
+        self.assertEqual(self.types(NOW), [])
+
+        # Traffic below the threshold is accumulated
+        self.wg.peers["a"] = (NOW, 400, 400)
+        self.assertEqual(self.types(NOW + 5), [])
+        self.wg.peers["a"] = (NOW + 8, 600, 500)
+        events = self.sampler.sample(NOW + 10)
+        self.assertEqual([e.type for e in events], ["handshake", "traffic"])
+        self.assertEqual((events[1].rx_delta, events[1].tx_delta), (600, 500))
+
+        self.wg.peers["b"] = (NOW + 20, 10, 10)
+        self.assertEqual(self.types(NOW + 20), [("online", "b"), ("handshake", "b")])
+
+        self.assertEqual(self.types(NOW + 300), [("offline", "a"), ("offline", "b")])
+
+    def test_new_and_removed_peers(self):
+        self.wg.peers = {"a": (NOW, 0, 0)}
+        self.sampler.sample(NOW)
+
+        self.wg.peers = {"c": (NOW, 0, 0)}
+        self.assertEqual(self.types(NOW + 5), [("online", "c"), ("offline", "a")])
+
+    def test_counter_reset(self):
+        self.wg.peers = {"a": (NOW, 5000, 5000)}
+        self.sampler.sample(NOW)
+        self.wg.peers = {"a": (NOW, 10, 10)}
+        self.assertEqual(self.types(NOW + 5), [])
+
+
+class TestEventBus(TestCase):
+    def test_subscriptions(self):
+        async def run():
+            bus = EventBus(queue_size=10)
+            all_events = bus.subscribe()
+            wg2 = bus.subscribe({2})
+            bus.publish([event("online", 1), event("offline", 2)])
+
+            self.assertEqual((await all_events.get(1)).type, "online")
+            self.assertEqual((await all_events.get(1)).type, "offline")
+            self.assertEqual((await wg2.get(1)).type, "offline")
+            with self.assertRaises(asyncio.TimeoutError):
+                await wg2.get(0.05)
+
+            wg2.close()
+            self.assertEqual(len(bus), 1)
+
+        asyncio.run(run())
+
+    def test_slow_consumer_is_dropped(self):
+        async def run():
+            bus = EventBus(queue_size=2)
+            slow = bus.subscribe()
+            fast = bus.subscribe()
+            for _ in range(3):
+                bus.publish([event("handshake")])
+                await fast.get(1)
+            await asyncio.sleep(0)
+
+            self.assertTrue(slow.dropped)
+            self.assertEqual([e async for e in slow], [])
+            self.assertEqual(len(bus), 1)
+
+        asyncio.run(run())
+
+
+class TestPresenceIndex(TestCase):
+    def test_online(self):
+        index = PresenceIndex()
+        index.update(1, "a", NOW - 500)
+        index.update(1, "b", NOW - 10)
+        index.update(1, "c", NOW - 100)
+        index.update(2, "d", NOW)
+
+        self.assertEqual(
+            index.online(1, NOW - 180), [("b", NOW - 10), ("c", NOW - 100)]
+        )
+        self.assertEqual(index.counts(NOW - 180), {1: 2, 2: 1})
+
+        index.update(1, "a", NOW)
+        index.remove(1, "b")
+        index.remove(2, "d")
+        self.assertEqual(index.online(1, NOW - 180), [("a", NOW), ("c", NOW - 100)])
+        self.assertEqual(index.count(2, 0), 0)
+        self.assertEqual(index.counts(NOW - 50), {1: 1})
+
+    def test_sampler_updates_index(self):
+        wg = FakeWireguard()
+        sampler = StatsSampler(wg, EventBus())
+        wg.peers = {"a": (NOW - 300, 0, 0), "b": (NOW - 5, 0, 0)}
+        sampler.sample(NOW)
+        self.assertEqual(sampler.presence.online(1, NOW - 180), [("b", NOW - 5)])
+
+        wg.peers = {"a": (NOW + 5, 0, 0)}
+        sampler.sample(NOW + 10)
+        self.assertEqual(sampler.presence.online(1, NOW - 180), [("a", NOW + 5)])
+
+
+def stats(public_key: str, rx: int = 0) -> PeerStats:
+    return PeerStats(
+        interface_id=1,
+        public_key=public_key,
+        latest_handshake=0,
+        transfer_rx=rx,
+        transfer_tx=0,
+    )
+
+
+class TestStatsSnapshot(TestCase):
+    def keys(self, snapshot: StatsSnapshot, since: int) -> tuple:
+        delta = snapshot.changes(since)
+        return (
+            delta.cursor,
+            delta.reset,
+            sorted(peer.public_key for peer in delta.peers),
+            sorted(peer.public_key for peer in delta.removed),
+        )
+
+    def test_changes(self):
+        snapshot = StatsSnapshot()
+        cursor = snapshot.apply([stats("a"), stats("b"), stats("c")], [])
+        self.assertEqual(self.keys(snapshot, 0), (1, False, ["a", "b", "c"], []))
+
+        snapshot.apply([stats("a", 10)], [(1, "b")])
+        self.assertEqual(self.keys(snapshot, cursor), (2, False, ["a"], ["b"]))
+        self.assertEqual(self.keys(snapshot, 2), (2, False, [], []))
+        self.assertEqual(snapshot.apply([], []), 2)
+
+        snapshot.apply([stats("b")], [])
+        self.assertEqual(self.keys(snapshot, 2), (3, False, ["b"], []))
+
+    def test_old_cursor_resets(self):
+        snapshot = StatsSnapshot(max_removed=1)
+        snapshot.apply([stats("a"), stats("b"), stats("c")], [])
+        snapshot.apply([], [(1, "a")])
+        snapshot.apply([], [(1, "b")])
+
+        self.assertEqual(self.keys(snapshot, 0), (3, True, ["c"], []))
+        self.assertEqual(self.keys(snapshot, 2), (3, False, [], ["b"]))
+        self.assertEqual(self.keys(snapshot, 9), (3, True, ["c"], []))
+
+    def test_sampler_records_changes(self):
+        wg = FakeWireguard()
+        sampler = StatsSampler(wg, EventBus())
+        wg.peers = {"a": (NOW, 0, 0), "b": (NOW, 0, 0)}
+        sampler.sample(NOW)
+        cursor = sampler.snapshot.version
+
+        wg.peers = {"a": (NOW, 10, 0)}
+        sampler.sample(NOW + 5)
+        self.assertEqual(self.keys(sampler.snapshot, cursor), (2, False, ["a"], ["b"]))
@@ -0,0 +1,42 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from core_api.files import AtomicFile, atomic_write
+
+
+class TestAtomicFile(TestCase):
+    def setUp(self) -> None:
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, "wg0.conf")
+        atomic_write(self.path, "old")
+        os.chmod(self.path, 0o600)
+
+    def read(self) -> str:
+        with open(self.path) as f:
+            return f.read()
+
+    def test_replaces_when_done(self):
+        with AtomicFile(self.path) as f:
+            f.write(b"new")
+            self.assertEqual(self.read(), "old")
+        self.assertEqual(self.read(), "new")
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        self.assertEqual(os.listdir(self.directory), ["wg0.conf"])
+
+    def test_discard(self):
+        with AtomicFile(self.path) as f:
+            f.write(b"new")
+            f.discard()
+        self.assertEqual(self.read(), "old")
+        self.assertEqual(os.listdir(self.directory), ["wg0.conf"])
+
+    def test_error_keeps_the_file(self):
+        with self.assertRaises(RuntimeError):
+            with AtomicFile(self.path) as f:
+                f.write(b"new")
+                raise RuntimeError("Failed")
+        self.assertEqual(self.read(), "old")
+        self.assertEqual(os.listdir(self.directory), ["wg0.conf"])
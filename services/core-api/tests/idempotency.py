@@ -0,0 +1,169 @@
+import asyncio
+from typing import Annotated
+from unittest import TestCase
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from core_api.idempotency import IdempotencyCache, IdempotencyKey
+from core_api.responses import ModelResponse
+from core_api.storages import IdempotencyKeys
+from core_api.storages.connector import Table
+
+from tests.storages import temporary_storage
+
+
+class Item(BaseModel):
+    name: str
+
+
+class Created(BaseModel):
+    id: int
+    name: str
+
+
+app = FastAPI()
+cache = IdempotencyCache(size=2, ttl=60)
+created: list[Created] = []
+
+
+async def create(item: Item) -> ModelResponse:
+    if item.name == "fail" and not created:
+        created.append(Created(id=0, name="failed"))
+        raise HTTPException(status_code=500, detail="Failed")
+    created.append(Created(id=len(created), name=item.name))
+    return ModelResponse(created[-1], status_code=201)
+
+
+@app.put("/items")
+async def put_item(
+    request: Request,
+    item: Item,
+    idempotency_key: IdempotencyKey = None,
+    authorization: Annotated[str, Header()] = "",
+):
+    return await cache.run(
+        request, idempotency_key, lambda: create(item), authorization
+    )
+
+
+class TestIdempotency(TestCase):
+    def setUp(self) -> None:
+        self.enterContext(temporary_storage())
+        Table.create_tables()
+        created.clear()
+        self.client = TestClient(app)
+
+    def put(self, name: str, key: str | None, token: str = "a"):
+        headers = {"idempotency-key": key} if key else {}
+        return self.client.put(
+            "/items",
+            json={"name": name},
+            headers={**headers, "authorization": f"Bearer {token}"},
+        )
+
+    def test_replays(self):
+        first = self.put("a", "k1")
+        retry = self.put("a", "k1")
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry.headers["idempotent-replayed"], "true")
+        self.assertNotIn("idempotent-replayed", first.headers)
+        self.assertEqual(len(created), 1)
+
+    def test_scoped_by_token(self):
+        first = self.put("a", "k1")
+        other = self.put("a", "k1", token="b")
+        self.assertNotIn("idempotent-replayed", other.headers)
+        self.assertNotEqual(other.json(), first.json())
+        self.assertEqual(self.put("a", "k1", token="b").json(), other.json())
+        self.assertEqual(len(created), 2)
+
+    def test_without_key(self):
+        self.put("a", None)
+        self.put("a", None)
+        self.assertEqual(len(created), 2)
+
+    def test_other_request(self):
+        self.put("a", "k1")
+        self.assertEqual(self.put("b", "k1").status_code, 422)
+
+    def test_errors_are_not_stored(self):
+        self.assertEqual(self.put("fail", "k1").status_code, 500)
+        self.assertEqual(self.put("fail", "k1").json()["id"], 1)
+
+    def test_bounded(self):
+        for key in ("k1", "k2", "k3"):
+            self.put("a", key)
+        self.assertIsNone(IdempotencyKeys.get("Bearer a:k1"))
+        self.assertIsNotNone(IdempotencyKeys.get("Bearer a:k3"))
+        self.assertEqual(self.put("a", "k2").headers["idempotent-replayed"], "true")
+
+    def test_expires(self):
+        cache.ttl = 0
+        self.addCleanup(setattr, cache, "ttl", 60)
+        self.put("a", "k1")
+        self.put("a", "k1")
+        self.assertEqual(len(created), 2)
+
+
+class FakeRequest:
+    method = "PUT"
+    url = type("URL", (), {"path": "/items"})
+
+    async def body(self) -> bytes:
+        return b"{}"
+
+
+class TestConcurrentRetry(TestCase):
+    def setUp(self) -> None:
+        self.enterContext(temporary_storage())
+        Table.create_tables()
+
+    def test_waits_for_first_request(self):
+        cache = IdempotencyCache()
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return ModelResponse(Created(id=len(calls), name="a"))
+
+        async def main():
+            return await asyncio.gather(
+                cache.run(FakeRequest(), "k", handler),
+                cache.run(FakeRequest(), "k", handler),
+            )
+
+        first, retry = asyncio.run(main())
+        self.assertEqual(first.body, retry.body)
+        self.assertEqual(len(calls), 1)
+
+    def test_waits_for_other_worker(self):
+        first, other = IdempotencyCache(), IdempotencyCache()
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return ModelResponse(Created(id=len(calls), name="a"))
+
+        async def main():
+            return await asyncio.gather(
+                first.run(FakeRequest(), "k", handler),
+                other.run(FakeRequest(), "k", handler),
+            )
+
+        response, retry = asyncio.run(main())
+        self.assertEqual(response.body, retry.body)
+        self.assertEqual(len(calls), 1)
+
+    def test_releases_stale_key(self):
+        cache = IdempotencyCache(pending_ttl=0)
+        IdempotencyKeys.claim("a:k", b"", 0, 0, 10)
+
+        async def handler():
+            return ModelResponse(Created(id=1, name="a"))
+
+        response = asyncio.run(cache.run(FakeRequest(), "k", handler, "a"))
+        self.assertNotIn(b"idempotent-replayed", dict(response.raw_headers))
@@ -0,0 +1,112 @@
+import sqlite3
+from threading import Event
+from time import sleep
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from core_api.storages import Jobs
+from core_api.storages.connector import Table
+from core_api.wireguard.jobs import JobQueue
+from core_api.wireguard.wireguard import ApplyResult
+
+from tests.storages import temporary_storage
+
+
+class FakeWireguard:
+    def __init__(self) -> None:
+        self.release = Event()
+        self.applied: list[tuple[str, bool]] = []
+
+    def apply_changed(self, interface, sync: bool) -> None:
+        self.release.wait(5)
+        self.applied.append((interface.name, sync))
+
+    def run_apply(self, apply, interface) -> ApplyResult:
+        apply(interface)
+        return ApplyResult(
+            interface_id=interface.id, name=interface.name, ok=True, duration=0
+        )
+
+
+def interface(id: int, name: str) -> SimpleNamespace:
+    return SimpleNamespace(id=id, name=name)
+
+
+class TestJobQueue(TestCase):
+    def setUp(self) -> None:
+        self.enterContext(temporary_storage())
+        Table.create_tables()
+        self.wg = FakeWireguard()
+        self.jobs = JobQueue(self.wg, workers=2, history=2)
+        self.addCleanup(self.jobs.stop)
+
+    def wait(self, id: str, status: tuple[str, ...] = ("done", "failed")):
+        for _ in range(500):
+            if (job := self.jobs.get(id)).status in status:
+                return job
+            sleep(0.01)
+        self.fail(f"Job {id} is not {' or '.join(status)}")
+
+    def test_merges_queued_jobs(self):
+        running = self.jobs.submit(interface(1, "wg0"), sync=False)
+        self.wait(running.id, ("running",))
+        first = self.jobs.submit(interface(1, "wg0"), sync=False)
+        second = self.jobs.submit(interface(1, "wg0-renamed"), sync=True)
+        self.assertEqual(first.id, second.id)
+        self.assertNotEqual(running.id, first.id)
+        self.assertEqual(second.requests, 2)
+
+        self.wg.release.set()
+        self.assertEqual(self.wait(running.id).status, "done")
+        job = self.wait(second.id)
+        self.assertTrue(job.sync)
+        self.assertEqual(self.wg.applied, [("wg0", False), ("wg0-renamed", True)])
+
+    def test_interfaces_run_in_parallel(self):
+        a = self.jobs.submit(interface(1, "wg0"), sync=True)
+        b = self.jobs.submit(interface(2, "wg1"), sync=True)
+        self.wg.release.set()
+        self.assertEqual(self.wait(a.id).status, "done")
+        self.assertEqual(self.wait(b.id).status, "done")
+
+    def test_keeps_history(self):
+        self.wg.release.set()
+        ids = []
+        for id in range(3):
+            ids.append(self.jobs.submit(interface(id, f"wg{id}"), sync=True).id)
+            self.wait(ids[-1])
+        self.jobs.submit(interface(9, "wg9"), sync=True)
+        self.assertIsNone(self.jobs.get(ids[0]))
+        self.assertIsNotNone(self.jobs.get(ids[2]))
+
+    def test_storage_errors_do_not_block_the_interface(self):
+        self.wg.release.set()
+        save = Jobs.save
+
+        def locked(job: dict) -> None:
+            if job["status"] == "running":
+                raise sqlite3.OperationalError("database is locked")
+            save(job)
+
+        with patch.object(Jobs, "save", locked):
+            job = self.jobs.submit(interface(1, "wg0"), sync=True)
+            failed = self.wait(job.id)
+        self.assertEqual(failed.result.error, "database is locked")
+        self.assertEqual(self.wg.applied, [])
+
+        job = self.jobs.submit(interface(1, "wg0"), sync=True)
+        self.assertEqual(self.wait(job.id).status, "done")
+        self.assertEqual(self.wg.applied, [("wg0", True)])
+
+    def test_status_of_other_workers(self):
+        other = JobQueue(self.wg, workers=1)
+        self.addCleanup(other.stop)
+        job = self.jobs.submit(interface(1, "wg0"), sync=True)
+        self.assertIn(other.get(job.id).status, ("queued", "running"))
+        self.wg.release.set()
+        self.wait(job.id)
+        finished = other.get(job.id)
+        self.assertEqual(finished.status, "done")
+        self.assertEqual(finished.result.name, "wg0")
+        self.assertIsNone(other.get("missing"))
@@ -0,0 +1,24 @@
+from base64 import b64decode, b64encode
+from unittest import TestCase
+
+from core_api.wireguard.keys import genkey, genpsk, pubkey
+
+
+class TestKeys(TestCase):
+    def test_rfc7748_vectors(self):
+        alice = b64encode(
+            bytes.fromhex(
+                "77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a"
+            )
+        ).decode()
+        self.assertEqual(
+            b64decode(pubkey(alice)).hex(),
+            "8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a",
+        )
+
+    def test_keys(self):
+        private_key = genkey()
+        self.assertEqual(len(b64decode(private_key)), 32)
+        self.assertEqual(b64decode(private_key)[0] & 7, 0)
+        self.assertEqual(len(b64decode(pubkey(private_key))), 32)
+        self.assertNotEqual(genpsk(), genpsk())
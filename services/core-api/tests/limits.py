@@ -0,0 +1,70 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from fastapi import HTTPException
+
+from core_api import limits
+from core_api.limits import ApplyGate, RateLimiter, TokenBucket
+
+
+class TestTokenBucket(TestCase):
+    def test_burst_and_refill(self):
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+        self.assertEqual([bucket.take(0) for _ in range(3)], [0, 0, 0])
+        self.assertEqual(bucket.take(0), 0.5)
+        self.assertEqual(bucket.take(0.5), 0)
+        bucket.take(100)
+        self.assertEqual(bucket.tokens, 2)
+
+
+class TestRateLimiter(TestCase):
+    def setUp(self) -> None:
+        patcher = patch.object(limits, "monotonic", return_value=0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_limits_per_client(self):
+        limiter = RateLimiter(rate=0.5, burst=1)
+        limiter.check("a")
+        with self.assertRaises(HTTPException) as error:
+            limiter.check("a")
+        self.assertEqual(error.exception.status_code, 429)
+        self.assertEqual(error.exception.headers, {"Retry-After": "2"})
+        limiter.check("b")
+        self.clock.return_value = 2
+        limiter.check("a")
+
+    def test_disabled(self):
+        limiter = RateLimiter(rate=0, burst=0)
+        for _ in range(10):
+            limiter.check("a")
+
+    def test_share_of_worker(self):
+        limiter = RateLimiter(rate=4, burst=10, workers=4)
+        self.assertEqual((limiter.rate, limiter.burst), (1, 3))
+        for _ in range(3):
+            limiter.check("a")
+        with self.assertRaises(HTTPException):
+            limiter.check("a")
+
+    def test_bounded(self):
+        limiter = RateLimiter(rate=1, burst=2, size=2)
+        for client in ("a", "b", "a", "c"):
+            limiter.check(client)
+        self.assertEqual(list(limiter._buckets), ["a", "c"])
+
+
+class TestApplyGate(TestCase):
+    def test_refuses_over_limit(self):
+        gate = ApplyGate(limit=1, retry_after=3)
+        gate.enter()
+        with self.assertRaises(HTTPException) as error:
+            gate.enter()
+        self.assertEqual(error.exception.status_code, 503)
+        self.assertEqual(error.exception.headers, {"Retry-After": "3"})
+        gate.exit()
+        gate.enter()
+
+    def test_share_of_worker(self):
+        self.assertEqual(ApplyGate(limit=8, workers=3).limit, 3)
+        self.assertEqual(ApplyGate(limit=0, workers=3).limit, 0)
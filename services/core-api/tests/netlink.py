@@ -0,0 +1,247 @@
+import errno
+import socket
+import struct
+from base64 import b64encode
+from unittest import TestCase
+
+from core_api.wireguard import netlink
+from core_api.wireguard.diff import PeerConfig
+from core_api.wireguard.netlink import (
+    GENL_HDR,
+    NLMSG_HDR,
+    NetlinkError,
+    WireguardNetlink,
+    attr,
+    nested,
+    parse_attrs,
+)
+
+FAMILY_ID = 0x1E
+PRIVATE_KEY = bytes(range(32))
+PUBLIC_KEY = bytes(range(1, 33))
+PEER_KEY = bytes([7] * 32)
+PSK = bytes([9] * 32)
+
+
+def message(type: int, body: bytes, flags: int = 0) -> bytes:
+    """Netlink message with seq 0, the stub fills in the request's seq."""
+    length = NLMSG_HDR.size + len(body)
+    return NLMSG_HDR.pack(length, type, flags, 0, 0) + body + bytes(-length % 4)
+
+
+def genl(cmd: int, *attrs: bytes) -> bytes:
+    return GENL_HDR.pack(cmd, 1, 0) + b"".join(attrs)
+
+
+def ack(error: int = 0) -> bytes:
+    return message(netlink.NLMSG_ERROR, struct.pack("=i", -error) + bytes(16))
+
+
+def done() -> bytes:
+    return message(netlink.NLMSG_DONE, struct.pack("=i", 0))
+
+
+FAMILY_REPLY = [
+    message(
+        netlink.GENL_ID_CTRL,
+        genl(
+            1,
+            attr(netlink.CTRL_ATTR_FAMILY_NAME, b"wireguard\0"),
+            attr(netlink.CTRL_ATTR_FAMILY_ID, struct.pack("=H", FAMILY_ID)),
+        ),
+    )
+    + ack()
+]
+
+
+def allowed_ip(family: int, address: bytes, cidr: int) -> bytes:
+    return nested(
+        0,
+        [
+            attr(netlink.WGALLOWEDIP_A_FAMILY, struct.pack("=H", family)),
+            attr(netlink.WGALLOWEDIP_A_IPADDR, address),
+            attr(netlink.WGALLOWEDIP_A_CIDR_MASK, struct.pack("=B", cidr)),
+        ],
+    )
+
+
+# WG_CMD_GET_DEVICE reply for one peer that the kernel split over two messages
+DEVICE_REPLY = [
+    message(
+        FAMILY_ID,
+        genl(
+            netlink.WG_CMD_GET_DEVICE,
+            attr(netlink.WGDEVICE_A_IFNAME, b"wg0\0"),
+            attr(netlink.WGDEVICE_A_PRIVATE_KEY, PRIVATE_KEY),
+            attr(netlink.WGDEVICE_A_PUBLIC_KEY, PUBLIC_KEY),
+            attr(netlink.WGDEVICE_A_LISTEN_PORT, struct.pack("=H", 51820)),
+            attr(netlink.WGDEVICE_A_FWMARK, struct.pack("=I", 0)),
+            nested(
+                netlink.WGDEVICE_A_PEERS,
+                [
+                    nested(
+                        0,
+                        [
+                            attr(netlink.WGPEER_A_PUBLIC_KEY, PEER_KEY),
+                            attr(netlink.WGPEER_A_PRESHARED_KEY, PSK),
+                            attr(
+                                netlink.WGPEER_A_ENDPOINT,
+                                struct.pack("=H", socket.AF_INET)
+                                + (51000).to_bytes(2, "big")
+                                + bytes([1, 2, 3, 4])
+                                + bytes(8),
+                            ),
+                            attr(
+                                netlink.WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL,
+                                struct.pack("=H", 25),
+                            ),
+                            attr(
+                                netlink.WGPEER_A_LAST_HANDSHAKE_TIME,
+                                struct.pack("=qq", 1700000000, 5),
+                            ),
+                            attr(netlink.WGPEER_A_RX_BYTES, struct.pack("=Q", 100)),
+                            attr(netlink.WGPEER_A_TX_BYTES, struct.pack("=Q", 200)),
+                            nested(
+                                netlink.WGPEER_A_ALLOWEDIPS,
+                                [allowed_ip(socket.AF_INET, bytes([10, 0, 0, 2]), 32)],
+                            ),
+                        ],
+                    )
+                ],
+            ),
+        ),
+        flags=0x2,
+    ),
+    message(
+        FAMILY_ID,
+        genl(
+            netlink.WG_CMD_GET_DEVICE,
+            attr(netlink.WGDEVICE_A_IFNAME, b"wg0\0"),
+            nested(
+                netlink.WGDEVICE_A_PEERS,
+                [
+                    nested(
+                        0,
+                        [
+                            attr(netlink.WGPEER_A_PUBLIC_KEY, PEER_KEY),
+                            nested(
+                                netlink.WGPEER_A_ALLOWEDIPS,
+                                [
+                                    allowed_ip(
+                                        socket.AF_INET6,
+                                        bytes([0xFD]) + bytes(14) + bytes([2]),
+                                        128,
+                                    )
+                                ],
+                            ),
+                        ],
+                    )
+                ],
+            ),
+        ),
+        flags=0x2,
+    )
+    + done(),
+]
+
+
+class StubSocket:
+    """Replays recorded replies and keeps the sent requests."""
+
+    def __init__(self, *replies: list[bytes]) -> None:
+        self.replies = [datagram for reply in replies for datagram in reply]
+        self.sent: list[bytes] = []
+        self.seq = 0
+
+    def send(self, data: bytes) -> int:
+        self.sent.append(data)
+        self.seq = NLMSG_HDR.unpack_from(data)[3]
+        return len(data)
+
+    def recv(self, size: int) -> bytes:
+        data = bytearray(self.replies.pop(0))
+        offset = 0
+        while offset < len(data):
+            length = NLMSG_HDR.unpack_from(data, offset)[0]
+            struct.pack_into("=I", data, offset + 8, self.seq)
+            offset += (length + 3) & ~3
+        return bytes(data)
+
+
+class TestWireguardNetlink(TestCase):
+    def test_resolves_family(self):
+        client = WireguardNetlink(StubSocket(FAMILY_REPLY))
+        self.assertEqual(client.family_id, FAMILY_ID)
+
+    def test_missing_family(self):
+        with self.assertRaises(NetlinkError) as error:
+            WireguardNetlink(StubSocket([ack(errno.ENOENT)]))
+        self.assertEqual(error.exception.errno, errno.ENOENT)
+
+    def test_get_device(self):
+        client = WireguardNetlink(StubSocket(FAMILY_REPLY, DEVICE_REPLY))
+        info = client.get_device("wg0")
+
+        self.assertEqual(info.name, "wg0")
+        self.assertEqual(info.private_key, b64encode(PRIVATE_KEY).decode())
+        self.assertEqual(info.public_key, b64encode(PUBLIC_KEY).decode())
+        self.assertEqual(info.listen_port, 51820)
+        self.assertEqual(info.fwmark, "off")
+        self.assertEqual(len(info.peers), 1)
+
+        peer = info.peers[0]
+        self.assertEqual(peer.public_key, b64encode(PEER_KEY).decode())
+        self.assertEqual(peer.preshared_key, b64encode(PSK).decode())
+        self.assertEqual(peer.endpoint, "1.2.3.4:51000")
+        self.assertEqual(peer.endpoint_address, ("1.2.3.4", 51000))
+        self.assertEqual(peer.persistent_keepalive, 25)
+        self.assertEqual(peer.latest_handshake, 1700000000)
+        self.assertEqual((peer.transfer_rx, peer.transfer_tx), (100, 200))
+        self.assertEqual(peer.allowed_ips, "10.0.0.2/32,fd00::2/128")
+
+    def test_set_peers(self):
+        sock = StubSocket(FAMILY_REPLY, [ack()])
+        client = WireguardNetlink(sock)
+        client.set_peers(
+            "wg0",
+            [PeerConfig(b64encode(PEER_KEY).decode(), "", "10.0.0.2/32, fd00::/64")],
+            [b64encode(PSK).decode()],
+        )
+
+        request = sock.sent[-1]
+        length, type, flags, _, _ = NLMSG_HDR.unpack_from(request)
+        self.assertEqual((length, type), (len(request), FAMILY_ID))
+        self.assertTrue(flags & netlink.NLM_F_ACK)
+        self.assertEqual(request[NLMSG_HDR.size], netlink.WG_CMD_SET_DEVICE)
+
+        attrs = dict(parse_attrs(request[NLMSG_HDR.size + GENL_HDR.size :]))
+        self.assertEqual(attrs[netlink.WGDEVICE_A_IFNAME], b"wg0\0")
+        upsert, removal = (
+            dict(parse_attrs(peer))
+            for _, peer in parse_attrs(attrs[netlink.WGDEVICE_A_PEERS])
+        )
+
+        self.assertEqual(upsert[netlink.WGPEER_A_PUBLIC_KEY], PEER_KEY)
+        self.assertEqual(upsert[netlink.WGPEER_A_PRESHARED_KEY], bytes(32))
+        self.assertEqual(
+            struct.unpack("=I", upsert[netlink.WGPEER_A_FLAGS])[0],
+            netlink.WGPEER_F_REPLACE_ALLOWEDIPS,
+        )
+        self.assertEqual(
+            [
+                netlink._allowed_ip(item)
+                for _, item in parse_attrs(upsert[netlink.WGPEER_A_ALLOWEDIPS])
+            ],
+            ["10.0.0.2/32", "fd00::/64"],
+        )
+
+        self.assertEqual(removal[netlink.WGPEER_A_PUBLIC_KEY], PSK)
+        self.assertEqual(
+            struct.unpack("=I", removal[netlink.WGPEER_A_FLAGS])[0],
+            netlink.WGPEER_F_REMOVE_ME,
+        )
+
+    def test_set_peers_error(self):
+        client = WireguardNetlink(StubSocket(FAMILY_REPLY, [ack(errno.ENODEV)]))
+        with self.assertRaises(NetlinkError):
+            client.set_peers("wg9", remove=[b64encode(PSK).decode()])
@@ -0,0 +1,105 @@
+import os
+from ipaddress import IPv4Address
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from unittest import TestCase
+
+from core_api.pihole.connector import PiHole
+
+
+class TestPiHoleConcurrency(TestCase):
+    WRITERS = 4
+    READERS = 4
+    DOMAINS_PER_WRITER = 40
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "custom.list")
+        with open(self.path, "w") as f:
+            f.write("10.0.0.1 seed.lan")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_concurrent_reads_and_writes(self):
+        ph = PiHole(self.path)
+        errors: list[BaseException] = []
+        reads = [0] * self.READERS
+        done = Event()
+
+        def writer(n: int):
+            try:
+                for i in range(self.DOMAINS_PER_WRITER):
+                    domain = f"host-{n}-{i}.lan"
+                    ph.add_rewrite(domain, IPv4Address(f"10.{n}.{i // 256}.{i % 256}"))
+                    if i % 2:
+                        ph.remove_rewrite(domain)
+            except BaseException as e:
+                errors.append(e)
+
+        def reader(n: int):
+            try:
+                while not done.is_set():
+                    assert ph.find_rewrite("seed.lan") is not None
+                    for rewrite in ph.get_rewrites():
+                        str(rewrite)
+                    reads[n] += 1
+            except BaseException as e:
+                errors.append(e)
+
+        readers = [Thread(target=reader, args=(n,)) for n in range(self.READERS)]
+        writers = [Thread(target=writer, args=(n,)) for n in range(self.WRITERS)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(all(reads))
+
+        expected = {"seed.lan"} | {
+            f"host-{n}-{i}.lan"
+            for n in range(self.WRITERS)
+            for i in range(0, self.DOMAINS_PER_WRITER, 2)
+        }
+        self.assertEqual(set(ph.rewrites), expected)
+        self.assertEqual(
+            {rewrite.domain for rewrite in PiHole(self.path).get_rewrites()}, expected
+        )
+
+    def test_snapshot_is_immutable(self):
+        ph = PiHole(self.path)
+        ph.get_rewrites()
+        snapshot = ph.rewrites
+        ph.add_rewrite("new.lan", IPv4Address("10.0.0.2"))
+        self.assertNotIn("new.lan", snapshot)
+        self.assertIn("new.lan", ph.rewrites)
+        with self.assertRaises(TypeError):
+            snapshot["other.lan"] = IPv4Address("10.0.0.3")  # type: ignore
+
+    def test_external_changes_are_picked_up(self):
+        ph = PiHole(self.path)
+        self.assertIsNotNone(ph.find_rewrite("seed.lan"))
+        with open(self.path, "w") as f:
+            f.write("10.0.0.9 external.lan\n")
+        self.assertIsNotNone(ph.find_rewrite("external.lan"))
+        self.assertIsNone(ph.find_rewrite("seed.lan"))
+
+    def test_update_rewrites_in_one_write(self):
+        ph = PiHole(self.path)
+        ph.update_rewrites(
+            [
+                ("a.lan", IPv4Address("10.0.0.2")),
+                ("seed.lan", None),
+                ("a.lan", None),
+                ("b.lan", IPv4Address("10.0.0.3")),
+            ]
+        )
+        self.assertEqual([rewrite.domain for rewrite in ph.get_rewrites()], ["b.lan"])
+
+        with self.assertRaises(ValueError):
+            ph.update_rewrites([("c.lan", IPv4Address("10.0.0.4")), ("x.lan", None)])
+        self.assertIsNone(ph.find_rewrite("c.lan"))
@@ -0,0 +1,181 @@
+from time import sleep
+from unittest.mock import patch
+
+from core_api.cluster import NodeDump
+from core_api.wireguard.reconciler import Reconciler
+from core_api.wireguard.wg_connector import (
+    InterfaceInfo,
+    PeerInfo,
+    SubprocessWG,
+    parse_all_dump,
+)
+from core_api.wireguard.wireguard import Interface, Peer
+
+from tests.wireguard import FakeWG, WireguardTestCase, add_interface, add_peer
+
+# `wg show all dump`, as printed by wg
+ALL_DUMP = """\
+wg0\twg0-private\twg0-public\t51820\toff
+wg0\twg0-public1\twg0-psk1\t203.0.113.7:41414\t10.20.0.2/32\t1700000000\t1024\t2048\t25
+wg0\twg0-public2\tstale-psk\t(none)\t10.20.0.3/32\t0\t0\t0\toff
+wg0\tstranger\t(none)\t(none)\t10.20.0.99/32\t0\t0\t0\toff
+wg9\twg9-private\twg9-public\t51829\t0x1
+"""
+
+
+class DumpWG(FakeWG):
+    def __init__(self) -> None:
+        super().__init__()
+        self.running = {
+            info.name: info for info in parse_all_dump(ALL_DUMP.splitlines(True))
+        }
+        self.diffs: list[tuple[str, list[str], list[str]]] = []
+
+    def get_interfaces_info(self):
+        with patch.object(
+            SubprocessWG, "_show", lambda *args: iter(ALL_DUMP.splitlines(True))
+        ):
+            return list(SubprocessWG.get_interfaces_info())
+
+    def set_peers(self, interface_name: str, peers, remove) -> None:
+        super().set_peers(interface_name, peers, remove)
+        self.diffs.append(
+            (interface_name, [peer.public_key for peer in peers], list(remove))
+        )
+
+
+class TestReconciler(WireguardTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.fake = DumpWG()
+        self.enterContext(patch("core_api.wireguard.wireguard.WG", self.fake))
+
+    def test_reconciles_all_dump(self):
+        wg0 = add_interface("wg0", enabled=True)
+        add_peer(wg0, 1)
+        add_peer(wg0, 2)
+        add_peer(wg0, 3)
+        add_interface("wg1", enabled=True)
+
+        report = Reconciler(self.wg, interval=0).reconcile()
+        self.assertTrue(all(result.ok for result in report.results))
+        self.assertEqual(report.synced, ["wg1"])
+        self.assertEqual(
+            self.fake.diffs,
+            [("wg0", ["wg0-public2", "wg0-public3"], ["stranger"])],
+        )
+        self.assertEqual(
+            (report.peers_added, report.peers_updated, report.peers_removed),
+            (1, 1, 1),
+        )
+        self.assertIn(("up", "wg1"), self.fake.calls)
+        self.assertNotIn(("down", "wg0"), self.fake.calls)
+
+
+class FakeAgent(FakeWG):
+    def __init__(self) -> None:
+        super().__init__()
+        self.configs: list[str] = []
+
+    def write_config(self, interface_name: str, config: str) -> bool:
+        self.configs.append(interface_name)
+        return True
+
+
+class TestDrift(WireguardTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.write_config = self.enterContext(
+            patch.object(self.wg, "write_config", wraps=self.wg.write_config)
+        )
+        self.agent = FakeAgent()
+        dumps = lambda: {
+            "edge1": NodeDump("edge1", list(self.agent.running.values()), None, 0)
+        }
+        self.enterContext(patch.object(self.wg.cluster, "dump_all", dumps))
+        self.enterContext(
+            patch.object(self.wg.cluster, "client", lambda node: self.agent)
+        )
+
+    @staticmethod
+    def running(interface: Interface, peers: list[Peer]) -> InterfaceInfo:
+        info = InterfaceInfo(
+            interface.name, interface.private_key, interface.public_key, 51820, "off"
+        )
+        info.peers.extend(
+            PeerInfo(
+                peer.public_key,
+                peer.preshared_key,
+                "(none)",
+                f"{peer.address}/32",
+                0,
+                0,
+                0,
+                None,
+            )
+            for peer in peers
+        )
+        return info
+
+    def test_writes_configs_only_on_drift(self):
+        local = add_interface("wg0", enabled=True)
+        remote = add_interface("wg1", enabled=True, node="edge1")
+        self.fake.running["wg0"] = self.running(local, [add_peer(local, 1)])
+        self.agent.running["wg1"] = self.running(remote, [add_peer(remote, 1)])
+        reconciler = Reconciler(self.wg, interval=0)
+
+        reconciler.reconcile()
+        self.assertEqual(self.write_config.call_count, 1)
+        self.assertEqual(self.agent.configs, ["wg1"])
+
+        for _ in range(3):
+            report = reconciler.reconcile()
+        self.assertEqual(report.peer_operations, {"wg0": 0, "wg1": 0})
+        self.assertEqual(self.write_config.call_count, 1)
+        self.assertEqual(self.agent.configs, ["wg1"])
+        self.assertEqual([call for call in self.fake.calls if call[0] != "dump"], [])
+
+        add_peer(local, 2)
+        add_peer(remote, 2)
+        report = reconciler.reconcile()
+        self.assertEqual(report.peer_operations, {"wg0": 1, "wg1": 1})
+        self.assertEqual(self.write_config.call_count, 2)
+        self.assertEqual(self.agent.configs, ["wg1", "wg1"])
+
+
+class TestPeriodicReconcile(WireguardTestCase):
+    def wait(self, reconciler: Reconciler, passes: int) -> None:
+        for _ in range(500):
+            if reconciler.metrics.passes >= passes:
+                return
+            sleep(0.01)
+        self.fail(f"Less than {passes} reconcile passes")
+
+    def test_passes_and_metrics(self):
+        wg0 = add_interface("wg0", enabled=True)
+        add_peer(wg0, 1)
+        reconciler = Reconciler(self.wg, interval=0.01)
+        reconciler.start()
+        self.addCleanup(reconciler.stop)
+        self.wait(reconciler, 3)
+        self.assertTrue(reconciler.ready.is_set())
+
+        # The first pass brings wg0 up, the next ones fix its peers
+        metrics = reconciler.metrics.render()
+        self.assertIn("wghub_reconcile_errors_total 0\n", metrics)
+        self.assertIn("wghub_reconcile_interfaces_synced_total 1\n", metrics)
+        self.assertIn('wghub_drift_peers{interface="wg0"} 1\n', metrics)
+        self.assertEqual(self.fake.calls.count(("up", "wg0")), 1)
+
+    def test_failed_pass(self):
+        reconciler = Reconciler(self.wg, interval=0.01)
+        with patch.object(
+            self.wg, "get_interfaces_info", side_effect=RuntimeError("Failed")
+        ):
+            reconciler.start()
+            self.addCleanup(reconciler.stop)
+            self.wait(reconciler, 2)
+        self.assertTrue(reconciler.ready.is_set())
+        self.assertIsNone(reconciler.report)
+        self.assertGreaterEqual(reconciler.metrics.errors, 2)
+        self.assertIn("wghub_reconcile_errors_total", reconciler.metrics.render())
@@ -0,0 +1,171 @@
+import gzip
+import json
+import zlib
+from ipaddress import IPv4Address, IPv4Interface, IPv4Network, IPv6Network
+from unittest import TestCase
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from core_api.responses import ModelResponse, NDJSONResponse, accepts, wants_ndjson
+from core_api.wireguard.wireguard import Interface, Peer
+
+
+class Row(BaseModel):
+    id: int
+    name: str
+
+
+def pages(count: int, size: int):
+    for start in range(0, count, size):
+        yield [
+            Row(id=i, name=f"row-{i}") for i in range(start, min(count, start + size))
+        ]
+
+
+app = FastAPI()
+
+
+@app.get("/rows")
+async def rows(request: Request, count: int = 5):
+    if wants_ndjson(request):
+        return NDJSONResponse(
+            pages(count, 2), Row, gzip=accepts(request, "accept-encoding", "gzip")
+        )
+    return ModelResponse([row for page in pages(count, 2) for row in page], list[Row])
+
+
+class TestResponses(TestCase):
+    def setUp(self) -> None:
+        self.client = TestClient(app)
+
+    def test_json(self):
+        response = self.client.get("/rows")
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertEqual([row["id"] for row in response.json()], [0, 1, 2, 3, 4])
+
+    def test_ndjson(self):
+        response = self.client.get(
+            "/rows",
+            headers={"accept": "application/x-ndjson", "accept-encoding": "identity"},
+        )
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        self.assertNotIn("content-encoding", response.headers)
+        lines = response.content.decode().splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [0, 1, 2, 3, 4])
+
+    def test_ndjson_gzip(self):
+        response = self.client.get(
+            "/rows?count=3",
+            headers={"accept": "application/x-ndjson", "accept-encoding": "gzip"},
+        )
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(len(response.content.splitlines()), 3)
+
+    def test_ndjson_empty(self):
+        response = self.client.get(
+            "/rows?count=0", headers={"accept": "application/x-ndjson"}
+        )
+        self.assertEqual(response.content, b"")
+
+    def test_refused_ndjson(self):
+        response = self.client.get(
+            "/rows", headers={"accept": "application/x-ndjson;q=0, */*"}
+        )
+        self.assertEqual(response.headers["content-type"], "application/json")
+
+    def test_gzip_chunks_are_flushed(self):
+        response = NDJSONResponse(pages(3, 2), Row, gzip=True, exclude={"name"})
+        chunks = list(response._encode(pages(3, 2)))
+        decompressor = zlib.decompressobj(wbits=31)
+        self.assertEqual(decompressor.decompress(chunks[0]), b'{"id":0}\n{"id":1}\n')
+        self.assertEqual(len(gzip.decompress(b"".join(chunks)).splitlines()), 3)
+
+
+INTERFACES = [
+    Interface(
+        id=1,
+        name="wg0",
+        local_ip=IPv4Interface("10.0.0.1/24"),
+        public_hostname="vpn.example.com",
+        port=51820,
+        public_key="public",
+        private_key="private",
+        pre_up="",
+        post_up="iptables -A FORWARD -i %i -j ACCEPT",
+        pre_down="",
+        post_down="",
+        default_dns="1.1.1.1",
+        default_allowed_ips=[IPv4Network("0.0.0.0/0"), IPv6Network("::/0")],
+        default_persistent_keepalive=25,
+        enabled=True,
+    )
+]
+PEERS = [
+    Peer(
+        id=1,
+        interface_id=1,
+        name="laptop",
+        public_key="public",
+        private_key="private",
+        preshared_key="psk",
+        address=IPv4Address("10.0.0.2"),
+        allowed_ips=[IPv4Network("10.0.0.2/32"), IPv6Network("fd00::2/128")],
+        remote_allowed_ips=[IPv4Network("0.0.0.0/0")],
+        remote_dns="1.1.1.1",
+        remote_persistent_keepalive=25,
+        group_name="staff",
+        quota=1 << 40,
+        latest_handshake=1700000000,
+        transfer_rx=1,
+        transfer_tx=2,
+    ),
+    Peer(
+        id=2,
+        interface_id=1,
+        name="phone",
+        public_key="public2",
+        private_key="private2",
+        preshared_key="psk2",
+        address=IPv4Address("10.0.0.3"),
+        allowed_ips=None,
+        remote_allowed_ips=None,
+        remote_dns=None,
+        remote_persistent_keepalive=None,
+        enabled=False,
+    ),
+]
+
+
+@app.get("/default/interfaces", response_model=list[Interface])
+async def default_interfaces():
+    return INTERFACES
+
+
+@app.get("/model/interfaces", response_model=list[Interface])
+async def model_interfaces():
+    return ModelResponse(INTERFACES, list[Interface])
+
+
+@app.get("/default/peers", response_model=list[Peer])
+async def default_peers():
+    return PEERS
+
+
+@app.get("/model/peers", response_model=list[Peer])
+async def model_peers():
+    return ModelResponse(PEERS, list[Peer])
+
+
+class TestModelResponse(TestCase):
+    def test_same_bytes_as_fastapi(self):
+        client = TestClient(app)
+        for listing in ("interfaces", "peers"):
+            with self.subTest(listing):
+                default = client.get(f"/default/{listing}")
+                model = client.get(f"/model/{listing}")
+                self.assertEqual(model.content, default.content)
+                self.assertEqual(
+                    model.headers["content-type"], default.headers["content-type"]
+                )
@@ -0,0 +1,100 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase, enterModuleContext
+
+from core_api.files import FileLock
+from core_api.storages.connector import Table
+from core_api.wireguard.events import EventBus
+from core_api.wireguard.reconciler import Reconciler
+from core_api.wireguard.sampler import StatsSampler
+from core_api.wireguard.shared import Leadership, SharedStats
+
+from tests.events import NOW, FakeWireguard
+from tests.storages import temporary_storage
+
+
+def setUpModule() -> None:
+    enterModuleContext(temporary_storage())
+    Table.create_tables()
+
+
+class TestFileLock(TestCase):
+    def test_excludes_other_holders(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "locks", "wg0.lock")
+            first, second = FileLock(path), FileLock(path)
+            self.assertTrue(first.acquire(blocking=False))
+            self.assertFalse(second.acquire(blocking=False))
+            first.release()
+            with second:
+                self.assertTrue(second.held)
+            self.assertFalse(second.held)
+
+
+def workers(path: str) -> tuple[SharedStats, SharedStats, FakeWireguard]:
+    wg = FakeWireguard()
+    leader = SharedStats(StatsSampler(wg, EventBus()), Reconciler(wg), path)
+    follower = SharedStats(StatsSampler(wg, EventBus()), Reconciler(wg), path)
+    return leader, follower, wg
+
+
+class TestSharedStats(TestCase):
+    def setUp(self) -> None:
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "stats.json")
+        self.leader, self.follower, self.wg = workers(self.path)
+
+    def sample(self) -> None:
+        self.leader.write(self.leader.sampler.sample(NOW))
+
+    def test_follower_serves_the_leader_stats(self):
+        self.assertFalse(self.follower.load())
+        self.wg.peers = {"a": (NOW - 10, 100, 200), "b": (NOW - 1000, 0, 0)}
+        self.sample()
+        self.leader.reconciler.ready.set()
+        self.wg.peers["a"] = (NOW - 5, 150, 200)
+        self.sample()
+
+        self.assertTrue(self.follower.load())
+        self.assertFalse(self.follower.load())
+        leader, follower = self.leader.sampler, self.follower.sampler
+        for since in (0, 1):
+            self.assertEqual(
+                follower.snapshot.changes(since), leader.snapshot.changes(since)
+            )
+        self.assertEqual(follower.presence.online(1, NOW - 60), [("a", NOW - 5)])
+        self.assertEqual(follower.accounting.report, leader.accounting.report)
+        self.assertTrue(self.follower.reconciler.ready.is_set())
+
+    def test_follower_publishes_events(self):
+        published = []
+        self.follower.sampler.bus.publish = published.extend
+        self.wg.peers = {"a": (NOW - 1000, 0, 0)}
+        self.sample()
+        self.follower.load()
+        self.wg.peers["a"] = (NOW - 5, 0, 0)
+        self.sample()
+        self.follower.load()
+        self.assertEqual([event.type for event in published], ["online", "handshake"])
+
+
+class TestLeadership(TestCase):
+    def test_one_leader(self):
+        with TemporaryDirectory() as directory:
+            lock_path = os.path.join(directory, "leader.lock")
+            leader, follower, _ = workers(os.path.join(directory, "stats.json"))
+            started = []
+            first = Leadership(lambda: started.append(1), leader, lock_path, 0.01)
+            second = Leadership(lambda: started.append(2), follower, lock_path, 0.01)
+            first.run()
+            thread = second.start()
+            thread.join(0.05)
+            self.assertEqual((first.leader, second.leader), (True, False))
+            self.assertEqual(leader.sampler.on_sample, leader.write)
+
+            first.stop()
+            thread.join(1)
+            self.assertTrue(second.leader)
+            self.assertEqual(started, [1, 2])
+            second.stop()
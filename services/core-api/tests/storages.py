@@ -0,0 +1,59 @@
+import os
+from contextlib import contextmanager
+from tempfile import TemporaryDirectory
+from typing import Iterator
+from unittest import TestCase
+from unittest.mock import patch
+
+from core_api.storages.connector import Column, Storage, Table
+
+
+@contextmanager
+def temporary_storage() -> Iterator[Storage]:
+    """Tables backed by a database in a temporary directory."""
+    with TemporaryDirectory() as directory:
+        # A storage of its own, the singleton is shared with the other tests
+        storage = object.__new__(Storage)
+        storage.__init__(os.path.join(directory, "wg.db"))
+        with patch.object(Table, "storage", storage):
+            yield storage
+
+
+class TestCreateTables(TestCase):
+    def setUp(self) -> None:
+        self.storage = self.enterContext(temporary_storage())
+        self.enterContext(patch.dict(Table._tables))
+
+    def tables(self) -> set[str]:
+        self.storage.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        return {row[0] for row in self.storage.fetchall()}
+
+    def test_once_per_schema(self):
+        self.assertEqual(self.tables(), set())
+        self.assertTrue(Table.create_tables())
+        self.assertIn("peers", self.tables())
+        self.storage.execute("PRAGMA user_version")
+        self.assertEqual(self.storage.fetchone()[0], Table.schema_version())
+        self.assertFalse(Table.create_tables())
+
+    def test_new_column(self):
+        Table.create_tables()
+
+        class Extra(Table, name="extra", columns=[Column("id", "INTEGER")]):
+            pass
+
+        self.assertTrue(Table.create_tables())
+        Extra.columns = [*Extra.columns, Column("note", "TEXT")]
+        self.assertTrue(Table.create_tables())
+        self.storage.execute("PRAGMA table_info(extra)")
+        self.assertEqual([row[1] for row in self.storage.fetchall()], ["id", "note"])
+
+    def test_rolled_back(self):
+        class Broken(Table, name="broken", columns=[Column("id", "INTEGER")]):
+            @classmethod
+            def _create_table(cls):
+                raise RuntimeError("Failed")
+
+        with self.assertRaises(RuntimeError):
+            Table.create_tables()
+        self.assertEqual(self.tables(), set())
@@ -0,0 +1,157 @@
+import asyncio
+import gzip
+import json
+import zlib
+from ipaddress import IPv4Interface
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from core_api.wireguard import keys, transfer
+from core_api.wireguard.transfer import PeerImporter, iter_line_chunks
+
+
+class FakePeers:
+    def __init__(self) -> None:
+        self.addresses = {"10.0.0.9"}
+        self.keys: set[str] = set()
+        self.added: list = []
+
+    def taken_addresses(self, interface, addresses: list[str]) -> set[str]:
+        return self.addresses & set(addresses)
+
+    def taken_keys(self, keys: list[str]) -> set[str]:
+        return self.keys & set(keys)
+
+    def add_many(self, peers: list) -> None:
+        self.added.extend(peers)
+
+
+class FakeWireguard:
+    def __init__(self) -> None:
+        self.applied = 0
+
+    def apply_peers(self, interface) -> None:
+        pass
+
+    def apply_all(self, apply, interfaces) -> list:
+        self.applied += 1
+        return [None]
+
+
+def row(name: str, address: str, **fields) -> bytes:
+    return json.dumps({"name": name, "address": address, **fields}).encode()
+
+
+async def collect(chunks) -> list[list[bytes]]:
+    return [lines async for lines in chunks]
+
+
+async def stream(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+class TestPeerImporter(TestCase):
+    def setUp(self) -> None:
+        self.peers = FakePeers()
+        patcher = patch.object(transfer, "Peers", self.peers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.wg = FakeWireguard()
+        interface = SimpleNamespace(
+            id=1, name="wg0", local_ip=IPv4Interface("10.0.0.1/24")
+        )
+        self.importer = PeerImporter(self.wg, interface)
+
+    def test_imports_and_reports_rows(self):
+        private_key = keys.genkey()
+        self.peers.keys.add("taken")
+        report = self.importer.import_chunk(
+            [
+                row("a", "10.0.0.2"),
+                b"",
+                row("b", "10.0.0.2"),
+                row("c", "10.0.0.1"),
+                row("d", "10.0.0.9"),
+                row("e", "10.0.0.3", preshared_key="taken"),
+                row("f", "10.0.0.4", public_key="only"),
+                b"{",
+                row("g", "10.0.0.5", private_key=private_key),
+            ]
+        )
+
+        self.assertEqual((report.rows, report.imported), (8, 2))
+        self.assertEqual([error.line for error in report.errors], [3, 4, 5, 6, 7, 8])
+        a, g = self.peers.added
+        self.assertEqual(a.public_key, keys.pubkey(a.private_key))
+        self.assertEqual(g.public_key, keys.pubkey(private_key))
+        self.assertEqual(g.interface_id, 1)
+
+    def test_lines_continue_across_chunks(self):
+        self.importer.import_chunk([row("a", "10.0.0.2")])
+        report = self.importer.import_chunk([row("b", "10.0.0.9")])
+        self.assertEqual(report.errors[0].line, 2)
+
+    def test_applies_once(self):
+        self.assertIsNone(self.importer.finish().apply)
+        self.importer.import_chunk([row("a", "10.0.0.2")])
+        self.importer.import_chunk([row("b", "10.0.0.3")])
+        result = self.importer.finish()
+        self.assertEqual((result.imported, result.chunks), (2, 2))
+        self.assertEqual(self.wg.applied, 1)
+
+
+class TestLineChunks(TestCase):
+    def test_chunks(self):
+        chunks = asyncio.run(
+            collect(iter_line_chunks(stream(b"a\nb", b"\nc\n", b"d"), size=2))
+        )
+        self.assertEqual(chunks, [[b"a", b"b"], [b"c", b"d"]])
+
+    def test_gzip(self):
+        body = gzip.compress(b"a\nb\n")
+        chunks = asyncio.run(
+            collect(iter_line_chunks(stream(body[:5], body[5:]), gzip=True))
+        )
+        self.assertEqual(chunks, [[b"a", b"b"]])
+
+    def test_long_line(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(
+                collect(iter_line_chunks(stream(b"x" * (transfer.MAX_LINE + 1))))
+            )
+
+    def test_gzip_larger_than_a_line(self):
+        lines = [b"%d" % i for i in range(50000)]
+        body = gzip.compress(b"\n".join(lines))
+        chunks = asyncio.run(
+            collect(iter_line_chunks(stream(body), size=20000, gzip=True))
+        )
+        self.assertEqual([len(chunk) for chunk in chunks], [20000, 20000, 10000])
+        self.assertEqual(sum(chunks, []), lines)
+
+    def test_gzip_bomb(self):
+        # 64 MiB of one line compress to about 64 KiB
+        body = gzip.compress(b"x" * (64 << 20), 9)
+        pieces: list[int] = []
+        decompressobj = zlib.decompressobj
+
+        class Decompressor:
+            def __init__(self, wbits: int) -> None:
+                self.decompressor = decompressobj(wbits=wbits)
+
+            def decompress(self, data: bytes, max_length: int) -> bytes:
+                piece = self.decompressor.decompress(data, max_length)
+                pieces.append(len(piece))
+                return piece
+
+            @property
+            def unconsumed_tail(self) -> bytes:
+                return self.decompressor.unconsumed_tail
+
+        with patch.object(zlib, "decompressobj", Decompressor):
+            with self.assertRaises(ValueError):
+                asyncio.run(collect(iter_line_chunks(stream(body), gzip=True)))
+        self.assertLessEqual(max(pieces), transfer.MAX_LINE)
+        self.assertLess(sum(pieces), 4 * transfer.MAX_LINE)
@@ -0,0 +1,76 @@
+import os
+import stat
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from core_api.wireguard.wg_connector import WG, PeerInfo, parse_all_dump
+
+ALL_DUMP = (
+    "wg0\tpriv0\tpub0\t51820\toff\n"
+    "wg0\tpeer1\tpsk1\t1.2.3.4:5555\t10.0.0.2/32\t1700000000\t10\t20\t25\n"
+    "wg0\tpeer2\t(none)\t(none)\t10.0.0.3/32,10.1.0.0/24\t0\t0\t0\toff\n"
+    "wg1\tpriv1\tpub1\t51821\t0xca6c\n"
+    "wg2\tpriv2\tpub2\t51822\toff\n"
+    "wg2\tpeer3\tpsk3\t[fd00::1]:51820\tfd00::2/128\t5\t6\t7\toff\n"
+)
+
+
+class TestParseDump(TestCase):
+    def test_all_dump(self):
+        interfaces = list(parse_all_dump(ALL_DUMP.splitlines(keepends=True)))
+        self.assertEqual([info.name for info in interfaces], ["wg0", "wg1", "wg2"])
+        self.assertEqual([len(info.peers) for info in interfaces], [2, 0, 1])
+
+        wg0 = interfaces[0]
+        self.assertEqual(wg0.private_key, "priv0")
+        self.assertEqual(wg0.listen_port, 51820)
+
+        peer = wg0.peers[0]
+        self.assertEqual(peer.latest_handshake, 1700000000)
+        self.assertEqual(peer.transfer_rx, 10)
+        self.assertEqual(peer.transfer_tx, 20)
+        self.assertEqual(peer.persistent_keepalive, 25)
+        self.assertEqual(peer.endpoint_address, ("1.2.3.4", 5555))
+        self.assertIsNone(wg0.peers[1].persistent_keepalive)
+        self.assertIsNone(wg0.peers[1].endpoint_address)
+        self.assertEqual(interfaces[2].peers[0].endpoint_address, ("fd00::1", 51820))
+
+    def test_empty_dump(self):
+        self.assertEqual(list(parse_all_dump([])), [])
+
+    def test_peer_has_no_dict(self):
+        peer = PeerInfo.from_dump("a\tb\t(none)\t10.0.0.2/32\t0\t0\t0\toff")
+        self.assertFalse(hasattr(peer, "__dict__"))
+
+
+class TestWGShow(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        script = os.path.join(self.tmp.name, "wg")
+        with open(script, "w") as f:
+            f.write(
+                "#!/bin/sh\n"
+                'if [ "$2" = all ]; then\n'
+                f"printf '{ALL_DUMP}'\n"
+                "else\n"
+                f"printf '{ALL_DUMP}' | grep \"^$2\t\" | cut -f2-\n"
+                "fi\n"
+            )
+        os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = f"{self.tmp.name}{os.pathsep}{self.path}"
+
+    def tearDown(self):
+        os.environ["PATH"] = self.path
+        self.tmp.cleanup()
+
+    def test_get_interfaces_info(self):
+        interfaces = WG.get_interfaces_info()
+        first = next(interfaces)
+        self.assertEqual((first.name, len(first.peers)), ("wg0", 2))
+        self.assertEqual([info.name for info in interfaces], ["wg1", "wg2"])
+
+    def test_get_interface_info(self):
+        info = WG.get_interface_info("wg2")
+        self.assertEqual(info.public_key, "pub2")
+        self.assertEqual(info.peers[0].transfer_tx, 7)
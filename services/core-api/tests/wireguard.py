@@ -0,0 +1,292 @@
+import os
+from ipaddress import IPv4Address, IPv4Interface, IPv4Network
+from tempfile import TemporaryDirectory
+from threading import Lock, Thread
+from time import sleep, time
+from unittest import TestCase
+from unittest.mock import patch
+
+from core_api.cluster import Cluster
+from core_api.cluster.agent import Agent
+from core_api.config import Config
+from core_api.storages import AppliedConfigs, Interfaces, Peers
+from core_api.storages.connector import Table
+from core_api.wireguard import wireguard
+from core_api.wireguard.keys import pubkey
+from core_api.wireguard.wg_connector import InterfaceInfo, PeerInfo
+from core_api.wireguard.wireguard import Interface, Peer, Wireguard
+
+from tests.storages import temporary_storage
+
+
+class FakeWG:
+    def __init__(self) -> None:
+        self.running: dict[str, InterfaceInfo] = {}
+        self.calls: list[tuple[str, str]] = []
+
+    def interfaces(self) -> list[str]:
+        return list(self.running)
+
+    def get_interface_info(self, interface_name: str) -> InterfaceInfo:
+        return self.running[interface_name]
+
+    def get_interfaces_info(self) -> list[InterfaceInfo]:
+        self.calls.append(("dump", ""))
+        return list(self.running.values())
+
+    def up(self, interface_name: str) -> None:
+        self.calls.append(("up", interface_name))
+        self.running[interface_name] = InterfaceInfo(
+            interface_name,
+            f"{interface_name}-private",
+            f"{interface_name}-public",
+            51820,
+            "off",
+        )
+
+    def down(self, interface_name: str) -> None:
+        self.calls.append(("down", interface_name))
+        del self.running[interface_name]
+
+    def set_peers(self, interface_name: str, peers, remove) -> None:
+        self.calls.append(("set_peers", interface_name))
+
+
+def add_interface(name: str, enabled: bool = False, node: str = "local") -> Interface:
+    interface = Interface(
+        name=name,
+        local_ip=IPv4Interface("10.20.0.1/24"),
+        public_hostname="localhost",
+        port=51820,
+        public_key=f"{name}-public",
+        private_key=f"{name}-private",
+        pre_up="",
+        post_up="",
+        pre_down="",
+        post_down="",
+        default_dns="1.1.1.1",
+        default_allowed_ips=[IPv4Network("0.0.0.0/0")],
+        default_persistent_keepalive=25,
+        enabled=enabled,
+        node=node,
+    )
+    interface.id = Interfaces.add(interface)
+    return interface
+
+
+def add_peer(interface: Interface, n: int, group: str | None = None) -> Peer:
+    peer = Peer(
+        interface_id=interface.id,
+        name=f"peer{n}",
+        public_key=f"{interface.name}-public{n}",
+        private_key=f"{interface.name}-private{n}",
+        preshared_key=f"{interface.name}-psk{n}",
+        address=IPv4Address("10.20.0.1") + n,
+        allowed_ips=None,
+        remote_allowed_ips=None,
+        remote_dns=None,
+        remote_persistent_keepalive=None,
+        group_name=group,
+    )
+    peer.id = Peers.add(peer)
+    return peer
+
+
+class WireguardTestCase(TestCase):
+    def setUp(self) -> None:
+        self.enterContext(temporary_storage())
+        Table.create_tables()
+        self.config_dir = self.enterContext(TemporaryDirectory())
+        self.enterContext(patch.object(wireguard, "CONFIG_DIR", self.config_dir))
+        self.enterContext(
+            patch.object(
+                Config.Wireguard, "LOCK_DIR", self.enterContext(TemporaryDirectory())
+            )
+        )
+        self.fake = FakeWG()
+        self.enterContext(patch.object(wireguard, "WG", self.fake))
+        self.wg = Wireguard()
+
+
+class TestWriteConfig(WireguardTestCase):
+    def read(self, name: str) -> str:
+        with open(os.path.join(self.config_dir, f"{name}.conf")) as f:
+            return f.read()
+
+    def test_skips_unchanged_config(self):
+        interface = add_interface("wg0")
+        self.assertTrue(self.wg.write_config(interface))
+        config = self.read("wg0")
+        self.assertIn("PrivateKey = wg0-private", config)
+        self.assertFalse(self.wg.write_config(interface))
+
+        add_peer(interface, 1)
+        self.assertTrue(self.wg.write_config(interface))
+        self.assertIn("PublicKey = wg0-public1", self.read("wg0"))
+        self.assertEqual(os.listdir(self.config_dir), ["wg0.conf"])
+
+        os.unlink(os.path.join(self.config_dir, "wg0.conf"))
+        self.assertTrue(self.wg.write_config(interface))
+
+    def test_unchanged_config_is_not_written(self):
+        interface = add_interface("wg0")
+        self.wg.write_config(interface)
+        with patch.object(wireguard, "AtomicFile") as atomic_file:
+            self.assertFalse(self.wg.write_config(interface))
+        atomic_file.assert_not_called()
+
+    def test_sync_skips_unchanged_interface(self):
+        interface = add_interface("wg0", enabled=True)
+        self.wg.sync_interface(interface)
+        self.wg.sync_interface(interface)
+        self.assertEqual(self.fake.calls, [("up", "wg0")])
+        self.wg.sync_interface(interface, restart=True)
+        self.assertEqual(self.fake.calls[1:], [("down", "wg0"), ("up", "wg0")])
+
+    def test_forgets_deleted_and_renamed_interfaces(self):
+        interface = add_interface("wg0")
+        self.wg.write_config(interface)
+        self.wg.delete_interface(interface)
+        self.assertIsNone(AppliedConfigs.get("wg0"))
+
+        interface = add_interface("wg1")
+        self.wg.write_config(interface)
+        self.assertIsNotNone(AppliedConfigs.get("wg1"))
+        self.wg.update_interface(interface.model_copy(update={"name": "wg2"}))
+        self.assertIsNone(AppliedConfigs.get("wg1"))
+        self.assertIsNotNone(AppliedConfigs.get("wg2"))
+
+
+class TestApplyAll(WireguardTestCase):
+    def test_bounded_pool(self):
+        interfaces = [add_interface(f"wg{n}") for n in range(5)]
+        lock, running, most = Lock(), [0], [0]
+
+        def apply(interface: Interface) -> None:
+            with lock:
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+            sleep(0.02)
+            with lock:
+                running[0] -= 1
+            if interface.name == "wg1":
+                raise RuntimeError("Failed")
+
+        with patch.object(Config.Wireguard, "APPLY_WORKERS", 2):
+            results = self.wg.apply_all(apply, interfaces)
+        self.assertEqual(most[0], 2)
+        self.assertEqual(
+            [(result.name, result.ok, result.error) for result in results],
+            [
+                ("wg0", True, None),
+                ("wg1", False, "Failed"),
+                ("wg2", True, None),
+                ("wg3", True, None),
+                ("wg4", True, None),
+            ],
+        )
+
+    def test_up_and_down_all(self):
+        add_interface("wg0")
+        add_interface("wg1")
+        results = self.wg.up_all()
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(sorted(self.fake.running), ["wg0", "wg1"])
+        self.assertTrue(all(interface.enabled for interface in self.wg.interfaces))
+
+        self.wg.down_all([self.wg.get_interface_by_name("wg1")])
+        self.assertEqual(list(self.fake.running), ["wg0"])
+
+    def test_one_failure_does_not_abort_the_others(self):
+        add_interface("wg0", enabled=True)
+        add_interface("wg1", enabled=True)
+        add_interface("wg2", enabled=True)
+        up = self.fake.up
+
+        def fail_wg1(interface_name: str) -> None:
+            if interface_name == "wg1":
+                raise RuntimeError("wg-quick failed")
+            up(interface_name)
+
+        self.fake.up = fail_wg1
+        results = self.wg.sync_all()
+        self.assertEqual(
+            [(result.name, result.ok) for result in results],
+            [("wg0", True), ("wg1", False), ("wg2", True)],
+        )
+        self.assertEqual(results[1].error, "wg-quick failed")
+        self.assertEqual(sorted(self.fake.running), ["wg0", "wg2"])
+
+
+class TestFillAllStats(WireguardTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.remote = FakeWG()
+        agent = Agent(("127.0.0.1", 0), token="secret", wg=self.remote)
+        Thread(target=agent.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(agent.server_close)
+        self.addCleanup(agent.shutdown)
+        self.wg.cluster = Cluster({"edge1": agent.server_address}, token="secret")
+        self.addCleanup(self.wg.cluster.client("edge1").close)
+
+    def test_one_dump_per_node(self):
+        local = add_interface("wg0", enabled=True)
+        remote = add_interface("wg1", enabled=True, node="edge1")
+        add_peer(local, 1)
+        add_peer(remote, 1)
+        add_peer(remote, 2)
+        self.fake.up("wg0")
+        self.remote.up("wg1")
+        self.fake.running["wg0"].peers.append(
+            PeerInfo("wg0-public1", "wg0-psk1", "(none)", "", time(), 1, 2, None)
+        )
+        self.remote.running["wg1"].peers.append(
+            PeerInfo("wg1-public2", "wg1-psk2", "(none)", "", 0, 10, 20, None)
+        )
+
+        stats = self.wg.fill_all_stats()
+        self.assertEqual(self.fake.calls.count(("dump", "")), 1)
+        self.assertEqual(self.remote.calls.count(("dump", "")), 1)
+        self.assertEqual(
+            [
+                (s.name, s.node, s.running, s.peers, s.active_peers, s.transfer_tx)
+                for s in stats.interfaces
+            ],
+            [("wg0", "local", True, 1, 1, 2), ("wg1", "edge1", True, 2, 0, 20)],
+        )
+        self.assertEqual(
+            [(peer.public_key, peer.transfer_tx) for peer in stats.peers],
+            [("wg0-public1", 2), ("wg1-public1", None), ("wg1-public2", 20)],
+        )
+
+
+class TestRotateKeys(WireguardTestCase):
+    def test_rotates_preshared_keys(self):
+        interface = add_interface("wg0", enabled=True)
+        self.wg.sync_interface(interface)
+        first, second = add_peer(interface, 1, "staff"), add_peer(interface, 2)
+
+        manifest = self.wg.rotate_keys(interface, group_name="staff")
+        self.assertEqual([peer.peer_id for peer in manifest.peers], [first.id])
+        rotated, kept = Peers.get_by_interface(interface)
+        self.assertNotEqual(rotated.preshared_key, first.preshared_key)
+        self.assertEqual(rotated.public_key, first.public_key)
+        self.assertEqual(kept.preshared_key, second.preshared_key)
+        config = manifest.peers[0].config
+        self.assertIn(f"PresharedKey = {rotated.preshared_key}", config)
+        # The peer connects to the interface, with its own private key
+        self.assertIn(f"PublicKey = {interface.public_key}", config)
+        self.assertIn(f"PrivateKey = {rotated.private_key}", config)
+        self.assertNotIn(rotated.public_key, config)
+        self.assertEqual(self.fake.calls.count(("set_peers", "wg0")), 1)
+
+    def test_rotates_keypairs(self):
+        interface = add_interface("wg0")
+        peer = add_peer(interface, 1)
+        manifest = self.wg.rotate_keys(interface, peer_ids=[peer.id], keypairs=True)
+        rotated = Peers.get_by_interface(interface)[0]
+        self.assertEqual(rotated.public_key, pubkey(rotated.private_key))
+        self.assertEqual(manifest.peers[0].public_key, rotated.public_key)
+        self.assertNotEqual(rotated.public_key, peer.public_key)
+
+        self.assertEqual(self.wg.rotate_keys(interface, peer_ids=[]).peers, [])